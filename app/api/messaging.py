@@ -1,14 +1,18 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.db import get_db
-from app.core import security
+from app.core.db import get_async_db, get_db
+from app.core import notifier, security
+from app.core.pagination import MAX_PAGE_SIZE, paginate, set_next_cursor
 import model
 from schema import ConversationResponse, MessageCreate, MessageResponse
 from app.core import crypto_util
-from app.core.rate_limiter import rate_limiter
+from app.core.social_graph import follow_each_other
+from app.core.sql import upsert_insert
+from app.core.user_cache import get_user
 
 
 router = APIRouter(
@@ -29,44 +33,20 @@ def get_or_create_conversation(
     current_user=Depends(security.get_current_user),
 ):
     current_user_id = int(current_user.id)
-    # limit new/open conversation attempts
-    rate_limiter.check_rate_limit(
-        identifier=str(current_user_id),
-        endpoint="conversation",
-        limit=30,
-        window_seconds=60,
-    )
     if other_user_id == current_user_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot create conversation with yourself",
         )
 
-    other = db.query(model.user).filter(model.user.id == other_user_id).first()
-    if not other:
+    if get_user(db, other_user_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
 
     # require mutual follow before allowing conversation
-    follows_current_to_other = (
-        db.query(model.Follow)
-        .filter(
-            model.Follow.follower_id == current_user_id,
-            model.Follow.following_id == other_user_id,
-        )
-        .first()
-    )
-    follows_other_to_current = (
-        db.query(model.Follow)
-        .filter(
-            model.Follow.follower_id == other_user_id,
-            model.Follow.following_id == current_user_id,
-        )
-        .first()
-    )
-    if not (follows_current_to_other and follows_other_to_current):
+    if not follow_each_other(db, current_user_id, other_user_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Both users must follow each other to start a conversation",
@@ -74,57 +54,55 @@ def get_or_create_conversation(
 
     user1_id, user2_id = _normalize_user_pair(current_user_id, other_user_id)
 
-    conv = (
-        db.query(model.Conversation)
-        .filter(
-            model.Conversation.user1_id == user1_id,
-            model.Conversation.user2_id == user2_id,
+    # one INSERT for new pairs; an existing (or concurrently created) one is read back
+    conv = db.scalars(
+        upsert_insert(db, model.Conversation)
+        .values(user1_id=user1_id, user2_id=user2_id)
+        .on_conflict_do_nothing(index_elements=["user1_id", "user2_id"])
+        .returning(model.Conversation)
+    ).first()
+    if conv is None:
+        conv = (
+            db.query(model.Conversation)
+            .filter(
+                model.Conversation.user1_id == user1_id,
+                model.Conversation.user2_id == user2_id,
+            )
+            .one()
         )
-        .first()
-    )
-
-    if not conv:
-        conv = model.Conversation(user1_id=user1_id, user2_id=user2_id)
-        db.add(conv)
-        db.commit()
-        db.refresh(conv)
+    db.commit()
 
     return conv
 
 
-@router.get("/", response_model=List[ConversationResponse])
-def list_my_conversations(
-    db: Session = Depends(get_db),
-    current_user=Depends(security.get_current_user),
-    limit: int = 20,
-    offset: int = 0,
-):
-    current_user_id = int(current_user.id)
-
-    conversations = (
-        db.query(model.Conversation)
-        .filter(
-            (model.Conversation.user1_id == current_user_id)
-            | (model.Conversation.user2_id == current_user_id)
-        )
-        .order_by(model.Conversation.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+def _conversation_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+) -> Tuple[List[model.Conversation], Optional[str]]:
+    return paginate(
+        db.query(model.Conversation).filter(
+            (model.Conversation.user1_id == user_id)
+            | (model.Conversation.user2_id == user_id)
+        ),
+        model.Conversation.created_at,
+        model.Conversation.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
     )
-    return conversations
 
 
-@router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
-def list_messages(
+def _message_page(
+    db: Session,
     conversation_id: int,
-    db: Session = Depends(get_db),
-    current_user=Depends(security.get_current_user),
-    limit: int = 50,
-    offset: int = 0,
-):
-    current_user_id = int(current_user.id)
-
+    user_id: int,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+) -> Tuple[List[model.Message], Optional[str]]:
     conv = db.query(model.Conversation).filter(model.Conversation.id == conversation_id).first()
     if not conv:
         raise HTTPException(
@@ -132,21 +110,55 @@ def list_messages(
             detail="Conversation not found",
         )
 
-    if current_user_id not in (conv.user1_id, conv.user2_id):
+    if user_id not in (conv.user1_id, conv.user2_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not a participant in this conversation",
         )
 
-    messages = (
-        db.query(model.Message)
-        .filter(model.Message.conversation_id == conversation_id)
-        .order_by(model.Message.created_at.asc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+    return paginate(
+        db.query(model.Message).filter(model.Message.conversation_id == conversation_id),
+        model.Message.created_at,
+        model.Message.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        descending=False,
     )
 
+
+@router.get("/", response_model=List[ConversationResponse])
+async def list_my_conversations(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(security.get_current_user),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    # sync query helpers run on the async connection, without a threadpool hop
+    conversations, next_cursor = await db.run_sync(
+        _conversation_page, int(current_user.id), limit, offset, cursor
+    )
+    set_next_cursor(response, next_cursor)
+    return conversations
+
+
+@router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
+async def list_messages(
+    conversation_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(security.get_current_user),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    messages, next_cursor = await db.run_sync(
+        _message_page, conversation_id, int(current_user.id), limit, offset, cursor
+    )
+    set_next_cursor(response, next_cursor)
+
     # decrypt content before returning
     result = []
     for m in messages:
@@ -192,17 +204,17 @@ def send_message(
         content=encrypted_content,
     )
     db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
 
-    # notification for the other user
+    # notification for the other user, sent once the message commits
     recipient_id = conv.user1_id if current_user_id == conv.user2_id else conv.user2_id
-    notif = model.Notification(
+    notifier.notify(
+        db,
         user_id=recipient_id,
         type="message",
         message=f"New message in conversation {conversation_id}",
+        actor_id=current_user_id,
+        conversation_id=conversation_id,
     )
-    db.add(notif)
     db.commit()
 
     # return decrypted content in response
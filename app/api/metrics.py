@@ -0,0 +1,31 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from app.core.db_metrics import pool_stats
+
+
+# shared secret that callers of /metrics send as X-Metrics-Token; while unset the endpoints refuse everyone
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None)) -> None:
+    """Let only internal callers (monitoring, operators) read the metrics."""
+    if not METRICS_TOKEN or x_metrics_token is None or not hmac.compare_digest(
+        x_metrics_token.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read metrics")
+
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"], dependencies=[Depends(require_metrics_token)])
+
+
+@router.get("/db_pool")
+def get_db_pool_metrics():
+    # checkout wait times, in-use and overflow counts per connection pool
+    return pool_stats()
+
+
+__all__ = ["METRICS_TOKEN", "require_metrics_token", "router"]
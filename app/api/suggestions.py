@@ -0,0 +1,31 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.core import security
+from app.core.db import get_db
+from app.core.pagination import MAX_PAGE_SIZE
+from app.core.suggestions import get_suggestions
+from schema import SuggestionResponse, UserBasic
+
+
+router = APIRouter(prefix="/suggestions", tags=["Follow"])
+
+
+@router.get("", response_model=List[SuggestionResponse])
+def list_suggestions(
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user=Depends(security.get_current_user),
+):
+    # people followed by the people you follow, ranked by mutual connections;
+    # uses the primary since stale suggestions are recomputed on read
+    rows = get_suggestions(db, int(current_user.id), limit)
+    return [
+        SuggestionResponse(user=UserBasic(id=row.id, email=row.email), mutual_count=row.mutual_count)
+        for row in rows
+    ]
+
+
+__all__ = ["router"]
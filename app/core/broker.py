@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable, Set
+
+from fastapi import HTTPException, status
+
+
+# concurrent notification streams one user may hold open
+NOTIFICATION_STREAM_MAX_CONNECTIONS = int(os.getenv("NOTIFICATION_STREAM_MAX_CONNECTIONS", "3"))
+
+
+class Subscription:
+    """Wake-up signal for one open stream, set from any thread."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until notified or timeout; returns whether a notification arrived."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+def _too_many_streams() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many open notification streams",
+    )
+
+
+class NotificationBroker:
+    """In-process pub/sub telling open streams that their user has new notifications.
+
+    Only user ids are published; streams read the rows themselves, so a
+    missed wake-up costs latency, never data.
+    """
+
+    def __init__(self, max_connections: int = NOTIFICATION_STREAM_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+
+    def check_capacity(self, user_id: int) -> None:
+        """Raise 429 if user_id already holds max_connections streams."""
+        if self.connections(user_id) >= self.max_connections:
+            raise _too_many_streams()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            subscribers = self._subscribers.setdefault(user_id, set())
+            if len(subscribers) >= self.max_connections:
+                raise _too_many_streams()
+            subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            targets = [s for user_id in user_ids for s in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription.notify()
+
+    def connections(self, user_id: int) -> int:
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+
+notification_broker = NotificationBroker()
+
+
+__all__ = [
+    "NOTIFICATION_STREAM_MAX_CONNECTIONS",
+    "NotificationBroker",
+    "Subscription",
+    "notification_broker",
+]
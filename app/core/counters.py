@@ -0,0 +1,118 @@
+"""Reconcile the denormalized Post.likes_count / Post.comments_count and
+user.followers_count columns.
+
+Usage:
+    python -m app.core.counters [--batch-size 500]
+"""
+import argparse
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import model
+
+
+def reconcile_post_counters(db: Session, batch_size: int = 500) -> int:
+    """Recount likes/comments for every post, fixing drifted rows in id batches.
+
+    Each batch is committed on its own so locks are only held on a small range
+    of posts at a time. Returns the number of posts that were corrected.
+    """
+    likes = (
+        select(func.count(model.Like.id))
+        .where(model.Like.post_id == model.Post.id)
+        .scalar_subquery()
+    )
+    comments = (
+        select(func.count(model.Comment.id))
+        .where(model.Comment.post_id == model.Post.id)
+        .scalar_subquery()
+    )
+
+    fixed = 0
+    last_id = 0
+    while True:
+        batch_ids = [
+            post_id
+            for (post_id,) in db.query(model.Post.id)
+            .filter(model.Post.id > last_id)
+            .order_by(model.Post.id.asc())
+            .limit(batch_size)
+        ]
+        if not batch_ids:
+            break
+
+        fixed += (
+            db.query(model.Post)
+            .filter(
+                model.Post.id.between(batch_ids[0], batch_ids[-1]),
+                or_(model.Post.likes_count != likes, model.Post.comments_count != comments),
+            )
+            .update(
+                {model.Post.likes_count: likes, model.Post.comments_count: comments},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        last_id = batch_ids[-1]
+    return fixed
+
+
+def reconcile_follower_counts(db: Session, batch_size: int = 500) -> int:
+    """Recount followers for every user, fixing drifted rows in id batches.
+
+    Committed per batch like reconcile_post_counters. Returns the number of
+    users that were corrected.
+    """
+    followers = (
+        select(func.count(model.Follow.id))
+        .where(model.Follow.following_id == model.user.id)
+        .scalar_subquery()
+    )
+
+    fixed = 0
+    last_id = 0
+    while True:
+        batch_ids = [
+            user_id
+            for (user_id,) in db.query(model.user.id)
+            .filter(model.user.id > last_id)
+            .order_by(model.user.id.asc())
+            .limit(batch_size)
+        ]
+        if not batch_ids:
+            break
+
+        fixed += (
+            db.query(model.user)
+            .filter(
+                model.user.id.between(batch_ids[0], batch_ids[-1]),
+                model.user.followers_count != followers,
+            )
+            .update({model.user.followers_count: followers}, synchronize_session=False)
+        )
+        db.commit()
+        last_id = batch_ids[-1]
+    return fixed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recount post like/comment and follower counters.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        fixed_posts = reconcile_post_counters(db, batch_size=args.batch_size)
+        fixed_users = reconcile_follower_counts(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"reconciled {fixed_posts} post(s) and {fixed_users} user(s)")
+
+
+__all__ = ["reconcile_post_counters", "reconcile_follower_counts"]
+
+
+if __name__ == "__main__":
+    main()
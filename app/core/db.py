@@ -1,3 +1,12 @@
 # Database session and Base re-exported from existing database.py
 
-from database import Base, engine, get_db  # type: ignore
+from database import (  # type: ignore
+    AsyncSessionLocal,
+    Base,
+    SessionLocal,
+    async_engine,
+    engine,
+    get_async_db,
+    get_async_sessionmaker,
+    get_db,
+)
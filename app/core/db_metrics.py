@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+logger = logging.getLogger(__name__)
+
+# checkouts waiting longer than this are logged as slow
+SLOW_CHECKOUT_SECONDS = float(os.getenv("DB_POOL_SLOW_CHECKOUT_MS", "100")) / 1000
+# minimum delay between two saturation warnings for the same pool
+SATURATION_WARNING_INTERVAL_SECONDS = float(os.getenv("DB_POOL_WARNING_INTERVAL_SECONDS", "30"))
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by pool events and timed checkouts."""
+
+    def __init__(self, name: str, pool: Pool):
+        self.name = name
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.slow_checkouts = 0
+        self.checkout_timeouts = 0
+        self.in_use = 0
+        self.in_use_max = 0
+        self.connections_opened = 0
+        self._last_warning = 0.0
+
+    @property
+    def capacity(self) -> int:
+        size = self.pool.size() if hasattr(self.pool, "size") else 0
+        overflow = getattr(self.pool, "_max_overflow", 0)
+        return size + max(overflow, 0)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+            self.checkout_wait_total += seconds
+            self.checkout_wait_max = max(self.checkout_wait_max, seconds)
+            if seconds >= SLOW_CHECKOUT_SECONDS:
+                self.slow_checkouts += 1
+        if timed_out or seconds >= SLOW_CHECKOUT_SECONDS:
+            self._warn(
+                "waited %.1f ms for a connection%s",
+                seconds * 1000,
+                " and timed out" if timed_out else "",
+            )
+
+    def on_checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.in_use_max = max(self.in_use_max, self.in_use)
+            saturated = self.capacity and self.in_use >= self.capacity
+        if saturated:
+            self._warn("all %d connections are checked out", self.capacity)
+
+    def on_checkin(self) -> None:
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_connect(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def _warn(self, msg: str, *args) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_warning < SATURATION_WARNING_INTERVAL_SECONDS:
+                return
+            self._last_warning = now
+        logger.warning("DB pool %r saturated: " + msg, self.name, *args)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            checkouts = self.checkouts
+            return {
+                "pool_size": self.pool.size() if hasattr(self.pool, "size") else 0,
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "in_use_max": self.in_use_max,
+                "overflow": self.pool.overflow() if hasattr(self.pool, "overflow") else 0,
+                "checkouts": checkouts,
+                "checkout_wait_avg_ms": (self.checkout_wait_total / checkouts * 1000) if checkouts else 0.0,
+                "checkout_wait_max_ms": self.checkout_wait_max * 1000,
+                "slow_checkouts": self.slow_checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "connections_opened": self.connections_opened,
+            }
+
+
+class _TimedCheckoutMixin:
+    # the checkout event fires only once a connection has been handed out, so
+    # the time spent waiting for a free slot is measured around Pool.connect()
+    _metrics: "PoolMetrics" = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            # pool_timeout ran out; connection errors from the database are not counted here
+            if self._metrics is not None:
+                self._metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        if self._metrics is not None:
+            self._metrics.record_wait(time.perf_counter() - started)
+        return conn
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool, which keeps the event listeners;
+        # keep reporting into the same metrics
+        new_pool = super().recreate()
+        new_pool._metrics = self._metrics
+        if self._metrics is not None:
+            self._metrics.pool = new_pool
+        return new_pool
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+_registry: Dict[str, PoolMetrics] = {}
+
+
+def instrument_pool(pool: Pool, name: str) -> PoolMetrics:
+    """Attach PoolMetrics to pool through pool events and register it under name."""
+    metrics = PoolMetrics(name, pool)
+    if isinstance(pool, _TimedCheckoutMixin):
+        pool._metrics = metrics
+
+    event.listen(pool, "checkout", lambda *args: metrics.on_checkout())
+    event.listen(pool, "checkin", lambda *args: metrics.on_checkin())
+    event.listen(pool, "connect", lambda *args: metrics.on_connect())
+
+    _registry[name] = metrics
+    return metrics
+
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    """Current metrics of every instrumented pool, keyed by pool name."""
+    return {name: metrics.snapshot() for name, metrics in _registry.items()}
+
+
+__all__ = [
+    "InstrumentedQueuePool",
+    "InstrumentedAsyncQueuePool",
+    "PoolMetrics",
+    "instrument_pool",
+    "pool_stats",
+]
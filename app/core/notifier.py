@@ -0,0 +1,433 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, insert, tuple_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, _env_bool
+from app.core import unread
+from app.core.broker import notification_broker
+from app.core.sql import upsert_insert
+import model
+
+
+logger = logging.getLogger(__name__)
+
+# write notifications inside the request transaction instead of queueing them
+NOTIFICATIONS_SYNC = _env_bool("NOTIFICATIONS_SYNC", False)
+# rows written per multi-row INSERT
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+# a partial batch is written once its oldest event has waited this long
+NOTIFICATION_FLUSH_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_FLUSH_INTERVAL_MS", "200")) / 1000
+# events held in memory at most; beyond this the caller's thread writes them directly
+NOTIFICATION_QUEUE_MAX = int(os.getenv("NOTIFICATION_QUEUE_MAX", "100000"))
+
+# unread notifications of a coalesced type absorb new events for this long after creation
+NOTIFICATION_COALESCE_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_COALESCE_WINDOW_SECONDS", "86400"))
+# actor ids remembered on a coalesced notification, newest first
+NOTIFICATION_RECENT_ACTORS = int(os.getenv("NOTIFICATION_RECENT_ACTORS", "3"))
+
+# message used once a notification stands for more than one actor
+_GROUP_MESSAGES = {
+    "like": "{actor_id} and {others} liked your post (id={post_id})",
+    "comment": "{actor_id} and {others} commented on your post (id={post_id})",
+}
+
+# what a notification event points at, each checked before a queued batch is written
+_TARGETS = (
+    ("user_id", model.user),
+    ("actor_id", model.user),
+    ("post_id", model.Post),
+    ("conversation_id", model.Conversation),
+)
+
+_PENDING_KEY = "pending_notifications"
+_WRITTEN_KEY = "notified_user_ids"
+
+
+def _group_message(event: Dict, actor_ids: List[int], actor_count: int) -> str:
+    if actor_count == 1:
+        return event["message"]
+    others = actor_count - 1
+    return _GROUP_MESSAGES[event["type"]].format(
+        actor_id=actor_ids[0],
+        others=f"{others} other" if others == 1 else f"{others} others",
+        post_id=event["post_id"],
+    )
+
+
+def _merge_actors(new_ids: List[int], old_ids: List[int]) -> List[int]:
+    merged = []
+    for actor_id in list(new_ids) + list(old_ids):
+        if actor_id not in merged:
+            merged.append(actor_id)
+    return merged[:NOTIFICATION_RECENT_ACTORS]
+
+
+def _row(event_: Dict, actor_ids: List[int], actor_count: int, first: Dict = None) -> Dict:
+    first = first or event_
+    return {
+        "user_id": event_["user_id"],
+        "type": event_["type"],
+        "message": _group_message(event_, actor_ids, actor_count),
+        "group_key": event_.get("group_key"),
+        "actor_id": event_.get("actor_id"),
+        "post_id": event_.get("post_id"),
+        "conversation_id": event_.get("conversation_id"),
+        "actor_count": actor_count,
+        "recent_actor_ids": actor_ids,
+        "created_at": first["created_at"],
+        "updated_at": event_["created_at"],
+    }
+
+
+def _record_actors(db: Session, actors: Dict[int, List[Dict]]) -> Counter:
+    """Store the actors of each notification id's events; returns how many were new per id.
+
+    recent_actor_ids only keeps the last few, so notification_actors holds
+    all of them and decides whether an actor has been counted already.
+    """
+    rows = [
+        {"notification_id": notification_id, "actor_id": actor_id}
+        for notification_id, grouped in actors.items()
+        for actor_id in dict.fromkeys(e["actor_id"] for e in grouped)
+    ]
+    if not rows:
+        return Counter()
+    added = db.execute(
+        upsert_insert(db, model.NotificationActor)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["notification_id", "actor_id"])
+        .returning(model.NotificationActor.notification_id)
+    ).scalars()
+    return Counter(added)
+
+
+def _merge_into(existing: model.Notification, grouped: List[Dict], new_actors: int) -> None:
+    """Fold grouped into existing; new_actors of their actors had not been counted on it yet."""
+    latest = grouped[-1]
+    # newest actor first
+    new_actor_ids = _merge_actors([e["actor_id"] for e in reversed(grouped)], [])
+    actor_count = existing.actor_count + new_actors
+    actor_ids = _merge_actors(new_actor_ids, existing.recent_actor_ids)
+    existing.actor_count = actor_count
+    existing.recent_actor_ids = actor_ids
+    existing.message = _group_message(latest, actor_ids, actor_count)
+    existing.actor_id = latest["actor_id"]
+    existing.updated_at = latest["created_at"]
+
+
+def _open_groups(db: Session, keys: List[Tuple[int, str]]) -> Dict[Tuple[int, str], model.Notification]:
+    return {
+        (row.user_id, row.group_key): row
+        for row in db.query(model.Notification)
+        .filter(
+            tuple_(model.Notification.user_id, model.Notification.group_key).in_(keys),
+            model.Notification.is_read == False,
+        )
+        .order_by(model.Notification.id)
+        .with_for_update()
+    }
+
+
+def write_notifications(db: Session, events: List[Dict]) -> None:
+    """Insert notification events, merging likes/comments into open groups.
+
+    Events of one group are first combined in memory, then folded into the
+    recipient's unread row for the same group_key (uq_notifications_open_group
+    allows one), whose actor_count counts each actor once across all merges.
+    An open row created more than NOTIFICATION_COALESCE_WINDOW_SECONDS
+    ago is closed instead, by clearing its group_key, and a new group starts.
+    Everything else is written with multi-row INSERTs. Does not commit.
+    """
+    rows = []
+    groups: Dict[Tuple[int, str], List[Dict]] = {}
+    for event_ in events:
+        if event_.get("group_key") is None:
+            rows.append(_row(event_, [], 1))
+        else:
+            groups.setdefault((event_["user_id"], event_["group_key"]), []).append(event_)
+
+    inserted = Counter()
+    if rows:
+        # one INSERT ... VALUES (...), (...) statement for all ungrouped rows
+        db.execute(insert(model.Notification).values(rows))
+        inserted.update(row["user_id"] for row in rows)
+
+    if groups:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=NOTIFICATION_COALESCE_WINDOW_SECONDS)
+        open_rows = _open_groups(db, list(groups))
+        new_groups, merges, closed = {}, {}, []
+        for key, grouped in groups.items():
+            existing = open_rows.get(key)
+            if existing is not None and _as_utc(existing.created_at) < cutoff:
+                existing.group_key = None
+                closed.append(existing.id)
+                existing = None
+            if existing is not None:
+                merges[existing.id] = (existing, grouped)
+                continue
+            new_actor_ids = _merge_actors([e["actor_id"] for e in reversed(grouped)], [])
+            actor_count = len(set(e["actor_id"] for e in grouped))
+            new_groups[key] = _row(grouped[-1], new_actor_ids, actor_count, first=grouped[0])
+        if closed:
+            # a closed group never merges again, so its actor set is not needed
+            db.query(model.NotificationActor).filter(
+                model.NotificationActor.notification_id.in_(closed)
+            ).delete(synchronize_session=False)
+        db.flush()
+
+        if new_groups:
+            # a concurrent writer may open the same group first; those events
+            # are merged into its row below instead of failing the batch
+            created = db.execute(
+                upsert_insert(db, model.Notification)
+                .values(list(new_groups.values()))
+                .on_conflict_do_nothing(
+                    index_elements=["user_id", "group_key"],
+                    index_where=model.Notification.is_read == False,
+                )
+                .returning(
+                    model.Notification.id, model.Notification.user_id, model.Notification.group_key
+                )
+            ).all()
+            inserted.update(user_id for _, user_id, _ in created)
+            _record_actors(db, {row_id: groups[(user_id, group_key)] for row_id, user_id, group_key in created})
+            created_keys = {(user_id, group_key) for _, user_id, group_key in created}
+            lost = [key for key in new_groups if key not in created_keys]
+            if lost:
+                for key, existing in _open_groups(db, lost).items():
+                    merges[existing.id] = (existing, groups[key])
+
+        if merges:
+            new_actors = _record_actors(db, {row_id: grouped for row_id, (_, grouped) in merges.items()})
+            for row_id, (existing, grouped) in merges.items():
+                _merge_into(existing, grouped, new_actors[row_id])
+
+    # merged events reuse an unread row, so only inserted rows add to the badge
+    for user_id, new_rows in inserted.items():
+        unread.record_change(db, user_id, new_rows)
+    db.flush()
+    # open streams of these users are woken up once the transaction commits
+    db.info.setdefault(_WRITTEN_KEY, set()).update(e["user_id"] for e in events)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without their timezone
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _drop_orphaned(db: Session, events: List[Dict]) -> List[Dict]:
+    """events minus those whose recipient, actor, post or conversation is gone.
+
+    Queued events wait for a flush; a target deleted in the meantime would
+    fail the batch's foreign keys, and its notifications cascade away anyway.
+    """
+    wanted: Dict = {}
+    for key, table in _TARGETS:
+        wanted.setdefault(table, set()).update(e[key] for e in events if e.get(key) is not None)
+    existing = {
+        table: {row_id for (row_id,) in db.query(table.id).filter(table.id.in_(ids))} if ids else set()
+        for table, ids in wanted.items()
+    }
+    return [
+        e
+        for e in events
+        if all(e.get(key) is None or e[key] in existing[table] for key, table in _TARGETS)
+    ]
+
+
+class NotificationWriter:
+    """Background thread that writes queued notifications in multi-row INSERTs.
+
+    A batch is flushed when it reaches batch_size rows or when its oldest
+    event is flush_interval seconds old, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        flush_interval: float = NOTIFICATION_FLUSH_INTERVAL_SECONDS,
+        max_queued: int = NOTIFICATION_QUEUE_MAX,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.written = 0
+        self.failed = 0
+
+    def enqueue(self, rows: List[Dict]) -> None:
+        self._ensure_started()
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                logger.warning("notification queue full, writing %d row(s) synchronously", len(rows) - i)
+                self._write(rows[i:])
+                return
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="notification-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _take_batch(self, first: Dict) -> List[Dict]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                # short waits so stop() is noticed without waiting out the interval
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._write(self._take_batch(first))
+        # stop() was called: write whatever is still queued
+        self._write_queued()
+
+    def _write_queued(self) -> None:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(rows), self.batch_size):
+            self._write(rows[start : start + self.batch_size])
+
+    def _write(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        # one retry covers transient errors (deadlock, failover); a batch that
+        # fails again likely holds a bad row, so write its rows one at a time
+        # and lose only the rows that fail on their own
+        if self._try_write(rows) or self._try_write(rows):
+            return
+        if len(rows) == 1:
+            self._drop(rows[0])
+            return
+        for row in rows:
+            if not self._try_write([row]):
+                self._drop(row)
+
+    def _try_write(self, rows: List[Dict]) -> bool:
+        db = SessionLocal()
+        try:
+            rows = _drop_orphaned(db, rows)
+            if rows:
+                write_notifications(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.warning("failed to write %d notification(s)", len(rows), exc_info=True)
+            return False
+        finally:
+            db.close()
+        self.written += len(rows)
+        return True
+
+    def _drop(self, row: Dict) -> None:
+        self.failed += 1
+        logger.error("dropped %s notification for user %s", row.get("type"), row.get("user_id"))
+
+    def flush(self) -> None:
+        """Write everything queued so far from the calling thread."""
+        self._write_queued()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drain the queue and stop the worker; called on application shutdown."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self._write_queued()
+
+
+notification_writer = NotificationWriter()
+atexit.register(notification_writer.stop)
+
+
+def notify(
+    db: Session,
+    user_id: int,
+    type: str,
+    message: str,
+    actor_id: Optional[int] = None,
+    post_id: Optional[int] = None,
+    conversation_id: Optional[int] = None,
+) -> None:
+    """Record a notification as part of db's current transaction.
+
+    The event is handed to the background writer once the transaction commits
+    and dropped if it rolls back. With NOTIFICATIONS_SYNC it is written in the
+    same transaction instead. Likes and comments with an actor_id and post_id
+    are coalesced per post (see write_notifications).
+    """
+    event_ = {
+        "user_id": user_id,
+        "type": type,
+        "message": message,
+        "actor_id": actor_id,
+        "post_id": post_id,
+        "conversation_id": conversation_id,
+        "group_key": (
+            f"{type}:{post_id}"
+            if type in _GROUP_MESSAGES and actor_id is not None and post_id is not None
+            else None
+        ),
+        # stamped now so a late flush keeps the event's position in the list
+        "created_at": datetime.now(timezone.utc),
+    }
+    if NOTIFICATIONS_SYNC:
+        write_notifications(db, [event_])
+        return
+    db.info.setdefault(_PENDING_KEY, []).append(event_)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _enqueue_committed(session) -> None:
+    rows = session.info.pop(_PENDING_KEY, None)
+    if rows:
+        notification_writer.enqueue(rows)
+    user_ids = session.info.pop(_WRITTEN_KEY, None)
+    if user_ids:
+        notification_broker.publish(user_ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_WRITTEN_KEY, None)
+
+
+__all__ = [
+    "NOTIFICATIONS_SYNC",
+    "NotificationWriter",
+    "notification_writer",
+    "notify",
+    "write_notifications",
+]
@@ -0,0 +1,100 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+
+
+# response header carrying the opaque cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# largest page a list endpoint accepts through its limit parameter
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode a (created_at, id) keyset position as an opaque URL-safe string."""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor. Raises 400 if it is malformed."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def keyset_filter(query, created_col, id_col, position: Tuple[datetime, int], descending: bool = True):
+    """Restrict query to rows strictly after position in (created_col, id_col) order."""
+    row = tuple_(created_col, id_col)
+    bound = tuple_(*position)
+    return query.filter(row < bound if descending else row > bound)
+
+
+def paginate(
+    query,
+    created_col,
+    id_col,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+    key: Optional[Callable[[Any], Tuple[datetime, int]]] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """Fetch one page of query ordered by (created_col, id_col).
+
+    With a cursor the page starts right after the encoded position (keyset
+    pagination), otherwise limit/offset is used for backwards compatibility.
+    Returns the rows and the cursor of the next page, or None on the last page.
+
+    key: maps a result row to its (created_at, id); defaults to reading the
+    attributes named like created_col/id_col.
+    """
+    if limit <= 0:
+        return [], None
+    if cursor is not None:
+        query = keyset_filter(query, created_col, id_col, decode_cursor(cursor), descending)
+        offset = 0
+
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    # fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).offset(offset).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    if key is None:
+        last = rows[-1]
+        created_at, row_id = getattr(last, created_col.key), getattr(last, id_col.key)
+    else:
+        created_at, row_id = key(rows[-1])
+    return rows, encode_cursor(created_at, row_id)
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+__all__ = [
+    "NEXT_CURSOR_HEADER",
+    "MAX_PAGE_SIZE",
+    "encode_cursor",
+    "decode_cursor",
+    "keyset_filter",
+    "paginate",
+    "set_next_cursor",
+]
@@ -0,0 +1,182 @@
+"""Rate limits applied by route before a request reaches FastAPI.
+
+Every policy in RATE_LIMIT_POLICIES names a route (method and path template,
+as declared on the router) and the buckets it draws from: one per user, one
+per client IP, or both. The middleware runs before routing, so a rejected
+request never has its body read, its dependencies resolved or a database
+session opened.
+"""
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import _env_bool
+from app.core import rate_limiter, security
+from app.core.rate_limiter import RateLimitResult
+
+
+# take the client IP from the first X-Forwarded-For entry; only enable behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED_FOR = _env_bool("RATE_LIMIT_TRUST_FORWARDED_FOR", False)
+# multiplies every limit in the table, e.g. 0.5 to halve them all
+RATE_LIMIT_SCALE = float(os.getenv("RATE_LIMIT_SCALE", "1"))
+
+
+class RateLimitPolicy(NamedTuple):
+    # bucket name, shared by every route that uses it
+    name: str
+    # HTTP method, or "*" for any
+    method: str
+    # route path template such as "/posts/{post_id}/like", or "*" for any path
+    path: str
+    limit: int
+    window_seconds: float
+    # "user" (anonymous requests fall back to their IP) and/or "ip"
+    keys: Tuple[str, ...]
+
+
+# every policy matching a request applies; the login limit per username stays in
+# login() itself, since the username is only known once the form body is parsed
+RATE_LIMIT_POLICIES: List[RateLimitPolicy] = [
+    RateLimitPolicy("login_ip", "POST", "/login", 100, 60, ("ip",)),
+    RateLimitPolicy("create_user", "POST", "/create_user", 100, 3600, ("ip",)),
+    RateLimitPolicy("create_post", "POST", "/posts/", 30, 60, ("user",)),
+    RateLimitPolicy("update_post", "PUT", "/posts/{id}", 60, 60, ("user",)),
+    RateLimitPolicy("create_comment", "POST", "/posts/{post_id}/comments", 60, 60, ("user",)),
+    RateLimitPolicy("toggle_like", "POST", "/posts/{post_id}/like", 120, 60, ("user",)),
+    RateLimitPolicy("toggle_follow", "POST", "/follow/{user_id}", 60, 60, ("user",)),
+    RateLimitPolicy("conversation", "POST", "/conversations/{other_user_id}", 30, 60, ("user",)),
+    RateLimitPolicy("send_message", "POST", "/conversations/{conversation_id}/messages", 60, 60, ("user", "ip")),
+    RateLimitPolicy("any_ip", "*", "*", 3000, 60, ("ip",)),
+]
+
+_PARAM = re.compile(r"\{[^/]+?\}")
+
+
+def _path_pattern(path: str) -> re.Pattern:
+    if path == "*":
+        return re.compile(r".*")
+    # "{param}" matches one path segment; a trailing slash is optional
+    literals = _PARAM.split(path.rstrip("/"))
+    return re.compile("^" + "[^/]+".join(re.escape(part) for part in literals) + "/?$")
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing RATE_LIMIT_POLICIES.
+
+    Allowed responses carry X-RateLimit-Limit, X-RateLimit-Remaining and
+    X-RateLimit-Reset for the bucket closest to running out; rejected
+    requests get a 429 with the same headers plus Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp, policies: Optional[List[RateLimitPolicy]] = None, limiter=None):
+        self.app = app
+        self._limiter = limiter
+        self._routes: Dict[str, List[Tuple[re.Pattern, RateLimitPolicy]]] = {}
+        for policy in RATE_LIMIT_POLICIES if policies is None else policies:
+            self._routes.setdefault(policy.method, []).append((_path_pattern(policy.path), policy))
+
+    @property
+    def limiter(self):
+        # looked up on every call so the shared limiter can be swapped (e.g. in tests)
+        return self._limiter if self._limiter is not None else rate_limiter.limiter
+
+    def _policies(self, method: str, path: str) -> List[RateLimitPolicy]:
+        candidates = self._routes.get(method, []) + self._routes.get("*", [])
+        return [policy for pattern, policy in candidates if pattern.match(path)]
+
+    @staticmethod
+    def _client_ip(scope: Scope, headers: Headers) -> str:
+        if RATE_LIMIT_TRUST_FORWARDED_FOR and "x-forwarded-for" in headers:
+            return headers["x-forwarded-for"].split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    def _user_id(headers: Headers) -> Optional[int]:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        return security.token_user_id(token)
+
+    def _take(
+        self, policies: List[RateLimitPolicy], user: str, ip: str
+    ) -> Tuple[bool, Tuple[int, RateLimitResult]]:
+        """Hit every bucket of policies; returns whether all allowed and the (limit, result) to report.
+
+        A rejection gives back the tokens already taken from the other
+        buckets, so a call that never runs costs nothing against them.
+        """
+        limiter = self.limiter
+        taken: List[Tuple[str, RateLimitPolicy, int]] = []
+        tightest = None
+        for policy in policies:
+            limit = max(1, int(policy.limit * RATE_LIMIT_SCALE))
+            # dict.fromkeys: an anonymous request keyed on both draws from its IP bucket once
+            for identifier in dict.fromkeys(user if kind == "user" else ip for kind in policy.keys):
+                result = limiter.hit(identifier, policy.name, limit, policy.window_seconds)
+                if not result.allowed:
+                    for taken_identifier, taken_policy, taken_limit in taken:
+                        limiter.refund(taken_identifier, taken_policy.name, taken_limit, taken_policy.window_seconds)
+                    return False, (limit, result)
+                taken.append((identifier, policy, limit))
+                if tightest is None or result.remaining < tightest[1].remaining:
+                    tightest = (limit, result)
+        return True, tightest
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        policies = self._policies(scope["method"], scope["path"])
+        if not policies:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        ip = f"ip:{self._client_ip(scope, headers)}"
+        user_id = self._user_id(headers) if any("user" in p.keys for p in policies) else None
+        user = f"user:{user_id}" if user_id is not None else ip
+
+        if getattr(self.limiter.backend, "blocking", False):
+            allowed, tightest = await run_in_threadpool(self._take, policies, user, ip)
+        else:
+            allowed, tightest = self._take(policies, user, ip)
+        if not allowed:
+            limit, result = tightest
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded. Please try again later."},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(result.retry_after)), **_headers(limit, result)},
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                for name, value in _headers(*tightest).items():
+                    response_headers.append(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def _headers(limit: int, result: RateLimitResult) -> Dict[str, str]:
+    return {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(result.remaining),
+        "X-RateLimit-Reset": str(math.ceil(result.reset_after)),
+    }
+
+
+__all__ = [
+    "RATE_LIMIT_POLICIES",
+    "RateLimitPolicy",
+    "RateLimitMiddleware",
+]
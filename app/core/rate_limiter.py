@@ -1,49 +1,483 @@
+import heapq
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
 import time
-from collections import defaultdict, deque
-from typing import Deque, Dict, Tuple
+from array import array
+from contextlib import contextmanager
+from hashlib import blake2b
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 from fastapi import HTTPException, status
+from sqlalchemy import case
+from sqlalchemy.orm import Session
 
+from database import SessionLocal
+from app.core.sql import upsert_insert
+import model
 
-# key: (identifier, endpoint), value: deque of timestamps (seconds)
-_requests: Dict[Tuple[str, str], Deque[float]] = defaultdict(deque)
 
+# where bucket state lives: "memory" (this process), "shm" (all workers on this
+# host, through a shared file mapping) or "sql" (every node, in the rate_limits table)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# keys (identifier, endpoint pairs) tracked at most; beyond this the least limited are dropped
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# how often idle keys are swept out by the background thread
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+# file mapped by the shm backend and its number of 16-byte slots; every worker must agree on both
+RATE_LIMIT_SHM_PATH = os.getenv(
+    "RATE_LIMIT_SHM_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "fastapi-rate-limits"),
+)
+RATE_LIMIT_SHM_SLOTS = int(os.getenv("RATE_LIMIT_SHM_SLOTS", "131072"))
+# independent locks the buckets are split over by key hash (the shm layout depends on it too)
+RATE_LIMIT_LOCK_STRIPES = int(os.getenv("RATE_LIMIT_LOCK_STRIPES", "16"))
 
-def check_rate_limit(identifier: str, endpoint: str, limit: int, window_seconds: int) -> None:
-    """Simple in-memory sliding-window rate limit.
+# slack for float rounding when comparing bucket times
+_EPSILON = 1e-6
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    # calls still allowed right now after this one
+    remaining: int
+    # seconds until the next call would be allowed (0 when allowed)
+    retry_after: float
+    # seconds until the bucket is full again
+    reset_after: float
+
+
+def _take(full_at: Optional[float], now: float, interval: float, window_seconds: float) -> Tuple[bool, float]:
+    """Decide one call against a bucket that is full again at full_at (None: never seen).
+
+    Returns whether it is allowed and the bucket's full_at afterwards.
+    """
+    start = now if full_at is None or full_at < now else full_at
+    # the bucket holds window_seconds / interval tokens, so it may run at most
+    # window_seconds behind
+    if start + interval - window_seconds > now + _EPSILON:
+        return False, full_at
+    return True, start + interval
+
+
+class _MemoryStripe:
+    """One lock's share of the memory backend: a key -> slot dict over a flat array of doubles."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._full_at = array("d")
+        self._free: List[int] = []
+
+    def take(self, key: str, interval: float, window_seconds: float, now: float) -> Tuple[bool, float]:
+        with self.lock:
+            slot = self._slots.get(key)
+            allowed, full_at = _take(
+                self._full_at[slot] if slot is not None else None, now, interval, window_seconds
+            )
+            if allowed:
+                if slot is None:
+                    slot = self._allocate(key, now)
+                self._full_at[slot] = full_at
+            return allowed, full_at
+
+    def refund(self, key: str, interval: float) -> None:
+        with self.lock:
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._full_at[slot] -= interval
+
+    def _allocate(self, key: str, now: float) -> int:
+        if len(self._slots) >= self.max_keys:
+            self._evict(now)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._full_at)
+            self._full_at.append(0.0)
+        self._slots[key] = slot
+        return slot
+
+    def _release(self, key: str) -> None:
+        self._free.append(self._slots.pop(key))
+
+    def _evict(self, now: float) -> None:
+        """Make room for new keys; the caller holds the lock."""
+        self._drop_refilled(now)
+        overflow = len(self._slots) - self.max_keys
+        if overflow < 0:
+            return
+        # still full of active keys: drop a tenth of them, those closest to a full
+        # bucket first, since forgetting them gives away the fewest extra calls
+        count = overflow + max(1, self.max_keys // 10)
+        for key, _ in heapq.nsmallest(count, self._slots.items(), key=lambda item: self._full_at[item[1]]):
+            self._release(key)
+
+    def _drop_refilled(self, now: float) -> int:
+        refilled = [key for key, slot in self._slots.items() if self._full_at[slot] <= now]
+        for key in refilled:
+            self._release(key)
+        return len(refilled)
+
+    def sweep(self, now: float) -> int:
+        with self.lock:
+            return self._drop_refilled(now)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._slots.clear()
+            self._full_at = array("d")
+            self._free.clear()
+
+
+class MemoryBackend:
+    """Buckets of this process, split over lock stripes by key hash.
+
+    Requests run on the threadpool, so many threads take tokens at once;
+    each key is only ever touched under its own stripe's lock, and threads
+    working on different stripes never wait for each other.
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, stripes: int = RATE_LIMIT_LOCK_STRIPES):
+        self.max_keys = max_keys
+        self._stripes = [_MemoryStripe(max(1, max_keys // stripes)) for _ in range(stripes)]
+
+    def _stripe(self, key: str) -> _MemoryStripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def take(self, key: str, interval: float, window_seconds: float, now: float) -> Tuple[bool, float]:
+        return self._stripe(key).take(key, interval, window_seconds, now)
+
+    def refund(self, key: str, interval: float) -> None:
+        self._stripe(key).refund(key, interval)
+
+    def sweep(self, now: float) -> int:
+        # one stripe at a time, so a sweep only ever blocks a slice of the keys
+        return sum(stripe.sweep(now) for stripe in self._stripes)
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def clear(self) -> None:
+        for stripe in self._stripes:
+            stripe.clear()
+
+
+# one slot: 64-bit key hash (0 = empty) and the bucket's full_at
+_SHM_SLOT = struct.Struct("<Qd")
+# slots probed per key; a key lives in the first free one of these
+_SHM_PROBES = 16
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+class SharedMemoryBackend:
+    """Buckets shared by every process on the host through an mmap'd file.
+
+    The file is a fixed open-addressing table split into lock stripes; a
+    key hashes to one stripe and is probed only within it, so each call
+    holds a thread lock and an fcntl record lock on that stripe alone
+    (fcntl locks do not exclude threads of the same process). The key
+    count is capped by the file size and a slot whose bucket has refilled
+    is simply reused.
+    """
+
+    # lockf waits for other processes holding the stripe; async callers should run it in a thread
+    blocking = True
+
+    def __init__(
+        self,
+        path: str = RATE_LIMIT_SHM_PATH,
+        slots: int = RATE_LIMIT_SHM_SLOTS,
+        stripes: int = RATE_LIMIT_LOCK_STRIPES,
+    ):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.stripe_slots = max(_SHM_PROBES, slots // stripes)
+        self.stripes = stripes
+        size = self.stripe_slots * stripes * _SHM_SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            # a new file reads as zeros, i.e. all slots empty
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def _locked(self, stripe: int):
+        length = self.stripe_slots * _SHM_SLOT.size
+        with self._locks[stripe]:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, length, stripe * length)
+            try:
+                yield stripe * self.stripe_slots
+            finally:
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, length, stripe * length)
+
+    def take(self, key: str, interval: float, window_seconds: float, now: float) -> Tuple[bool, float]:
+        key_hash = _key_hash(key)
+        first = (key_hash // self.stripes) % self.stripe_slots
+        with self._locked(key_hash % self.stripes) as base:
+            stored, target, victim, victim_full_at = None, None, None, None
+            for probe in range(_SHM_PROBES):
+                slot = base + (first + probe) % self.stripe_slots
+                slot_hash, full_at = _SHM_SLOT.unpack_from(self._map, slot * _SHM_SLOT.size)
+                if slot_hash == key_hash:
+                    stored, target = full_at, slot
+                    break
+                if target is None and (slot_hash == 0 or full_at <= now):
+                    target = slot
+                if victim is None or full_at < victim_full_at:
+                    victim, victim_full_at = slot, full_at
+            allowed, full_at = _take(stored, now, interval, window_seconds)
+            if allowed:
+                # no free slot left in this key's run: take over the least limited one
+                slot = target if target is not None else victim
+                _SHM_SLOT.pack_into(self._map, slot * _SHM_SLOT.size, key_hash, full_at)
+            return allowed, full_at
+
+    def refund(self, key: str, interval: float) -> None:
+        key_hash = _key_hash(key)
+        first = (key_hash // self.stripes) % self.stripe_slots
+        with self._locked(key_hash % self.stripes) as base:
+            for probe in range(_SHM_PROBES):
+                slot = base + (first + probe) % self.stripe_slots
+                slot_hash, full_at = _SHM_SLOT.unpack_from(self._map, slot * _SHM_SLOT.size)
+                if slot_hash == key_hash:
+                    _SHM_SLOT.pack_into(self._map, slot * _SHM_SLOT.size, key_hash, full_at - interval)
+                    return
+
+    def _stripe_slots(self, base: int):
+        start, end = base * _SHM_SLOT.size, (base + self.stripe_slots) * _SHM_SLOT.size
+        return enumerate(_SHM_SLOT.iter_unpack(self._map[start:end]), base)
+
+    def sweep(self, now: float) -> int:
+        dropped = 0
+        for stripe in range(self.stripes):
+            with self._locked(stripe) as base:
+                for slot, (slot_hash, full_at) in self._stripe_slots(base):
+                    if slot_hash and full_at <= now:
+                        _SHM_SLOT.pack_into(self._map, slot * _SHM_SLOT.size, 0, 0.0)
+                        dropped += 1
+        return dropped
+
+    def __len__(self) -> int:
+        count = 0
+        for stripe in range(self.stripes):
+            with self._locked(stripe) as base:
+                count += sum(1 for _, (slot_hash, _) in self._stripe_slots(base) if slot_hash)
+        return count
+
+    def clear(self) -> None:
+        size = self.stripe_slots * _SHM_SLOT.size
+        for stripe in range(self.stripes):
+            with self._locked(stripe) as base:
+                self._map[base * _SHM_SLOT.size : base * _SHM_SLOT.size + size] = bytes(size)
+
+
+class SqlBackend:
+    """Buckets in the rate_limits table, decided by one atomic upsert per call."""
+
+    # each call is a database round trip; async callers should run it in a thread
+    blocking = True
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+
+    def take(self, key: str, interval: float, window_seconds: float, now: float) -> Tuple[bool, float]:
+        table = model.RateLimit.__table__
+        db = self.session_factory()
+        try:
+            # same decision as _take, evaluated by the database against the locked row
+            start = case((table.c.full_at > now, table.c.full_at), else_=now)
+            fits = start + interval - window_seconds <= now + _EPSILON
+            stmt = upsert_insert(db, table).values(key=key, full_at=now + interval, allowed=True)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={
+                    "allowed": fits,
+                    "full_at": case((fits, start + interval), else_=table.c.full_at),
+                },
+            ).returning(table.c.allowed, table.c.full_at)
+            allowed, full_at = db.execute(stmt).one()
+            db.commit()
+        finally:
+            db.close()
+        return bool(allowed), full_at
+
+    def refund(self, key: str, interval: float) -> None:
+        db = self.session_factory()
+        try:
+            db.query(model.RateLimit).filter(model.RateLimit.key == key).update(
+                {model.RateLimit.full_at: model.RateLimit.full_at - interval}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def sweep(self, now: float) -> int:
+        db = self.session_factory()
+        try:
+            dropped = (
+                db.query(model.RateLimit)
+                .filter(model.RateLimit.full_at <= now)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        return dropped
+
+    def __len__(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(model.RateLimit).count()
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        db = self.session_factory()
+        try:
+            db.query(model.RateLimit).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+_BACKENDS = {
+    "memory": MemoryBackend,
+    "shm": SharedMemoryBackend,
+    "sql": SqlBackend,
+}
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND):
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown RATE_LIMIT_BACKEND {name!r}, expected one of {sorted(_BACKENDS)}")
+
+
+class TokenBucketLimiter:
+    """Token buckets of limit tokens refilled over window seconds, one float per key.
+
+    Each bucket is stored as the time at which it will be full again (the
+    GCRA form of a token bucket) in a pluggable backend. A key whose bucket
+    is full behaves exactly like a key that was never seen, so idle keys can
+    be dropped at any time without changing any decision.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        sweep_interval: float = RATE_LIMIT_SWEEP_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stopping = threading.Event()
+
+    def hit(self, identifier: str, endpoint: str, limit: int, window_seconds: float) -> RateLimitResult:
+        """Take one token from the (identifier, endpoint) bucket if there is one."""
+        self._ensure_sweeper()
+        interval = window_seconds / limit
+        now = self.clock()
+        allowed, full_at = self.backend.take(f"{endpoint}:{identifier}", interval, window_seconds, now)
+        if not allowed:
+            return RateLimitResult(False, 0, full_at + interval - window_seconds - now, full_at - now)
+        remaining = int((now + window_seconds - full_at) / interval + _EPSILON)
+        return RateLimitResult(True, remaining, 0.0, full_at - now)
+
+    def refund(self, identifier: str, endpoint: str, limit: int, window_seconds: float) -> None:
+        """Give back the token an allowed hit() took, e.g. when another limit rejected the call."""
+        self.backend.refund(f"{endpoint}:{identifier}", window_seconds / limit)
+
+    def sweep(self) -> int:
+        """Drop every key whose bucket has refilled; returns how many were dropped."""
+        return self.backend.sweep(self.clock())
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is not None or self.sweep_interval <= 0:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._stopping.clear()
+                self._sweeper = threading.Thread(target=self._run_sweeper, name="rate-limit-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _run_sweeper(self) -> None:
+        while not self._stopping.wait(self.sweep_interval):
+            self.sweep()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._sweeper = None
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+limiter = TokenBucketLimiter(make_backend())
+
+
+def check_rate_limit(identifier: str, endpoint: str, limit: int, window_seconds: int) -> RateLimitResult:
+    """Allow at most limit calls per window_seconds for identifier at endpoint.
 
     identifier: usually user id or email/username or IP.
     endpoint: a short name for where this is used (e.g. "login", "create_post").
-    limit: maximum number of calls allowed in the time window.
+    limit: maximum number of calls allowed in a burst, refilled over the window.
     window_seconds: window length in seconds.
-    """
-    now = time.time()
-    key = (identifier, endpoint)
-    dq = _requests[key]
-
-    # drop old timestamps outside the window
-    cutoff = now - window_seconds
-    while dq and dq[0] < cutoff:
-        dq.popleft()
 
-    if len(dq) >= limit:
+    Raises 429 with a Retry-After header once the limit is used up.
+    """
+    result = limiter.hit(identifier, endpoint, limit, window_seconds)
+    if not result.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Rate limit exceeded. Please try again later.",
+            headers={"Retry-After": str(math.ceil(result.retry_after))},
         )
-
-    dq.append(now)
+    return result
 
 
 class _RateLimiterModule:
     """Backwards-compatible facade exposing check_rate_limit as rate_limiter.check_rate_limit"""
 
     @staticmethod
-    def check_rate_limit(identifier: str, endpoint: str, limit: int, window_seconds: int) -> None:
+    def check_rate_limit(identifier: str, endpoint: str, limit: int, window_seconds: int) -> RateLimitResult:
         return check_rate_limit(identifier, endpoint, limit, window_seconds)
 
 
 rate_limiter = _RateLimiterModule()
 
 
-__all__ = ["check_rate_limit", "rate_limiter"]
+__all__ = [
+    "RATE_LIMIT_BACKEND",
+    "RATE_LIMIT_MAX_KEYS",
+    "RateLimitResult",
+    "MemoryBackend",
+    "SharedMemoryBackend",
+    "SqlBackend",
+    "make_backend",
+    "TokenBucketLimiter",
+    "limiter",
+    "check_rate_limit",
+    "rate_limiter",
+]
@@ -0,0 +1,120 @@
+import itertools
+import math
+import os
+import time
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from database import (
+    AsyncSessionLocal,
+    DATABASE_REPLICA_URLS,
+    POOL_SETTINGS,
+    SessionLocal,
+    _to_async_url,
+    async_engine,
+    engine,
+)
+from app.core.db_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_pool
+
+
+# after a client commits, its reads go to the primary for this long (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+# cookie carrying the time of the client's last commit, so every worker sees it
+LAST_WRITE_COOKIE = "db_last_write"
+
+
+class ReplicaRouter:
+    """Round-robin read routing across replicas; sticky reads go to the primary."""
+
+    def __init__(
+        self,
+        primary: Engine,
+        primary_async: Optional[AsyncEngine],
+        replica_urls: List[str],
+    ):
+        self.primary = primary
+        self.primary_async = primary_async
+        self.replicas: List[Engine] = []
+        self.async_replicas: List[AsyncEngine] = []
+        for i, url in enumerate(replica_urls):
+            replica = create_engine(url, poolclass=InstrumentedQueuePool, **POOL_SETTINGS)
+            instrument_pool(replica.pool, f"replica{i}")
+            self.replicas.append(replica)
+            if primary_async is not None:
+                async_replica = create_async_engine(
+                    _to_async_url(url), poolclass=InstrumentedAsyncQueuePool, **POOL_SETTINGS
+                )
+                instrument_pool(async_replica.sync_engine.pool, f"replica{i}_async")
+                self.async_replicas.append(async_replica)
+
+        self._next = itertools.count()
+
+    def _pick_index(self, sticky: bool, count: int) -> Optional[int]:
+        if not count or sticky:
+            return None
+        return next(self._next) % count
+
+    def read_engine(self, sticky: bool = False) -> Engine:
+        index = self._pick_index(sticky, len(self.replicas))
+        return self.primary if index is None else self.replicas[index]
+
+    def read_async_engine(self, sticky: bool = False) -> AsyncEngine:
+        index = self._pick_index(sticky, len(self.async_replicas))
+        return self.primary_async if index is None else self.async_replicas[index]
+
+
+replica_router = ReplicaRouter(engine, async_engine, DATABASE_REPLICA_URLS)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_writer(session) -> None:
+    # sessions from get_db carry the response; commits only happen on writes
+    response = session.info.pop("response", None)
+    if response is not None:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            f"{time.time():.3f}",
+            max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+            samesite="lax",
+        )
+
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the client committed within READ_YOUR_WRITES_SECONDS, on any worker."""
+    try:
+        written_at = float(request.cookies[LAST_WRITE_COOKIE])
+    except (KeyError, ValueError):
+        return False
+    return 0 <= time.time() - written_at < READ_YOUR_WRITES_SECONDS
+
+
+def get_read_db(request: Request):
+    """Session for read-only handlers: a replica, or the primary right after a write."""
+    db = SessionLocal(bind=replica_router.read_engine(wrote_recently(request)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    """Async variant of get_read_db for the async read endpoints."""
+    bind = replica_router.read_async_engine(wrote_recently(request))
+    async with AsyncSessionLocal(bind=bind) as db:
+        yield db
+
+
+__all__ = [
+    "READ_YOUR_WRITES_SECONDS",
+    "LAST_WRITE_COOKIE",
+    "ReplicaRouter",
+    "replica_router",
+    "wrote_recently",
+    "get_read_db",
+    "get_async_read_db",
+]
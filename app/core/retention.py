@@ -0,0 +1,265 @@
+"""Delete old notifications and read messages according to the retention policy.
+
+Also trims home timelines that fan-out has grown past their cap.
+
+Rows are removed in small batches, each committed on its own with a pause in
+between, so no long locks are held on the hot tables. Only one run at a time
+goes ahead across all workers and hosts (a PostgreSQL advisory lock).
+
+Usage:
+    python -m app.core.retention [--batch-size 1000] [--pause-ms 50]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from app.core import timeline
+from app.core.unread import unread_counter
+import model
+
+
+logger = logging.getLogger(__name__)
+
+# read notifications not updated for this many days are deleted (0 disables)
+NOTIFICATION_RETENTION_READ_DAYS = float(os.getenv("NOTIFICATION_RETENTION_READ_DAYS", "30"))
+# newest notifications kept per user, read or not (0 disables)
+NOTIFICATION_RETENTION_MAX_PER_USER = int(os.getenv("NOTIFICATION_RETENTION_MAX_PER_USER", "1000"))
+# read messages older than this many days are deleted (0, the default, keeps them forever)
+MESSAGE_RETENTION_READ_DAYS = float(os.getenv("MESSAGE_RETENTION_READ_DAYS", "0"))
+# rows examined / deleted per transaction and the pause between transactions
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_MS", "50")) / 1000
+# how often the in-process job runs (0 disables it; use the CLI from cron instead)
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+
+# PostgreSQL advisory lock key held while a run is in progress
+_ADVISORY_LOCK_KEY = 0x726574656E74  # "retent"
+
+
+def _delete_expired(
+    db: Session,
+    entity,
+    expired,
+    age_column,
+    batch_size: int,
+    pause: float,
+) -> int:
+    """Delete rows of entity matching expired, oldest first, in batches.
+
+    Candidates are read through the partial index on age_column, so each
+    batch touches only expired rows rather than walking the whole table.
+    """
+    deleted = 0
+    while True:
+        batch_ids = [
+            row_id
+            for (row_id,) in db.query(entity.id)
+            .filter(expired)
+            .order_by(age_column.asc())
+            .limit(batch_size)
+        ]
+        if not batch_ids:
+            break
+        deleted += (
+            db.query(entity)
+            .filter(entity.id.in_(batch_ids))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        if len(batch_ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def _delete_over_cap(db: Session, max_per_user: int, batch_size: int, pause: float) -> int:
+    """Delete each user's notifications beyond the newest max_per_user."""
+    user_ids: List[int] = [
+        user_id
+        for (user_id,) in db.query(model.Notification.user_id)
+        .group_by(model.Notification.user_id)
+        .having(func.count(model.Notification.id) > max_per_user)
+    ]
+    deleted = 0
+    for user_id in user_ids:
+        while True:
+            # skips the rows to keep via the (user_id, updated_at, id) index
+            batch_ids = [
+                row_id
+                for (row_id,) in db.query(model.Notification.id)
+                .filter(model.Notification.user_id == user_id)
+                .order_by(model.Notification.updated_at.desc(), model.Notification.id.desc())
+                .offset(max_per_user)
+                .limit(batch_size)
+            ]
+            if not batch_ids:
+                break
+            deleted += (
+                db.query(model.Notification)
+                .filter(model.Notification.id.in_(batch_ids))
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            if pause:
+                time.sleep(pause)
+        # unread rows may have gone too; reload the badge from the database
+        unread_counter.invalidate(user_id)
+    return deleted
+
+
+def enforce_retention(
+    db: Session,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+) -> Dict[str, float]:
+    """Apply every enabled retention rule and report rows removed and time taken."""
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    report: Dict[str, float] = {
+        "notifications_read_expired": 0,
+        "notifications_over_cap": 0,
+        "messages_read_expired": 0,
+        "timeline_overflow": 0,
+    }
+
+    if NOTIFICATION_RETENTION_READ_DAYS > 0:
+        cutoff = now - timedelta(days=NOTIFICATION_RETENTION_READ_DAYS)
+        report["notifications_read_expired"] = _delete_expired(
+            db,
+            model.Notification,
+            (model.Notification.is_read == True) & (model.Notification.updated_at < cutoff),
+            model.Notification.updated_at,
+            batch_size,
+            pause,
+        )
+    if NOTIFICATION_RETENTION_MAX_PER_USER > 0:
+        report["notifications_over_cap"] = _delete_over_cap(
+            db, NOTIFICATION_RETENTION_MAX_PER_USER, batch_size, pause
+        )
+    if MESSAGE_RETENTION_READ_DAYS > 0:
+        cutoff = now - timedelta(days=MESSAGE_RETENTION_READ_DAYS)
+        report["messages_read_expired"] = _delete_expired(
+            db,
+            model.Message,
+            (model.Message.is_read == True) & (model.Message.created_at < cutoff),
+            model.Message.created_at,
+            batch_size,
+            pause,
+        )
+
+    # fan-out lets timelines overshoot TIMELINE_MAX_LENGTH; cut them back here
+    report["timeline_overflow"] = timeline.trim_timelines(db, batch_size)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("retention: %s", report)
+    return report
+
+
+@contextmanager
+def _advisory_lock(bind: Engine) -> Iterator[bool]:
+    """Try to take the retention lock; yields whether this process holds it.
+
+    Held on a dedicated autocommit connection for the whole run. Databases
+    without advisory locks (SQLite) always yield True.
+    """
+    if bind.dialect.name != "postgresql":
+        yield True
+        return
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = conn.execute(select(func.pg_try_advisory_lock(_ADVISORY_LOCK_KEY))).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(select(func.pg_advisory_unlock(_ADVISORY_LOCK_KEY)))
+
+
+def run_retention(db: Session, **kwargs) -> Optional[Dict[str, float]]:
+    """enforce_retention, unless a run is already in progress on any worker or host.
+
+    The in-process job starts in every worker, so all but one skip each
+    round. Returns None when skipped.
+    """
+    with _advisory_lock(db.get_bind()) as acquired:
+        if not acquired:
+            logger.info("retention: another run is in progress, skipped")
+            return None
+        return enforce_retention(db, **kwargs)
+
+
+class RetentionJob:
+    """Runs enforce_retention every interval seconds on a daemon thread."""
+
+    def __init__(self, interval: float = RETENTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_report: Dict[str, float] = {}
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            db = SessionLocal()
+            try:
+                self.last_report = run_retention(db) or self.last_report
+            except Exception:
+                db.rollback()
+                logger.exception("retention run failed")
+            finally:
+                db.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+retention_job = RetentionJob()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delete expired notifications and read messages.")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=float, default=RETENTION_BATCH_PAUSE_SECONDS * 1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = run_retention(db, batch_size=args.batch_size, pause=args.pause_ms / 1000)
+    finally:
+        db.close()
+    if report is None:
+        print("another retention run is in progress, skipped")
+        return
+    removed = ", ".join(f"{name}={count}" for name, count in report.items() if name != "seconds")
+    print(f"removed {removed} in {report['seconds']:.3f}s")
+
+
+__all__ = [
+    "NOTIFICATION_RETENTION_READ_DAYS",
+    "NOTIFICATION_RETENTION_MAX_PER_USER",
+    "MESSAGE_RETENTION_READ_DAYS",
+    "enforce_retention",
+    "run_retention",
+    "RetentionJob",
+    "retention_job",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security.oauth2 import OAuth2PasswordBearer
@@ -16,6 +21,51 @@ SECRET_KEY = os.getenv(
 )
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# verified tokens remembered (least recently used are evicted), each until its exp
+JWT_VERIFIED_CACHE_SIZE = int(os.getenv("JWT_VERIFIED_CACHE_SIZE", "10000"))
+
+
+class VerifiedTokenCache:
+    """LRU of tokens whose signature was already checked, keyed by SHA-256 of the token.
+
+    Only the digest is kept, never the token itself, and an entry is
+    dropped once the token's exp has passed, so a cache hit is exactly as
+    valid as re-verifying.
+    """
+
+    def __init__(self, max_tokens: int = JWT_VERIFIED_CACHE_SIZE):
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[str]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._tokens[key]
+                return None
+            self._tokens.move_to_end(key)
+            return entry[0]
+
+    def put(self, token: str, user_id: str, expires_at: float) -> None:
+        with self._lock:
+            self._tokens[self._key(token)] = (user_id, expires_at)
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+
+verified_tokens = VerifiedTokenCache()
 
 
 def create_access_token(data: dict):
@@ -26,19 +76,39 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def verify_access_token(token: str, credentials_exception):
+def _verified_user_id(token: str) -> Optional[str]:
+    """user_id of a valid, unexpired token, or None; signatures are checked once per token."""
+    user_id = verified_tokens.get(token)
+    if user_id is not None:
+        return user_id
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        id: str = payload.get("user_id")
-        if id is None:
-            raise credentials_exception
-        token_data = TokenData(id=str(id))
     except JWTError:
+        return None
+    if payload.get("user_id") is None:
+        return None
+    user_id = str(payload["user_id"])
+    # tokens without an exp are verified every time rather than cached forever
+    if payload.get("exp") is not None:
+        verified_tokens.put(token, user_id, float(payload["exp"]))
+    return user_id
+
+
+def verify_access_token(token: str, credentials_exception):
+    user_id = _verified_user_id(token)
+    if user_id is None:
         raise credentials_exception
-    return token_data
+    return TokenData(id=user_id)
+
+
+def token_user_id(token: str) -> Optional[int]:
+    """user_id of a valid, unexpired token, or None."""
+    user_id = _verified_user_id(token)
+    return int(user_id) if user_id is not None else None
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # async so that verifying the token does not take a threadpool worker
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -51,6 +121,9 @@ __all__ = [
     "hash_password",
     "verify_password",
     "create_access_token",
+    "VerifiedTokenCache",
+    "verified_tokens",
     "verify_access_token",
+    "token_user_id",
     "get_current_user",
 ]
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+import model
+
+
+# users whose following list is kept in memory; least recently used lists are evicted
+SOCIAL_GRAPH_MAX_USERS = int(os.getenv("SOCIAL_GRAPH_MAX_USERS", "100000"))
+# cached lists are reloaded after this long so other workers' follow changes show up
+SOCIAL_GRAPH_TTL_SECONDS = float(os.getenv("SOCIAL_GRAPH_TTL_SECONDS", "300"))
+
+
+def _contains(ids: array, value: int) -> bool:
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+class SocialGraph:
+    """Per-process cache of who each user follows, as sorted int arrays.
+
+    Lists are loaded lazily from the follows table and kept up to date by
+    add_follow/remove_follow, which toggle_follow calls after committing.
+    """
+
+    def __init__(self, max_users: int = SOCIAL_GRAPH_MAX_USERS, ttl: float = SOCIAL_GRAPH_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._following: "OrderedDict[int, Tuple[array, float]]" = OrderedDict()
+
+    def _cached(self, user_id: int):
+        with self._lock:
+            entry = self._following.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] >= self.ttl:
+                del self._following[user_id]
+                return None
+            self._following.move_to_end(user_id)
+            return entry[0]
+
+    def _store(self, user_id: int, ids: array) -> None:
+        with self._lock:
+            self._following[user_id] = (ids, time.monotonic())
+            self._following.move_to_end(user_id)
+            while len(self._following) > self.max_users:
+                self._following.popitem(last=False)
+
+    def following_ids(self, db: Session, user_id: int) -> array:
+        """Sorted ids of the users user_id follows. Treat the result as read-only."""
+        ids = self._cached(user_id)
+        if ids is None:
+            ids = array(
+                "q",
+                (
+                    following_id
+                    for (following_id,) in db.query(model.Follow.following_id)
+                    .filter(model.Follow.follower_id == user_id)
+                    .order_by(model.Follow.following_id)
+                ),
+            )
+            self._store(user_id, ids)
+        return ids
+
+    def follows(self, db: Session, follower_id: int, followee_id: int) -> bool:
+        return _contains(self.following_ids(db, follower_id), followee_id)
+
+    def is_mutual(self, db: Session, a: int, b: int) -> bool:
+        return self.follows(db, a, b) and self.follows(db, b, a)
+
+    def add_follow(self, follower_id: int, followee_id: int) -> None:
+        with self._lock:
+            entry = self._following.get(follower_id)
+            if entry is None:
+                return
+            old = entry[0]
+            i = bisect_left(old, followee_id)
+            if i < len(old) and old[i] == followee_id:
+                return
+            # copy-on-write so readers holding the old array never see it change
+            ids = old[:i]
+            ids.append(followee_id)
+            ids.extend(old[i:])
+            self._following[follower_id] = (ids, entry[1])
+
+    def remove_follow(self, follower_id: int, followee_id: int) -> None:
+        with self._lock:
+            entry = self._following.get(follower_id)
+            if entry is None:
+                return
+            old = entry[0]
+            i = bisect_left(old, followee_id)
+            if i == len(old) or old[i] != followee_id:
+                return
+            ids = old[:i]
+            ids.extend(old[i + 1 :])
+            self._following[follower_id] = (ids, entry[1])
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._following.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._following.clear()
+
+    def __len__(self) -> int:
+        return len(self._following)
+
+
+social_graph = SocialGraph()
+
+
+def follow_each_other(db: Session, a: int, b: int) -> bool:
+    """Mutual-follow check read from the follows table, for authorization.
+
+    The cached graph can lag a follow change on another worker by up to
+    SOCIAL_GRAPH_TTL_SECONDS, so it only serves feeds and suggestions.
+    """
+    matching = (
+        db.query(func.count(model.Follow.id))
+        .filter(
+            or_(
+                and_(model.Follow.follower_id == a, model.Follow.following_id == b),
+                and_(model.Follow.follower_id == b, model.Follow.following_id == a),
+            )
+        )
+        .scalar()
+    )
+    # (follower_id, following_id) is unique, so both directions give exactly 2
+    return matching == 2
+
+
+__all__ = [
+    "SOCIAL_GRAPH_MAX_USERS",
+    "SOCIAL_GRAPH_TTL_SECONDS",
+    "SocialGraph",
+    "social_graph",
+    "follow_each_other",
+]
@@ -0,0 +1,21 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+# dialects whose INSERT supports ON CONFLICT and RETURNING
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def upsert_insert(db: Session, table):
+    """INSERT construct for db's dialect, with on_conflict_do_nothing / on_conflict_do_update."""
+    dialect = db.get_bind().dialect.name
+    try:
+        return _INSERTS[dialect](table)
+    except KeyError:
+        raise NotImplementedError(f"INSERT ... ON CONFLICT is not supported on {dialect!r}")
+
+
+__all__ = ["upsert_insert"]
@@ -0,0 +1,316 @@
+"""Friend-of-friend suggestions ranked by mutual connections.
+
+A candidate for user U is anyone followed by someone U follows; its score is
+the number of such paths. The batch job counts these in memory, one chunk of
+users at a time, against a sparse row-per-user adjacency of the follow graph.
+
+Usage:
+    python -m app.core.suggestions [--batch-size 1000]
+"""
+import argparse
+import heapq
+import os
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import TIMESTAMP, Integer, and_, delete, exists, func, literal, select, update
+from sqlalchemy.orm import Session, aliased
+
+from database import SessionLocal
+from app.core.sql import upsert_insert
+import model
+
+
+# suggestions stored per user
+SUGGESTIONS_PER_USER = int(os.getenv("SUGGESTIONS_PER_USER", "50"))
+# stored suggestions older than this are recomputed when the user asks for them
+SUGGESTIONS_TTL_SECONDS = float(os.getenv("SUGGESTIONS_TTL_SECONDS", "86400"))
+# users scored and written per transaction by the batch job
+SUGGESTIONS_BATCH_SIZE = int(os.getenv("SUGGESTIONS_BATCH_SIZE", "1000"))
+
+
+Adjacency = Dict[int, array]
+
+
+def load_adjacency(db: Session) -> Adjacency:
+    """Read the follow graph as follower_id -> sorted array of followee ids."""
+    adjacency: Adjacency = {}
+    current_id, current = None, None
+    rows = (
+        db.query(model.Follow.follower_id, model.Follow.following_id)
+        .order_by(model.Follow.follower_id, model.Follow.following_id)
+        .yield_per(10000)
+    )
+    for follower_id, following_id in rows:
+        if follower_id != current_id:
+            current_id, current = follower_id, array("q")
+            adjacency[follower_id] = current
+        current.append(following_id)
+    return adjacency
+
+
+def rank_candidates(adjacency: Adjacency, user_id: int, limit: int) -> List[Tuple[int, int]]:
+    """Top (candidate_id, mutual_count) pairs for user_id, best first."""
+    following = adjacency.get(user_id, ())
+    counts: Counter = Counter()
+    for followee_id in following:
+        counts.update(adjacency.get(followee_id, ()))
+    counts.pop(user_id, None)
+    for followee_id in following:
+        counts.pop(followee_id, None)
+    # ties go to the lower user id so results are stable between runs
+    return heapq.nlargest(limit, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _chunks(values: List[int], size: int) -> Iterable[List[int]]:
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _replace(db: Session, ranked: Dict[int, List[Tuple[int, int]]], computed_at: datetime) -> None:
+    db.execute(delete(model.Suggestion).where(model.Suggestion.user_id.in_(list(ranked))))
+    rows = [
+        {
+            "user_id": user_id,
+            "suggested_id": candidate_id,
+            "mutual_count": mutual_count,
+            "computed_at": computed_at,
+        }
+        for user_id, candidates in ranked.items()
+        for candidate_id, mutual_count in candidates
+    ]
+    if rows:
+        # apply_follow_change may insert one of these pairs concurrently
+        stmt = upsert_insert(db, model.Suggestion)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "suggested_id"],
+                set_={
+                    "mutual_count": stmt.excluded.mutual_count,
+                    "computed_at": stmt.excluded.computed_at,
+                },
+            ),
+            rows,
+        )
+    # marks users with no candidates as computed too, so reads do not recompute them
+    db.execute(
+        update(model.user)
+        .where(model.user.id.in_(list(ranked)))
+        .values(suggestions_computed_at=computed_at)
+    )
+
+
+def compute_all(db: Session, batch_size: int = SUGGESTIONS_BATCH_SIZE) -> int:
+    """Recompute stored suggestions for every user who follows someone.
+
+    The graph is loaded once; each chunk of users is scored and written in its
+    own transaction. Returns the number of users processed.
+    """
+    adjacency = load_adjacency(db)
+    user_ids = sorted(adjacency)
+    for batch in _chunks(user_ids, batch_size):
+        computed_at = datetime.now(timezone.utc)
+        ranked = {
+            user_id: rank_candidates(adjacency, user_id, SUGGESTIONS_PER_USER) for user_id in batch
+        }
+        _replace(db, ranked, computed_at)
+        db.commit()
+    return len(user_ids)
+
+
+def refresh_user(db: Session, user_id: int) -> None:
+    """Recompute one user's suggestions in SQL. Does not commit."""
+    hop1 = aliased(model.Follow)
+    hop2 = aliased(model.Follow)
+    already_following = select(model.Follow.following_id).where(model.Follow.follower_id == user_id)
+    mutual_count = func.count(hop2.id)
+    candidates = (
+        db.query(hop2.following_id, mutual_count)
+        .select_from(hop1)
+        .join(hop2, hop2.follower_id == hop1.following_id)
+        .filter(
+            hop1.follower_id == user_id,
+            hop2.following_id != user_id,
+            hop2.following_id.notin_(already_following),
+        )
+        .group_by(hop2.following_id)
+        .order_by(mutual_count.desc(), hop2.following_id.asc())
+        .limit(SUGGESTIONS_PER_USER)
+        .all()
+    )
+    _replace(db, {user_id: [tuple(row) for row in candidates]}, datetime.now(timezone.utc))
+
+
+def apply_follow_change(follower_id: int, followee_id: int, followed: bool) -> None:
+    """Update stored suggestions after follower_id followed or unfollowed followee_id.
+
+    The follower's own list is recomputed. For everyone who follows the
+    follower, followee_id gains or loses one mutual connection, which is
+    applied as a delta instead of a full recompute; a stored list that lacks
+    followee_id gets it with its full count, or is marked stale if it is
+    already full. Runs as a background task.
+    """
+    db = SessionLocal()
+    try:
+        refresh_user(db, follower_id)
+
+        followers_of_follower = select(model.Follow.follower_id).where(
+            model.Follow.following_id == follower_id
+        )
+        delta = 1 if followed else -1
+        (
+            db.query(model.Suggestion)
+            .filter(
+                model.Suggestion.suggested_id == followee_id,
+                model.Suggestion.user_id.in_(followers_of_follower),
+            )
+            .update(
+                {model.Suggestion.mutual_count: model.Suggestion.mutual_count + delta},
+                synchronize_session=False,
+            )
+        )
+
+        if followed:
+            follower = aliased(model.Follow)
+            # users never computed get a full computation on their next read
+            has_suggestions = exists().where(
+                and_(
+                    model.user.id == follower.follower_id,
+                    model.user.suggestions_computed_at.isnot(None),
+                )
+            )
+            already_suggested = exists().where(
+                and_(
+                    model.Suggestion.user_id == follower.follower_id,
+                    model.Suggestion.suggested_id == followee_id,
+                )
+            )
+            already_following = exists().where(
+                and_(
+                    model.Follow.follower_id == follower.follower_id,
+                    model.Follow.following_id == followee_id,
+                )
+            )
+            missing = and_(
+                follower.following_id == follower_id,
+                follower.follower_id != followee_id,
+                has_suggestions,
+                ~already_suggested,
+                ~already_following,
+            )
+            stored = (
+                select(func.count(model.Suggestion.suggested_id))
+                .where(model.Suggestion.user_id == follower.follower_id)
+                .scalar_subquery()
+            )
+            # a full list may have left followee_id out below its cutoff, and adding
+            # it would grow the list past SUGGESTIONS_PER_USER: recompute on next read
+            db.execute(
+                update(model.user)
+                .where(
+                    model.user.id.in_(
+                        select(follower.follower_id).where(missing, stored >= SUGGESTIONS_PER_USER)
+                    )
+                )
+                .values(suggestions_computed_at=None)
+            )
+            # the rest get followee_id with its true count: how many of the people
+            # they follow (this follower among them) now follow it
+            hop1 = aliased(model.Follow)
+            hop2 = aliased(model.Follow)
+            mutual_count = (
+                select(func.count(hop2.id))
+                .select_from(hop1)
+                .join(hop2, hop2.follower_id == hop1.following_id)
+                .where(hop1.follower_id == follower.follower_id, hop2.following_id == followee_id)
+                .scalar_subquery()
+            )
+            db.execute(
+                upsert_insert(db, model.Suggestion)
+                .from_select(
+                    ["user_id", "suggested_id", "mutual_count", "computed_at"],
+                    select(
+                        follower.follower_id,
+                        literal(followee_id, Integer),
+                        mutual_count,
+                        literal(datetime.now(timezone.utc), TIMESTAMP(timezone=True)),
+                    ).where(missing, stored < SUGGESTIONS_PER_USER),
+                )
+                # a concurrent refresh_user may have written the same pair
+                .on_conflict_do_nothing(index_elements=["user_id", "suggested_id"])
+            )
+        else:
+            (
+                db.query(model.Suggestion)
+                .filter(
+                    model.Suggestion.suggested_id == followee_id,
+                    model.Suggestion.mutual_count <= 0,
+                )
+                .delete(synchronize_session=False)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _is_fresh(computed_at) -> bool:
+    if computed_at is None:
+        return False
+    if computed_at.tzinfo is None:
+        # SQLite hands timestamps back without their timezone
+        computed_at = computed_at.replace(tzinfo=timezone.utc)
+    age = datetime.now(timezone.utc) - computed_at
+    return age.total_seconds() < SUGGESTIONS_TTL_SECONDS
+
+
+def get_suggestions(db: Session, user_id: int, limit: int):
+    """Stored suggestions for user_id joined with the suggested users, best first.
+
+    Missing or expired suggestions are recomputed (and committed) first.
+    """
+    computed_at = (
+        db.query(model.user.suggestions_computed_at).filter(model.user.id == user_id).scalar()
+    )
+    if not _is_fresh(computed_at):
+        refresh_user(db, user_id)
+        db.commit()
+
+    return (
+        db.query(model.user.id, model.user.email, model.Suggestion.mutual_count)
+        .join(model.user, model.user.id == model.Suggestion.suggested_id)
+        .filter(model.Suggestion.user_id == user_id)
+        .order_by(model.Suggestion.mutual_count.desc(), model.Suggestion.suggested_id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute friend-of-friend suggestions.")
+    parser.add_argument("--batch-size", type=int, default=SUGGESTIONS_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        processed = compute_all(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"computed suggestions for {processed} user(s)")
+
+
+__all__ = [
+    "SUGGESTIONS_PER_USER",
+    "SUGGESTIONS_TTL_SECONDS",
+    "load_adjacency",
+    "rank_candidates",
+    "compute_all",
+    "refresh_user",
+    "apply_follow_change",
+    "get_suggestions",
+]
+
+
+if __name__ == "__main__":
+    main()
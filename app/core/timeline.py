@@ -0,0 +1,373 @@
+import argparse
+import heapq
+import os
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, and_, exists, func, literal, select, true, tuple_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from app.core.pagination import decode_cursor, encode_cursor, keyset_filter
+from app.core.social_graph import social_graph
+from app.core.sql import upsert_insert
+import model
+
+
+# maximum number of entries kept per user timeline; older entries are trimmed
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", "800"))
+# how many recent posts of a newly followed user are copied into the follower's timeline
+TIMELINE_BACKFILL_POSTS = int(os.getenv("TIMELINE_BACKFILL_POSTS", "50"))
+# followers handled per INSERT / trim statement during fan-out
+FANOUT_BATCH_SIZE = int(os.getenv("TIMELINE_FANOUT_BATCH_SIZE", "1000"))
+# authors with at least this many followers are not fanned out; their posts are
+# pulled and merged into the feed at read time instead (hybrid push/pull)
+FEED_CELEBRITY_FOLLOWER_THRESHOLD = int(os.getenv("FEED_CELEBRITY_FOLLOWER_THRESHOLD", "10000"))
+
+
+def _chunks(values: List[int], size: int) -> Iterable[List[int]]:
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def celebrity_ids(db: Session, author_ids: Iterable[int]) -> FrozenSet[int]:
+    """Those of author_ids with at least FEED_CELEBRITY_FOLLOWER_THRESHOLD followers.
+
+    Read from users.followers_count by primary key, so the cost follows the
+    number of ids asked about rather than the size of the follows table.
+    """
+    ids = set()
+    for batch in _chunks(list(author_ids), FANOUT_BATCH_SIZE):
+        ids.update(
+            user_id
+            for (user_id,) in db.query(model.user.id).filter(
+                model.user.id.in_(batch),
+                model.user.followers_count >= FEED_CELEBRITY_FOLLOWER_THRESHOLD,
+            )
+        )
+    return frozenset(ids)
+
+
+def trim_timeline(db: Session, user_id: int) -> int:
+    """Delete user_id's entries beyond the newest TIMELINE_MAX_LENGTH. Does not commit.
+
+    The oldest entry to keep is found by a seek on ix_timelines_user_created,
+    so short timelines cost a single index probe.
+    """
+    entry = model.TimelineEntry
+    first_dropped = (
+        db.query(entry.post_created_at, entry.post_id)
+        .filter(entry.user_id == user_id)
+        .order_by(entry.post_created_at.desc(), entry.post_id.desc())
+        .offset(TIMELINE_MAX_LENGTH)
+        .limit(1)
+        .first()
+    )
+    if first_dropped is None:
+        return 0
+    return (
+        db.query(entry)
+        .filter(
+            entry.user_id == user_id,
+            tuple_(entry.post_created_at, entry.post_id) <= tuple_(*first_dropped),
+        )
+        .delete(synchronize_session=False)
+    )
+
+
+def trim_timelines(db: Session, batch_size: int = FANOUT_BATCH_SIZE) -> int:
+    """Trim every timeline that has grown past TIMELINE_MAX_LENGTH.
+
+    Fan-out only appends, so timelines may overshoot the cap until this
+    runs (periodically, from the retention job or the CLI); feeds read the
+    newest entries and are not affected. Commits once per batch of users.
+    """
+    entry = model.TimelineEntry
+    user_ids = [
+        user_id
+        for (user_id,) in db.query(entry.user_id)
+        .group_by(entry.user_id)
+        .having(func.count(entry.id) > TIMELINE_MAX_LENGTH)
+    ]
+    trimmed = 0
+    for batch in _chunks(user_ids, batch_size):
+        for user_id in batch:
+            trimmed += trim_timeline(db, user_id)
+        db.commit()
+    return trimmed
+
+
+def fan_out_post(post_id: int) -> None:
+    """Push a new post into the timeline of every follower of its author.
+
+    Runs as a background task after the create_post response has been sent,
+    so it opens its own session instead of reusing the request one.
+    """
+    db = SessionLocal()
+    try:
+        post = db.query(model.Post).filter(model.Post.id == post_id).first()
+        if not post or post.owner_id in celebrity_ids(db, [post.owner_id]):
+            # celebrity posts are pulled at read time by read_feed
+            return
+
+        follower_ids = [
+            follower_id
+            for (follower_id,) in db.query(model.Follow.follower_id).filter(
+                model.Follow.following_id == post.owner_id
+            )
+        ]
+        for batch in _chunks(follower_ids, FANOUT_BATCH_SIZE):
+            # a follow made since the post was committed may have backfilled it already
+            db.execute(
+                upsert_insert(db, model.TimelineEntry).on_conflict_do_nothing(
+                    index_elements=["user_id", "post_id"]
+                ),
+                [
+                    {
+                        "user_id": follower_id,
+                        "post_id": post.id,
+                        "post_created_at": post.created_at,
+                    }
+                    for follower_id in batch
+                ],
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def backfill_timeline(db: Session, follower_id: int, followee_id: int) -> None:
+    """Copy the followee's most recent posts into the follower's timeline.
+
+    Does not commit; meant to run in the same transaction as the new Follow row.
+    Celebrity authors are skipped since read_feed pulls their posts directly.
+    """
+    if celebrity_ids(db, [followee_id]):
+        return
+    recent_posts = (
+        select(model.Post.id, model.Post.created_at)
+        .where(model.Post.owner_id == followee_id)
+        .order_by(model.Post.created_at.desc(), model.Post.id.desc())
+        .limit(TIMELINE_BACKFILL_POSTS)
+        .subquery()
+    )
+    already_present = exists().where(
+        and_(
+            model.TimelineEntry.user_id == follower_id,
+            model.TimelineEntry.post_id == recent_posts.c.id,
+        )
+    )
+    db.execute(
+        upsert_insert(db, model.TimelineEntry)
+        .from_select(
+            ["user_id", "post_id", "post_created_at"],
+            select(
+                literal(follower_id, Integer),
+                recent_posts.c.id,
+                recent_posts.c.created_at,
+            ).where(~already_present),
+        )
+        # a concurrent fan-out of the same post may insert it first
+        .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+    )
+    trim_timeline(db, follower_id)
+
+
+def backfill_followers(author_id: int) -> None:
+    """Push an author's recent posts to every follower's timeline.
+
+    Runs as a background task after an unfollow takes the author below
+    FEED_CELEBRITY_FOLLOWER_THRESHOLD: their posts were pulled at read time
+    until then, so no timeline received them. Commits once per batch of
+    followers; entries already present are skipped.
+    """
+    db = SessionLocal()
+    try:
+        if celebrity_ids(db, [author_id]):
+            # followed again in the meantime, still pulled
+            return
+        recent_posts = (
+            select(model.Post.id, model.Post.created_at)
+            .where(model.Post.owner_id == author_id)
+            .order_by(model.Post.created_at.desc(), model.Post.id.desc())
+            .limit(TIMELINE_BACKFILL_POSTS)
+            .subquery()
+        )
+        follower_ids = [
+            follower_id
+            for (follower_id,) in db.query(model.Follow.follower_id).filter(
+                model.Follow.following_id == author_id
+            )
+        ]
+        for batch in _chunks(follower_ids, FANOUT_BATCH_SIZE):
+            db.execute(
+                upsert_insert(db, model.TimelineEntry)
+                .from_select(
+                    ["user_id", "post_id", "post_created_at"],
+                    select(model.Follow.follower_id, recent_posts.c.id, recent_posts.c.created_at)
+                    .join(recent_posts, true())
+                    .where(
+                        model.Follow.following_id == author_id,
+                        model.Follow.follower_id.in_(batch),
+                    ),
+                )
+                .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+            )
+            db.commit()
+    finally:
+        db.close()
+
+
+def remove_from_timeline(db: Session, follower_id: int, followee_id: int) -> None:
+    """Drop the followee's posts from the follower's timeline after an unfollow."""
+    followee_posts = select(model.Post.id).where(model.Post.owner_id == followee_id)
+    (
+        db.query(model.TimelineEntry)
+        .filter(
+            model.TimelineEntry.user_id == follower_id,
+            model.TimelineEntry.post_id.in_(followee_posts),
+        )
+        .delete(synchronize_session=False)
+    )
+
+
+def _post_key(post: model.Post) -> Tuple:
+    return (post.created_at, post.id)
+
+
+def _newest(query, created_col, id_col, position: Optional[Tuple], count: int) -> List[model.Post]:
+    if position is not None:
+        query = keyset_filter(query, created_col, id_col, position)
+    return query.order_by(created_col.desc(), id_col.desc()).limit(count).all()
+
+
+def read_feed(
+    db: Session,
+    user_id: int,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+) -> Tuple[List[model.Post], Optional[str]]:
+    """Return one feed page for user_id and the cursor of the next page.
+
+    Posts pushed into the user's timeline are merged with posts pulled from
+    followed celebrity authors using a k-way heap merge on (created_at, id).
+    """
+    if limit <= 0:
+        return [], None
+    position = decode_cursor(cursor) if cursor is not None else None
+    if position is not None:
+        offset = 0
+    # every stream must provide enough rows to fill the page plus one look-ahead row
+    depth = offset + limit + 1
+
+    streams = [
+        _newest(
+            db.query(model.Post)
+            .join(model.TimelineEntry, model.TimelineEntry.post_id == model.Post.id)
+            .filter(model.TimelineEntry.user_id == user_id),
+            model.TimelineEntry.post_created_at,
+            model.TimelineEntry.post_id,
+            position,
+            depth,
+        )
+    ]
+
+    for author_id in sorted(celebrity_ids(db, social_graph.following_ids(db, user_id))):
+        streams.append(
+            _newest(
+                db.query(model.Post).filter(model.Post.owner_id == author_id),
+                model.Post.created_at,
+                model.Post.id,
+                position,
+                depth,
+            )
+        )
+
+    rows: List[model.Post] = []
+    seen = set()
+    # a post can be in both the timeline and a pulled stream if its author crossed the threshold
+    for post in heapq.merge(*streams, key=_post_key, reverse=True):
+        if post.id in seen:
+            continue
+        seen.add(post.id)
+        rows.append(post)
+        if len(rows) == depth:
+            break
+
+    rows = rows[offset:]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def rebuild_timeline(db: Session, user_id: int) -> None:
+    """Recreate a user's timeline from scratch, e.g. for accounts that predate it."""
+    db.query(model.TimelineEntry).filter(model.TimelineEntry.user_id == user_id).delete(
+        synchronize_session=False
+    )
+    for followee_id in social_graph.following_ids(db, user_id):
+        backfill_timeline(db, user_id, followee_id)
+    db.commit()
+
+
+def rebuild_timelines(db: Session, only_empty: bool = True) -> int:
+    """Rebuild the timeline of every user who follows someone; returns how many.
+
+    With only_empty, users that already have timeline entries are skipped,
+    which fills in followers whose follows predate the timeline table.
+    """
+    follower_ids = select(model.Follow.follower_id).distinct()
+    query = db.query(model.user.id).filter(model.user.id.in_(follower_ids))
+    if only_empty:
+        query = query.filter(
+            ~exists().where(model.TimelineEntry.user_id == model.user.id)
+        )
+    user_ids = [user_id for (user_id,) in query.order_by(model.user.id)]
+    for user_id in user_ids:
+        rebuild_timeline(db, user_id)
+    return len(user_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild or trim home timelines.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="fill the timelines of followers that have none (e.g. after the migration)",
+    )
+    parser.add_argument("--all", action="store_true", help="with --rebuild, rebuild every timeline")
+    parser.add_argument("--trim", action="store_true", help="cut timelines back to TIMELINE_MAX_LENGTH")
+    parser.add_argument("--batch-size", type=int, default=FANOUT_BATCH_SIZE)
+    args = parser.parse_args()
+    if not (args.rebuild or args.trim):
+        parser.error("nothing to do: pass --rebuild and/or --trim")
+
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            print(f"rebuilt {rebuild_timelines(db, only_empty=not args.all)} timeline(s)")
+        if args.trim:
+            print(f"trimmed {trim_timelines(db, batch_size=args.batch_size)} timeline entries")
+    finally:
+        db.close()
+
+
+__all__ = [
+    "TIMELINE_MAX_LENGTH",
+    "FEED_CELEBRITY_FOLLOWER_THRESHOLD",
+    "celebrity_ids",
+    "read_feed",
+    "fan_out_post",
+    "backfill_timeline",
+    "backfill_followers",
+    "remove_from_timeline",
+    "rebuild_timeline",
+    "rebuild_timelines",
+    "trim_timeline",
+    "trim_timelines",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import model
+
+
+# cached counts are re-read from the database after this long, repairing any drift
+UNREAD_COUNT_RECONCILE_SECONDS = float(os.getenv("UNREAD_COUNT_RECONCILE_SECONDS", "60"))
+# users whose unread count is kept in memory; least recently used are evicted
+UNREAD_COUNT_MAX_USERS = int(os.getenv("UNREAD_COUNT_MAX_USERS", "100000"))
+
+_CHANGES_KEY = "unread_count_changes"
+
+
+class UnreadCounter:
+    """Per-process cache of unread notification counts, adjusted by the writers.
+
+    Only users already cached are adjusted; everyone else is loaded from the
+    database on their next read.
+    """
+
+    def __init__(self, max_users: int = UNREAD_COUNT_MAX_USERS, ttl: float = UNREAD_COUNT_RECONCILE_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._counts.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] >= self.ttl:
+                del self._counts[user_id]
+                return None
+            self._counts.move_to_end(user_id)
+            return entry[0]
+
+    def set(self, user_id: int, count: int) -> None:
+        with self._lock:
+            self._counts[user_id] = (count, time.monotonic())
+            self._counts.move_to_end(user_id)
+            while len(self._counts) > self.max_users:
+                self._counts.popitem(last=False)
+
+    def add(self, user_id: int, delta: int) -> None:
+        with self._lock:
+            entry = self._counts.get(user_id)
+            if entry is not None:
+                self._counts[user_id] = (max(entry[0] + delta, 0), entry[1])
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._counts.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+unread_counter = UnreadCounter()
+
+
+def count_unread(db: Session, user_id: int) -> int:
+    return (
+        db.query(func.count(model.Notification.id))
+        .filter(
+            model.Notification.user_id == user_id,
+            model.Notification.is_read == False,
+        )
+        .scalar()
+    )
+
+
+def unread_count(db: Session, user_id: int) -> int:
+    """Cached unread count for user_id, read through from the database."""
+    count = unread_counter.get(user_id)
+    if count is None:
+        count = count_unread(db, user_id)
+        unread_counter.set(user_id, count)
+    return count
+
+
+def record_change(db: Session, user_id: int, delta: Optional[int]) -> None:
+    """Adjust user_id's cached count by delta once db commits; None resets it to zero."""
+    db.info.setdefault(_CHANGES_KEY, []).append((user_id, delta))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_committed(session) -> None:
+    for user_id, delta in session.info.pop(_CHANGES_KEY, ()):
+        if delta is None:
+            unread_counter.set(user_id, 0)
+        else:
+            unread_counter.add(user_id, delta)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back(session) -> None:
+    session.info.pop(_CHANGES_KEY, None)
+
+
+__all__ = [
+    "UNREAD_COUNT_RECONCILE_SECONDS",
+    "UnreadCounter",
+    "unread_counter",
+    "count_unread",
+    "unread_count",
+    "record_change",
+]
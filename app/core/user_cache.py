@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import model
+
+
+# user rows kept in memory; least recently used are evicted
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "100000"))
+# cached rows are re-read after this long so changes made on other workers show up
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+_REQUEST_KEY = "cached_users"
+_CHANGED_KEY = "changed_user_ids"
+
+
+class CachedUser(NamedTuple):
+    """The public columns of a users row; the password hash is never cached."""
+
+    id: int
+    email: str
+    created_at: datetime
+
+
+class UserCache:
+    """Per-process cache of user rows with a short TTL.
+
+    Writes to users through a SessionLocal session drop the row here once
+    they commit; other workers' writes show up within the TTL.
+    """
+
+    def __init__(self, max_users: int = USER_CACHE_MAX_USERS, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[int, Tuple[CachedUser, float]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] >= self.ttl:
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def set(self, user: CachedUser) -> None:
+        with self._lock:
+            self._users[user.id] = (user, time.monotonic())
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+def get_user(db: Session, user_id: int) -> Optional[CachedUser]:
+    """User user_id, or None if there is no such user.
+
+    Looked up in db's request-scoped cache, then the process cache, then the
+    database. Missing users are not cached.
+    """
+    in_request = db.info.setdefault(_REQUEST_KEY, {})
+    user = in_request.get(user_id)
+    if user is not None:
+        return user
+    user = user_cache.get(user_id)
+    if user is None:
+        row = (
+            db.query(model.user.id, model.user.email, model.user.created_at)
+            .filter(model.user.id == user_id)
+            .first()
+        )
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        user_cache.set(user)
+    in_request[user_id] = user
+    return user
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_changed_users(session, flush_context) -> None:
+    changed = {
+        obj.id
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, model.user) and obj.id is not None
+    }
+    if not changed:
+        return
+    in_request = session.info.get(_REQUEST_KEY, {})
+    for user_id in changed:
+        in_request.pop(user_id, None)
+    session.info.setdefault(_CHANGED_KEY, set()).update(changed)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed(session) -> None:
+    for user_id in session.info.pop(_CHANGED_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back(session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
+
+
+__all__ = [
+    "USER_CACHE_TTL_SECONDS",
+    "CachedUser",
+    "UserCache",
+    "user_cache",
+    "get_user",
+]
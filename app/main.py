@@ -1,8 +1,13 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from .core.db import engine
+from .core.notifier import notification_writer
+from .core.rate_limit_middleware import RateLimitMiddleware
+from .core.retention import retention_job
 from .models import Base
-from .api import auth, posts, follow_profile, messaging, notifications, users
+from .api import auth, posts, follow_profile, messaging, notifications, users, metrics, suggestions
 
 
 # Create DB tables
@@ -14,21 +19,37 @@ tags_metadata = [
     {"name": "Authentication", "description": "Login and logout."},
     {"name": "Posts", "description": "Create and manage posts, comments, and likes."},
     {"name": "Profile", "description": "User profiles and follower information."},
-    {"name": "Follow", "description": "Follow and unfollow users."},
+    {"name": "Follow", "description": "Follow and unfollow users, and follow suggestions."},
     {"name": "Messaging", "description": "1-to-1 conversations and messages."},
     {"name": "Notifications", "description": "User notifications for social actions."},
+    {"name": "Metrics", "description": "Operational metrics such as DB pool usage."},
 ]
 
 
-app = FastAPI(openapi_tags=tags_metadata)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    retention_job.start()
+    try:
+        yield
+    finally:
+        retention_job.stop()
+        # write out notifications still queued in memory before the process exits
+        notification_writer.stop()
+
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
+# rate limits per route, see RATE_LIMIT_POLICIES
+app.add_middleware(RateLimitMiddleware)
 
 # Include routers from the app.api package
 app.include_router(auth.router)
 app.include_router(posts.router)
 app.include_router(follow_profile.router)
+app.include_router(suggestions.router)
 app.include_router(messaging.router)
 app.include_router(notifications.router)
 app.include_router(users.router)
+app.include_router(metrics.router)
 
 
 if __name__ == "__main__":
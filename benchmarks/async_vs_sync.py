@@ -0,0 +1,109 @@
+"""Compare throughput of the sync (threadpool) and async post listing paths.
+
+Usage:
+    python -m benchmarks.async_vs_sync [--requests 2000] [--concurrency 200]
+
+Both variants run the same query helper (post._post_page); the sync one
+through a regular Session in FastAPI's threadpool, the async one through
+AsyncSession.run_sync on the event loop. Runs against BENCH_DATABASE_URL
+(a throwaway SQLite file by default), never against DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_async_vs_sync.db"),
+)
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from database import Base, SessionLocal, engine, get_async_db, get_db  # noqa: E402
+import model  # noqa: E402
+import post  # noqa: E402
+
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/sync")
+def sync_posts(db: Session = Depends(get_db)):
+    return post._post_page(db, None, 20, 0, None, None)[0]
+
+
+@bench_app.get("/async")
+async def async_posts(db: AsyncSession = Depends(get_async_db)):
+    return (await db.run_sync(post._post_page, None, 20, 0, None, None))[0]
+
+
+def seed(n_posts: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(model.Post).count() >= n_posts:
+            return
+        now = datetime.now(timezone.utc)
+        author = db.query(model.user).filter(model.user.email == "bench@example.com").first()
+        if not author:
+            author = model.user(email="bench@example.com", password="x", created_at=now)
+            db.add(author)
+            db.flush()
+        db.bulk_insert_mappings(
+            model.Post,
+            [
+                {"content": f"bench {i}", "owner_id": author.id, "created_at": now - timedelta(seconds=i)}
+                for i in range(n_posts)
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def hammer(path: str, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=bench_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                resp = await client.get(path)
+                resp.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def run(total: int, concurrency: int) -> None:
+    # one event loop for everything: pooled async connections are bound to it
+    for path in ("/sync", "/async"):
+        # warm up pools and caches before measuring
+        await hammer(path, 50, 10)
+        elapsed = await hammer(path, total, concurrency)
+        print(
+            f"{path:<7} concurrency={concurrency:<5} "
+            f"{total / elapsed:9.1f} req/s  ({elapsed:.2f}s for {total} requests)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=500)
+    args = parser.parse_args()
+
+    seed(args.posts)
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
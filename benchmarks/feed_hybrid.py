@@ -0,0 +1,144 @@
+"""Compare push, pull and hybrid home feeds under a skewed follower distribution.
+
+Usage:
+    python -m benchmarks.feed_hybrid [--users 2000] [--follows 40] [--threshold 200]
+
+Runs against BENCH_DATABASE_URL (a throwaway SQLite file by default), never
+against DATABASE_URL, because it drops and recreates every table.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_feed_hybrid.db"),
+)
+
+from sqlalchemy import func  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from app.core import counters, timeline  # noqa: E402
+import model  # noqa: E402
+
+
+def zipf_weights(n: int, exponent: float):
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def seed_graph(n_users: int, follows_per_user: int, exponent: float, rng: random.Random) -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(
+            model.user,
+            [
+                {"id": i, "email": f"bench{i}@example.com", "password": "x", "created_at": now}
+                for i in range(1, n_users + 1)
+            ],
+        )
+        # popularity follows a Zipf law: user 1 is followed by far more people than user 1000
+        weights = zipf_weights(n_users, exponent)
+        user_ids = list(range(1, n_users + 1))
+        rows = []
+        for follower_id in user_ids:
+            targets = set(rng.choices(user_ids, weights=weights, k=follows_per_user))
+            targets.discard(follower_id)
+            rows.extend(
+                {"follower_id": follower_id, "following_id": t, "created_at": now} for t in targets
+            )
+        db.bulk_insert_mappings(model.Follow, rows)
+        db.commit()
+        counters.reconcile_follower_counts(db, batch_size=n_users)
+    finally:
+        db.close()
+
+
+def run_strategy(name: str, threshold: int, n_users: int, n_posts: int, n_reads: int, seed: int):
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        db.query(model.TimelineEntry).delete()
+        db.query(model.Post).delete()
+        db.commit()
+
+        timeline.FEED_CELEBRITY_FOLLOWER_THRESHOLD = threshold
+
+        # authors are picked uniformly so popular and unpopular accounts both post
+        start_at = datetime.now(timezone.utc)
+        write_seconds = 0.0
+        for i in range(n_posts):
+            post = model.Post(
+                content="bench",
+                owner_id=rng.randint(1, n_users),
+                created_at=start_at + timedelta(milliseconds=i),
+            )
+            db.add(post)
+            db.commit()
+            started = time.perf_counter()
+            timeline.fan_out_post(post.id)
+            write_seconds += time.perf_counter() - started
+
+        timeline_rows = db.query(model.TimelineEntry).count()
+
+        read_seconds = 0.0
+        for _ in range(n_reads):
+            reader_id = rng.randint(1, n_users)
+            started = time.perf_counter()
+            timeline.read_feed(db, reader_id, limit=20)
+            read_seconds += time.perf_counter() - started
+            db.rollback()
+    finally:
+        db.close()
+
+    print(
+        f"{name:<8} threshold={threshold:<12} "
+        f"write: {write_seconds / n_posts * 1000:8.2f} ms/post {timeline_rows / n_posts:9.1f} rows/post   "
+        f"read: {read_seconds / n_reads * 1000:8.2f} ms/feed"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows", type=int, default=40, help="follows drawn per user")
+    parser.add_argument("--exponent", type=float, default=1.1, help="Zipf exponent of popularity")
+    parser.add_argument("--threshold", type=int, default=200, help="hybrid celebrity threshold")
+    parser.add_argument("--posts", type=int, default=300)
+    parser.add_argument("--reads", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seed_graph(args.users, args.follows, args.exponent, rng)
+
+    db = SessionLocal()
+    try:
+        counts = sorted(
+            (
+                c
+                for (c,) in db.query(func.count(model.Follow.id)).group_by(
+                    model.Follow.following_id
+                )
+            ),
+            reverse=True,
+        )
+    finally:
+        db.close()
+    print(f"followers per author: max={counts[0]} median={counts[len(counts) // 2]}")
+
+    for name, threshold in (
+        ("push", 10 ** 9),
+        ("hybrid", args.threshold),
+        ("pull", 0),
+    ):
+        run_strategy(name, threshold, args.users, args.posts, args.reads, args.seed)
+
+
+if __name__ == "__main__":
+    main()
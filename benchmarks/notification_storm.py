@@ -0,0 +1,104 @@
+"""Measure notification rows written during a like storm, with and without coalescing.
+
+Usage:
+    python -m benchmarks.notification_storm [--likes 20000] [--posts 5]
+
+Runs against BENCH_DATABASE_URL (a throwaway SQLite file by default), never
+against DATABASE_URL, because it drops and recreates every table.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_notification_storm.db"),
+)
+
+from sqlalchemy import insert  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from app.core import notifier  # noqa: E402
+import model  # noqa: E402
+
+
+def like_events(n_likes: int, n_posts: int, n_users: int, rng: random.Random):
+    # most of the storm hits the first post, the rest is spread over the others
+    weights = [1.0 / (rank ** 1.5) for rank in range(1, n_posts + 1)]
+    for _ in range(n_likes):
+        post_id = rng.choices(range(1, n_posts + 1), weights=weights)[0]
+        actor_id = rng.randint(2, n_users)
+        yield {
+            "user_id": 1,
+            "type": "like",
+            "message": f"Your post (id={post_id}) got a new like",
+            "actor_id": actor_id,
+            "post_id": post_id,
+            "group_key": f"like:{post_id}",
+            "created_at": datetime.now(timezone.utc),
+        }
+
+
+def reset(n_users: int, n_posts: int) -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(model.user),
+            [{"id": i, "email": f"bench{i}@example.com", "password": "x", "created_at": now} for i in range(1, n_users + 1)],
+        )
+        db.execute(
+            insert(model.Post),
+            [{"id": i, "content": "viral", "owner_id": 1, "created_at": now} for i in range(1, n_posts + 1)],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(name: str, events, per_event: bool, batch_size: int) -> None:
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        if per_event:
+            # the old write path: one row and one commit per like
+            for event_ in events:
+                db.execute(insert(model.Notification).values(notifier._row({**event_, "group_key": None}, [], 1)))
+                db.commit()
+        else:
+            for start in range(0, len(events), batch_size):
+                notifier.write_notifications(db, events[start : start + batch_size])
+                db.commit()
+        elapsed = time.perf_counter() - started
+        rows = db.query(model.Notification).count()
+    finally:
+        db.close()
+    print(f"{name:<22} {rows:>8} rows  {elapsed:7.2f}s  ({len(events) / elapsed:9.0f} events/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--likes", type=int, default=20000)
+    parser.add_argument("--posts", type=int, default=5)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    events = list(like_events(args.likes, args.posts, args.users, random.Random(args.seed)))
+    print(f"{len(events)} like events on {args.posts} posts of one user")
+
+    reset(args.users, args.posts)
+    run("one row per like", events, per_event=True, batch_size=1)
+    reset(args.users, args.posts)
+    run("coalesced, sync", events, per_event=False, batch_size=1)
+    reset(args.users, args.posts)
+    run("coalesced, batch=500", events, per_event=False, batch_size=notifier.NOTIFICATION_BATCH_SIZE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Microbenchmark for the token-bucket rate limiter: calls per second and bytes per key.
+
+Usage:
+    python -m benchmarks.rate_limiter [--calls 500000] [--keys 100000]
+
+For comparison it also measures the deque-of-timestamps limiter it replaced,
+which keeps up to limit floats per key and never forgets a key.
+"""
+import argparse
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+from app.core.rate_limiter import MemoryBackend, TokenBucketLimiter
+
+
+def deque_hit(requests, identifier, endpoint, limit, window_seconds):
+    now = time.time()
+    dq = requests[(identifier, endpoint)]
+    cutoff = now - window_seconds
+    while dq and dq[0] < cutoff:
+        dq.popleft()
+    if len(dq) >= limit:
+        return False
+    dq.append(now)
+    return True
+
+
+def calls_per_second(hit, identifiers) -> float:
+    started = time.perf_counter()
+    for identifier in identifiers:
+        hit(identifier, "login", 5, 60)
+    return len(identifiers) / (time.perf_counter() - started)
+
+
+def bytes_per_key(make, hit, n_keys: int, hits_per_key: int) -> float:
+    tracemalloc.start()
+    store = make()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n_keys):
+        for _ in range(hits_per_key):
+            hit(store, f"user{i}@example.com", "login", 5, 60)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / n_keys
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500000)
+    parser.add_argument("--keys", type=int, default=100000)
+    args = parser.parse_args()
+
+    hot = ["alice@example.com"] * args.calls
+    distinct = [f"user{i}@example.com" for i in range(args.calls)]
+
+    limiter = TokenBucketLimiter(MemoryBackend(max_keys=args.keys), sweep_interval=0)
+    print(f"token bucket, one hot key:      {calls_per_second(limiter.hit, hot):>12,.0f} calls/s")
+    limiter = TokenBucketLimiter(MemoryBackend(max_keys=args.keys), sweep_interval=0)
+    print(f"token bucket, distinct keys:    {calls_per_second(limiter.hit, distinct):>12,.0f} calls/s")
+    print(f"  keys held after {args.calls:,} distinct callers: {len(limiter):,} (cap {args.keys:,})")
+
+    requests = defaultdict(deque)
+    legacy = lambda *a: deque_hit(requests, *a)  # noqa: E731
+    print(f"deque, one hot key:             {calls_per_second(legacy, hot):>12,.0f} calls/s")
+    requests.clear()
+    print(f"deque, distinct keys:           {calls_per_second(legacy, distinct):>12,.0f} calls/s")
+    print(f"  keys held after {args.calls:,} distinct callers: {len(requests):,} (no cap)")
+
+    for hits in (1, 5):
+        bucket = bytes_per_key(
+            lambda: TokenBucketLimiter(MemoryBackend(max_keys=args.keys), sweep_interval=0),
+            lambda store, *a: store.hit(*a),
+            args.keys,
+            hits,
+        )
+        old = bytes_per_key(lambda: defaultdict(deque), deque_hit, args.keys, hits)
+        print(f"bytes/key after {hits} hit(s): token bucket {bucket:.0f}, deque {old:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Time the friend-of-friend suggestions batch job on a synthetic follow graph.
+
+Usage:
+    python -m benchmarks.suggestions_batch [--users 50000] [--follows 20]
+
+The defaults build a graph of 1M follow edges. Runs against
+BENCH_DATABASE_URL (a throwaway SQLite file by default), never against
+DATABASE_URL, because it drops and recreates every table.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_suggestions.db"),
+)
+
+from sqlalchemy import insert  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from app.core import suggestions  # noqa: E402
+import model  # noqa: E402
+
+
+def seed_graph(n_users: int, follows_per_user: int, exponent: float, rng: random.Random) -> int:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now(timezone.utc)
+    user_ids = list(range(1, n_users + 1))
+    # popularity follows a Zipf law so some users have far more followers than others
+    weights = [1.0 / (rank ** exponent) for rank in user_ids]
+    edges = 0
+    db = SessionLocal()
+    try:
+        db.execute(
+            insert(model.user),
+            [{"id": i, "email": f"bench{i}@example.com", "password": "x", "created_at": now} for i in user_ids],
+        )
+        for start in range(0, n_users, 5000):
+            rows = []
+            for follower_id in user_ids[start : start + 5000]:
+                targets = set()
+                while len(targets) < follows_per_user:
+                    targets.update(rng.choices(user_ids, weights=weights, k=follows_per_user - len(targets)))
+                    targets.discard(follower_id)
+                rows.extend(
+                    {"follower_id": follower_id, "following_id": t, "created_at": now} for t in targets
+                )
+            db.execute(insert(model.Follow), rows)
+            edges += len(rows)
+        db.commit()
+    finally:
+        db.close()
+    return edges
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--follows", type=int, default=20, help="follows per user")
+    parser.add_argument("--exponent", type=float, default=0.8, help="Zipf exponent of popularity")
+    parser.add_argument("--batch-size", type=int, default=suggestions.SUGGESTIONS_BATCH_SIZE)
+    parser.add_argument("--samples", type=int, default=200, help="users refreshed one at a time in SQL")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    edges = seed_graph(args.users, args.follows, args.exponent, rng)
+    print(f"seeded {edges} edges for {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        adjacency = suggestions.load_adjacency(db)
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        processed = suggestions.compute_all(db, batch_size=args.batch_size)
+        batch_seconds = time.perf_counter() - started
+
+        rows = db.query(model.Suggestion).count()
+        print(f"adjacency load: {load_seconds:.1f}s ({len(adjacency)} rows)")
+        print(
+            f"batch job:      {batch_seconds:.1f}s for {processed} users "
+            f"({batch_seconds / processed * 1000:.2f} ms/user, {rows} suggestions stored)"
+        )
+
+        # the per-user SQL path used on read and after follow changes, for comparison
+        started = time.perf_counter()
+        for _ in range(args.samples):
+            suggestions.refresh_user(db, rng.randint(1, args.users))
+            db.commit()
+        refresh_seconds = time.perf_counter() - started
+        print(f"refresh_user:   {refresh_seconds / args.samples * 1000:.2f} ms/user")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
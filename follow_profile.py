@@ -1,10 +1,16 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import Integer, delete, exists, func, literal, select, update
 from sqlalchemy.orm import Session
 
 from app.core.db import get_db
-from app.core import security
+from app.core import notifier, security, suggestions, timeline
+from app.core.pagination import MAX_PAGE_SIZE, paginate, set_next_cursor
+from app.core.replicas import get_read_db
+from app.core.social_graph import social_graph
+from app.core.sql import upsert_insert
+from app.core.user_cache import get_user
 import model
 from schema import ProfileResponse, UserBasic
 
@@ -14,9 +20,21 @@ router = APIRouter(
 )
 
 
+def _bump_followers(db: Session, user_id: int, delta: int) -> Optional[int]:
+    # UPDATE ... SET followers_count = followers_count + delta, so concurrent
+    # follows never lose an increment; returns the new count
+    return db.execute(
+        update(model.user)
+        .where(model.user.id == user_id)
+        .values(followers_count=model.user.followers_count + delta)
+        .returning(model.user.followers_count)
+    ).scalar()
+
+
 @router.post("/follow/{user_id}", status_code=status.HTTP_200_OK)
 def toggle_follow(
     user_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(security.get_current_user),
 ):
@@ -27,71 +45,137 @@ def toggle_follow(
             detail="You cannot follow yourself",
         )
 
-    target_user = db.query(model.user).filter(model.user.id == user_id).first()
-    if not target_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
+    # deleting first tells us whether the follow existed without a separate read
+    unfollowed = db.execute(
+        delete(model.Follow)
+        .where(
+            model.Follow.follower_id == current_user_id,
+            model.Follow.following_id == user_id,
         )
+        .returning(model.Follow.id)
+    ).first()
 
-    follow_query = db.query(model.Follow).filter(
-        model.Follow.follower_id == current_user_id,
-        model.Follow.following_id == user_id,
-    )
-    existing = follow_query.first()
-
-    if existing:
-        follow_query.delete(synchronize_session=False)
+    if unfollowed:
+        followers_left = _bump_followers(db, user_id, -1)
+        timeline.remove_from_timeline(db, current_user_id, user_id)
         db.commit()
+        social_graph.remove_follow(current_user_id, user_id)
+        if followers_left == timeline.FEED_CELEBRITY_FOLLOWER_THRESHOLD - 1:
+            # no longer pulled at read time, so push recent posts to the remaining followers
+            background_tasks.add_task(timeline.backfill_followers, user_id)
+        background_tasks.add_task(suggestions.apply_follow_change, current_user_id, user_id, False)
         return {"status": "unfollowed"}
 
-    new_follow = model.Follow(follower_id=current_user_id, following_id=user_id)
-    db.add(new_follow)
+    # the target user's existence is checked inside the INSERT; a concurrent
+    # follow of the same user hits the unique constraint and inserts nothing
+    followed = db.execute(
+        upsert_insert(db, model.Follow)
+        .from_select(
+            ["follower_id", "following_id"],
+            select(literal(current_user_id, Integer), literal(user_id, Integer)).where(
+                exists().where(model.user.id == user_id)
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["follower_id", "following_id"])
+        .returning(model.Follow.id)
+    ).first()
+    if not followed:
+        db.rollback()
+        if db.get(model.user, user_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+        return {"status": "followed"}
+
+    _bump_followers(db, user_id, 1)
+    timeline.backfill_timeline(db, current_user_id, user_id)
     # create notification for the user being followed
-    notif = model.Notification(
+    notifier.notify(
+        db,
         user_id=user_id,
         type="follow",
         message=f"{current_user_id} started following you",
+        actor_id=current_user_id,
     )
-    db.add(notif)
     db.commit()
+    social_graph.add_follow(current_user_id, user_id)
+    background_tasks.add_task(suggestions.apply_follow_change, current_user_id, user_id, True)
     return {"status": "followed"}
 
 
 def _build_profile(user_obj: model.user, db: Session) -> ProfileResponse:
-    followers = (
-        db.query(model.Follow)
-        .filter(model.Follow.following_id == user_obj.id)
-        .all()
+    # both counts in one round trip, each answered from a follows index
+    followers_count = (
+        select(func.count(model.Follow.id))
+        .where(model.Follow.following_id == user_obj.id)
+        .scalar_subquery()
     )
-    following = (
-        db.query(model.Follow)
-        .filter(model.Follow.follower_id == user_obj.id)
-        .all()
+    following_count = (
+        select(func.count(model.Follow.id))
+        .where(model.Follow.follower_id == user_obj.id)
+        .scalar_subquery()
     )
-
-    follower_users: List[UserBasic] = [
-        UserBasic(id=f.follower.id, email=f.follower.email) for f in followers
-    ]
-    following_users: List[UserBasic] = [
-        UserBasic(id=f.following.id, email=f.following.email) for f in following
-    ]
+    counts = db.execute(select(followers_count, following_count)).one()
 
     return ProfileResponse(
         user=UserBasic(id=user_obj.id, email=user_obj.email),
-        followers_count=len(follower_users),
-        following_count=len(following_users),
-        followers=follower_users,
-        following=following_users,
+        followers_count=counts[0],
+        following_count=counts[1],
     )
 
 
+def _follow_page(
+    db: Session,
+    user_id: int,
+    followers: bool,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+) -> Tuple[List[UserBasic], Optional[str]]:
+    """One page of a user's followers (or followees), newest follow first.
+
+    Users are loaded in the same query as the follow rows, keyed on
+    (follows.created_at, follows.id) for cursor pagination.
+    """
+    if followers:
+        match, other = model.Follow.following_id, model.Follow.follower_id
+    else:
+        match, other = model.Follow.follower_id, model.Follow.following_id
+
+    rows, next_cursor = paginate(
+        db.query(
+            model.user.id,
+            model.user.email,
+            model.Follow.created_at.label("followed_at"),
+            model.Follow.id.label("follow_id"),
+        )
+        .join(model.user, model.user.id == other)
+        .filter(match == user_id),
+        model.Follow.created_at,
+        model.Follow.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        key=lambda row: (row.followed_at, row.follow_id),
+    )
+
+    if not rows and cursor is None and offset == 0:
+        if not db.query(model.user.id).filter(model.user.id == user_id).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+
+    return [UserBasic(id=row.id, email=row.email) for row in rows], next_cursor
+
+
 @router.get("/profile/me", response_model=ProfileResponse)
 def get_my_profile(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user=Depends(security.get_current_user),
 ):
-    user_obj = db.query(model.user).filter(model.user.id == int(current_user.id)).first()
+    user_obj = get_user(db, int(current_user.id))
     if not user_obj:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -101,11 +185,39 @@ def get_my_profile(
 
 
 @router.get("/profile/{user_id}", response_model=ProfileResponse)
-def get_user_profile(user_id: int, db: Session = Depends(get_db)):
-    user_obj = db.query(model.user).filter(model.user.id == user_id).first()
+def get_user_profile(user_id: int, db: Session = Depends(get_read_db)):
+    user_obj = get_user(db, user_id)
     if not user_obj:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
     return _build_profile(user_obj, db)
+
+
+@router.get("/profile/{user_id}/followers", response_model=List[UserBasic])
+def get_followers(
+    user_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    users, next_cursor = _follow_page(db, user_id, True, limit, offset, cursor)
+    set_next_cursor(response, next_cursor)
+    return users
+
+
+@router.get("/profile/{user_id}/following", response_model=List[UserBasic])
+def get_following(
+    user_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    users, next_cursor = _follow_page(db, user_id, False, limit, offset, cursor)
+    set_next_cursor(response, next_cursor)
+    return users
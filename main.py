@@ -1,9 +1,15 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status
 from schema import TextInput, UserCreate, UserResponse
 import model
 from database import engine, SessionLocal, get_db
 from sqlalchemy.orm import Session
 import util, auth, oauth2
+from app.api import metrics, suggestions
+from app.core.notifier import notification_writer
+from app.core.rate_limit_middleware import RateLimitMiddleware
+from app.core.retention import retention_job
+from app.core.sql import upsert_insert
 import post
 import follow_profile
 import messaging
@@ -13,12 +19,25 @@ import notifications
 model.Base.metadata.create_all(bind=engine)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    retention_job.start()
+    try:
+        yield
+    finally:
+        retention_job.stop()
+        notification_writer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RateLimitMiddleware)
 app.include_router(auth.router)
 app.include_router(post.router)
 app.include_router(follow_profile.router)
 app.include_router(messaging.router)
 app.include_router(notifications.router)
+app.include_router(suggestions.router)
+app.include_router(metrics.router)
 
 
 @app.post("/text")
@@ -37,25 +56,25 @@ def user_message(data: TextInput, db: Session = Depends(get_db), get_current_use
     new_text = model.TextData(text=data.text)
     db.add(new_text)
     db.commit()
-    db.refresh(new_text)
     return {"id": new_text.id, "text": new_text.text}
 
 
 @app.post("/create_user", status_code=201, response_model=UserResponse)   
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    # check if email already exists to avoid DB integrity error
-    existing_user = db.query(model.user).filter(model.user.email == user.email).first()
-    if existing_user:
+    hashed_password = util.hash_password(user.password[:72])
+    # the unique email index rejects duplicates in the same statement, no pre-check needed
+    new_user = db.scalars(
+        upsert_insert(db, model.user)
+        .values(email=user.email, password=hashed_password)
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(model.user)
+    ).first()
+    if new_user is None:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Email already registered",
         )
-
-    hashed_password = util.hash_password(user.password[:72])
-    user.password = hashed_password
-    new_user = model.user(**user.dict())
-    db.add(new_user)
     db.commit()
-    db.refresh(new_user)
     return new_user
 
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, TIMESTAMP, text, ForeignKey, UniqueConstraint, Boolean
+from sqlalchemy import Column, Integer, String, TIMESTAMP, text, ForeignKey, UniqueConstraint, Boolean, Index, JSON, Float
 from sqlalchemy.orm import relationship
 
 
@@ -21,6 +21,10 @@ class user(Base):
         nullable=False,
         server_default=text("now()"),
     )
+    # denormalized, kept in sync by toggle_follow; decides whose posts feeds pull
+    followers_count = Column(Integer, nullable=False, server_default=text("0"))
+    # when app.core.suggestions last ranked this user, also set when nothing was found
+    suggestions_computed_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
 
 class Post(Base):
@@ -38,11 +42,20 @@ class Post(Base):
         nullable=False,
         server_default=text("now()"),
     )
+    # denormalized counters, kept in sync by toggle_like / create_comment / delete_comment
+    likes_count = Column(Integer, nullable=False, server_default=text("0"))
+    comments_count = Column(Integer, nullable=False, server_default=text("0"))
 
     owner = relationship("user")
     comments = relationship("Comment", back_populates="post", cascade="all, delete")
     likes = relationship("Like", back_populates="post", cascade="all, delete")
 
+    __table_args__ = (
+        # global listing and per-author listings, both ordered newest first by (created_at, id)
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_owner_created_at_id", "owner_id", "created_at", "id"),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -68,6 +81,10 @@ class Comment(Base):
     post = relationship("Post", back_populates="comments")
     owner = relationship("user")
 
+    __table_args__ = (
+        Index("ix_comments_post_created_at_id", "post_id", "created_at", "id"),
+    )
+
 
 class Like(Base):
     __tablename__ = "likes"
@@ -122,6 +139,8 @@ class Follow(Base):
 
     __table_args__ = (
         UniqueConstraint("follower_id", "following_id", name="uq_follower_following"),
+        # the unique constraint serves follower_id lookups; this one serves "who follows X"
+        Index("ix_follows_following_id", "following_id"),
     )
 
 
@@ -151,6 +170,8 @@ class Conversation(Base):
 
     __table_args__ = (
         UniqueConstraint("user1_id", "user2_id", name="uq_conversation_users"),
+        # the unique constraint serves user1_id lookups; this one the user2 side
+        Index("ix_conversations_user2_id", "user2_id"),
     )
 
 
@@ -179,6 +200,17 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("user")
 
+    __table_args__ = (
+        Index("ix_messages_conversation_created_at_id", "conversation_id", "created_at", "id"),
+        # retention: read messages past their age limit
+        Index(
+            "ix_messages_read_created_at",
+            "created_at",
+            postgresql_where=is_read == True,
+            sqlite_where=is_read == True,
+        ),
+    )
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -197,5 +229,141 @@ class Notification(Base):
         server_default=text("now()"),
     )
     is_read = Column(Boolean, nullable=False, server_default=text("false"))
+    # likes/comments on one target are merged into a single row while it is unread,
+    # e.g. "7 and 41 others liked your post"; NULL for notifications that never merge
+    group_key = Column(String, nullable=True)
+    actor_count = Column(Integer, nullable=False, server_default=text("1"))
+    recent_actor_ids = Column(JSON, nullable=False, server_default=text("'[]'"))
+    # last merged event; streams send rows again when it moves
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text("now()"),
+    )
+    # who caused the notification and what it is about; deleting any of them
+    # deletes the notification with it
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=True)
+    conversation_id = Column(
+        Integer,
+        ForeignKey("conversations.id", ondelete="CASCADE"),
+        nullable=True,
+    )
+
+    user = relationship("user", foreign_keys=[user_id])
+    actor = relationship("user", foreign_keys=[actor_id])
+
+    __table_args__ = (
+        # unread counts / mark_all_read
+        Index("ix_notifications_user_read_created_at", "user_id", "is_read", "created_at"),
+        # listing, paged on the immutable (created_at, id)
+        Index("ix_notifications_user_created_at_id", "user_id", "created_at", "id"),
+        # streaming changes by latest activity
+        Index("ix_notifications_user_updated_at_id", "user_id", "updated_at", "id"),
+        # retention: read notifications past their age limit
+        Index(
+            "ix_notifications_read_updated_at",
+            "updated_at",
+            postgresql_where=is_read == True,
+            sqlite_where=is_read == True,
+        ),
+        # at most one open (unread) row per group; also finds the row an event merges into
+        Index(
+            "uq_notifications_open_group",
+            "user_id",
+            "group_key",
+            unique=True,
+            postgresql_where=is_read == False,
+            sqlite_where=is_read == False,
+        ),
+        # cascading deletes and per-target cleanup
+        Index("ix_notifications_actor_id", "actor_id"),
+        Index("ix_notifications_post_id", "post_id"),
+        Index("ix_notifications_conversation_id", "conversation_id"),
+    )
+
+
+# every actor merged into a coalesced notification, so a repeat actor is counted once
+class NotificationActor(Base):
+    __tablename__ = "notification_actors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    notification_id = Column(
+        Integer,
+        ForeignKey("notifications.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    actor_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        UniqueConstraint("notification_id", "actor_id", name="uq_notification_actor"),
+        # cascading deletes of users
+        Index("ix_notification_actors_actor_id", "actor_id"),
+    )
+
+
+# materialized home timeline: one row per post pushed into a follower's feed
+class TimelineEntry(Base):
+    __tablename__ = "timelines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    post_id = Column(
+        Integer,
+        ForeignKey("posts.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # copied from the post so the feed can be read and trimmed from this table alone
+    post_created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "post_id", name="uq_timeline_user_post"),
+        Index("ix_timelines_user_created", "user_id", "post_created_at", "post_id"),
+    )
+
+
+# precomputed "people you may know": second-degree follows ranked by mutual connections
+class Suggestion(Base):
+    __tablename__ = "suggestions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    suggested_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # how many of the users user_id follows also follow suggested_id
+    mutual_count = Column(Integer, nullable=False)
+    computed_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "suggested_id", name="uq_suggestion_user_suggested"),
+        Index("ix_suggestions_user_mutual", "user_id", "mutual_count"),
+    )
+
+
+# token buckets shared by every app instance when RATE_LIMIT_BACKEND=sql
+class RateLimit(Base):
+    __tablename__ = "rate_limits"
+
+    # "<endpoint>:<identifier>"
+    key = Column(String, primary_key=True)
+    # epoch seconds at which the bucket is full again
+    full_at = Column(Float, nullable=False)
+    # outcome of the last call, returned by the same upsert that decides it
+    allowed = Column(Boolean, nullable=False, server_default=text("true"))
 
-    user = relationship("user")
\ No newline at end of file
+    __table_args__ = (Index("ix_rate_limits_full_at", "full_at"),)
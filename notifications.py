@@ -1,10 +1,17 @@
-from typing import List
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
 
-from app.core.db import get_db
-from app.core import security
+from app.core.db import get_async_sessionmaker, get_db
+from app.core import security, unread
+from app.core.broker import notification_broker
+from app.core.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, paginate, set_next_cursor
+from app.core.replicas import get_async_read_db
 import model
 from schema import NotificationResponse
 
@@ -14,25 +21,154 @@ router = APIRouter(
     tags=["Notifications"],
 )
 
+# idle streams send a keepalive comment and re-check the database this often
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("NOTIFICATION_STREAM_KEEPALIVE_SECONDS", "15"))
+# how far back a stream re-reads to catch events that committed late
+STREAM_GRACE_SECONDS = float(os.getenv("NOTIFICATION_STREAM_GRACE_SECONDS", "5"))
+# rows read per database round trip while streaming
+STREAM_BATCH_SIZE = 100
+
+
+def _notification_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+) -> Tuple[List[model.Notification], Optional[str]]:
+    return paginate(
+        # actors are loaded in the same query, so the page needs no per-row lookups
+        db.query(model.Notification)
+        .options(joinedload(model.Notification.actor))
+        .filter(model.Notification.user_id == user_id),
+        # created_at never changes, so merges into a group cannot shift rows between pages
+        model.Notification.created_at,
+        model.Notification.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+    )
+
 
 @router.get("/", response_model=List[NotificationResponse])
-def list_notifications(
-    db: Session = Depends(get_db),
+async def list_notifications(
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user=Depends(security.get_current_user),
-    limit: int = 20,
-    offset: int = 0,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
 ):
-    current_user_id = int(current_user.id)
+    # sync query helper runs on the async connection, without a threadpool hop
+    notifications, next_cursor = await db.run_sync(
+        _notification_page, int(current_user.id), limit, offset, cursor
+    )
+    set_next_cursor(response, next_cursor)
+    return notifications
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without their timezone
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
 
-    notifications = (
+def _notifications_since(
+    db: Session, user_id: int, since: datetime, limit: int
+) -> List[model.Notification]:
+    return (
         db.query(model.Notification)
-        .filter(model.Notification.user_id == current_user_id)
-        .order_by(model.Notification.created_at.desc())
+        .options(joinedload(model.Notification.actor))
+        .filter(
+            model.Notification.user_id == user_id,
+            model.Notification.updated_at >= since,
+        )
+        .order_by(model.Notification.updated_at.asc(), model.Notification.id.asc())
         .limit(limit)
-        .offset(offset)
         .all()
     )
-    return notifications
+
+
+async def _event_stream(
+    request: Request,
+    session_factory,
+    user_id: int,
+    token: str,
+    since: datetime,
+) -> AsyncIterator[str]:
+    # subscribed here rather than in the handler: a generator that never starts
+    # (the client left before the body was sent) never runs its finally
+    try:
+        subscription = notification_broker.subscribe(user_id)
+    except HTTPException:
+        # another stream took the last slot after the handler's check
+        return
+    # rows are re-read from STREAM_GRACE_SECONDS before the newest one sent, since
+    # updated_at is stamped when the event happens and may commit out of order;
+    # (id, updated_at) pairs already sent in that window are skipped
+    sent = {}
+    try:
+        while True:
+            async with session_factory() as db:
+                # rows already sent are all inside the window, so they never crowd out new ones
+                rows = await db.run_sync(
+                    _notifications_since,
+                    user_id,
+                    since - timedelta(seconds=STREAM_GRACE_SECONDS),
+                    STREAM_BATCH_SIZE + len(sent),
+                )
+            fresh = 0
+            for row in rows:
+                updated_at = _as_utc(row.updated_at)
+                if sent.get(row.id) == updated_at:
+                    continue
+                sent[row.id] = updated_at
+                since = max(since, updated_at)
+                fresh += 1
+                data = NotificationResponse.model_validate(row).model_dump_json()
+                yield f"id: {encode_cursor(updated_at, row.id)}\nevent: notification\ndata: {data}\n\n"
+            horizon = since - timedelta(seconds=STREAM_GRACE_SECONDS)
+            sent = {row_id: at for row_id, at in sent.items() if at >= horizon}
+            if fresh == STREAM_BATCH_SIZE:
+                continue
+
+            if await request.is_disconnected():
+                break
+            # the stream outlives the request's auth check; end it once the token
+            # expires so the client reconnects (and re-authenticates)
+            if security.token_user_id(token) != user_id:
+                break
+            # woken by the broker; the timeout also covers writes made by other workers
+            if not await subscription.wait(STREAM_KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+    finally:
+        notification_broker.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_notifications(
+    request: Request,
+    session_factory=Depends(get_async_sessionmaker),
+    current_user=Depends(security.get_current_user),
+    token: str = Depends(security.oauth2_scheme),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Server-Sent Events feed of new and updated notifications.
+
+    Reconnecting clients send Last-Event-ID and get everything since that
+    event; rows near the resume point may be delivered twice, so clients
+    should upsert by notification id.
+    """
+    user_id = int(current_user.id)
+    if last_event_id:
+        since = _as_utc(decode_cursor(last_event_id)[0])
+    else:
+        since = datetime.now(timezone.utc)
+    notification_broker.check_capacity(user_id)
+    return StreamingResponse(
+        _event_stream(request, session_factory, user_id, token, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/{notification_id}/mark_read", status_code=status.HTTP_200_OK)
@@ -54,7 +190,12 @@ def mark_notification_read(
             detail="Notification not found",
         )
 
-    notif_query.update({"is_read": True}, synchronize_session=False)
+    # only a row that was still unread lowers the badge
+    changed = (
+        notif_query.filter(model.Notification.is_read == False)
+        .update({"is_read": True}, synchronize_session=False)
+    )
+    unread.record_change(db, current_user_id, -changed)
     db.commit()
     return {"detail": "Notification marked as read"}
 
@@ -74,5 +215,19 @@ def mark_all_notifications_read(
         )
         .update({"is_read": True}, synchronize_session=False)
     )
+    unread.record_change(db, current_user_id, None)
     db.commit()
     return {"detail": "All notifications marked as read"}
+
+
+@router.get("/unread_count")
+async def get_unread_count(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user=Depends(security.get_current_user),
+):
+    # answered from the per-process cache; the session only connects on a miss
+    user_id = int(current_user.id)
+    count = unread.unread_counter.get(user_id)
+    if count is None:
+        count = await db.run_sync(unread.unread_count, user_id)
+    return {"unread_count": count}
@@ -1,10 +1,16 @@
-from typing import List
+import os
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import Integer, delete, exists, func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
 
 from app.core.db import get_db
-from app.core import security
+from app.core import notifier, security, timeline
+from app.core.pagination import MAX_PAGE_SIZE, paginate, set_next_cursor
+from app.core.replicas import get_async_read_db
+from app.core.sql import upsert_insert
 import model
 from schema import (
     PostCreate,
@@ -21,48 +27,94 @@ router = APIRouter(
     tags=["Posts"],
 )
 
+# latest comments embedded per post in listings; the full list is paged via /{post_id}/comments
+COMMENT_PREVIEW_LIMIT = int(os.getenv("POST_COMMENT_PREVIEW_LIMIT", "3"))
+COMMENT_PREVIEW_MAX = int(os.getenv("POST_COMMENT_PREVIEW_MAX", "50"))
+
+
+def _bump_counter(db: Session, post_id: int, column, delta: int) -> Optional[int]:
+    # UPDATE ... SET x = x + delta, so concurrent writers never lose an increment;
+    # returns the post's owner_id, or None if the post does not exist
+    return db.execute(
+        update(model.Post)
+        .where(model.Post.id == post_id)
+        .values({column: column + delta})
+        .returning(model.Post.owner_id)
+    ).scalar()
+
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=PostResponse)
 def create_post(
     post: PostCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user=Depends(security.get_current_user),
 ):
     user_id = int(current_user.id)
-    from app.core.rate_limiter import rate_limiter
-
-    rate_limiter.check_rate_limit(
-        identifier=str(user_id),
-        endpoint="create_post",
-        limit=30,
-        window_seconds=60,
-    )
-
     new_post = model.Post(content=post.content, owner_id=user_id)
     db.add(new_post)
     db.commit()
-    db.refresh(new_post)
+    # push into followers' timelines after the response is sent
+    background_tasks.add_task(timeline.fan_out_post, new_post.id)
     return new_post
 
 
-@router.get("/", response_model=List[PostWithStats])
-def get_posts(
-    db: Session = Depends(get_db),
-    limit: int = 20,
-    offset: int = 0,
-):
-    posts = (
-        db.query(model.Post)
-        .order_by(model.Post.created_at.desc())
-        .limit(limit)
-        .offset(offset)
+def _comment_preview_limit(comments_limit: Optional[int]) -> int:
+    if comments_limit is None:
+        return COMMENT_PREVIEW_LIMIT
+    return max(0, min(comments_limit, COMMENT_PREVIEW_MAX))
+
+
+def _build_posts_with_stats(
+    db: Session,
+    posts: List[model.Post],
+    comments_limit: Optional[int] = None,
+) -> List[dict]:
+    """Build PostWithStats payloads for a page of posts in a fixed number of queries.
+
+    Like/comment counts are read from the denormalized counter columns, owners
+    are fetched in one batch and only the latest comments_limit comments of each
+    post are embedded, selected with a single windowed query for the whole page.
+    """
+    if not posts:
+        return []
+
+    post_ids = [p.id for p in posts]
+    owner_ids = {p.owner_id for p in posts}
+    preview_limit = _comment_preview_limit(comments_limit)
+
+    owner_emails = dict(
+        db.query(model.user.id, model.user.email)
+        .filter(model.user.id.in_(owner_ids))
         .all()
     )
-    result = []
-    for post in posts:
-        likes_count = len(post.likes) if post.likes is not None else 0
-        comments_count = len(post.comments) if post.comments is not None else 0
-        comments_data = [
+
+    comments_by_post = {post_id: [] for post_id in post_ids}
+    if preview_limit:
+        ranked = (
+            select(
+                model.Comment,
+                func.row_number()
+                .over(
+                    partition_by=model.Comment.post_id,
+                    order_by=(model.Comment.created_at.desc(), model.Comment.id.desc()),
+                )
+                .label("rn"),
+            )
+            .where(model.Comment.post_id.in_(post_ids))
+            .subquery()
+        )
+        latest = aliased(model.Comment, ranked)
+        comments = (
+            db.query(latest)
+            .filter(ranked.c.rn <= preview_limit)
+            .order_by(latest.created_at.asc(), latest.id.asc())
+            .all()
+        )
+    else:
+        comments = []
+    for c in comments:
+        comments_by_post[c.post_id].append(
             {
                 "id": c.id,
                 "content": c.content,
@@ -70,209 +122,154 @@ def get_posts(
                 "owner_id": c.owner_id,
                 "created_at": c.created_at,
             }
-            for c in (post.comments or [])
-        ]
-        result.append(
-            {
-                "id": post.id,
-                "content": post.content,
-                "owner_id": post.owner_id,
-                "owner_email": post.owner.email if post.owner is not None else None,
-                "created_at": post.created_at,
-                "likes_count": likes_count,
-                "comments_count": comments_count,
-                "comments": comments_data,
-            }
         )
-    return result
 
+    return [
+        {
+            "id": post.id,
+            "content": post.content,
+            "owner_id": post.owner_id,
+            "owner_email": owner_emails.get(post.owner_id),
+            "created_at": post.created_at,
+            "likes_count": post.likes_count,
+            "comments_count": post.comments_count,
+            "comments": comments_by_post[post.id],
+        }
+        for post in posts
+    ]
 
-@router.get("/feed", response_model=List[PostWithStats])
-def get_feed(
-    db: Session = Depends(get_db),
-    current_user=Depends(security.get_current_user),
-    limit: int = 20,
-    offset: int = 0,
-):
-    current_user_id = int(current_user.id)
 
-    # find users current_user follows
-    follow_rows = (
-        db.query(model.Follow)
-        .filter(model.Follow.follower_id == current_user_id)
-        .all()
+def _post_page(
+    db: Session,
+    owner_id: Optional[int],
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    comments_limit: Optional[int],
+) -> Tuple[List[dict], Optional[str]]:
+    query = db.query(model.Post)
+    if owner_id is not None:
+        query = query.filter(model.Post.owner_id == owner_id)
+    posts, next_cursor = paginate(
+        query,
+        model.Post.created_at,
+        model.Post.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
     )
-    followed_ids = [f.following_id for f in follow_rows]
+    return _build_posts_with_stats(db, posts, comments_limit), next_cursor
 
-    if not followed_ids:
-        return []
 
-    posts = (
-        db.query(model.Post)
-        .filter(model.Post.owner_id.in_(followed_ids))
-        .order_by(model.Post.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+def _feed_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    comments_limit: Optional[int],
+) -> Tuple[List[dict], Optional[str]]:
+    # timeline filled by create_post/toggle_follow, merged with pulled celebrity posts
+    posts, next_cursor = timeline.read_feed(
+        db,
+        user_id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
     )
+    return _build_posts_with_stats(db, posts, comments_limit), next_cursor
 
-    result = []
-    for post in posts:
-        likes_count = len(post.likes) if post.likes is not None else 0
-        comments_count = len(post.comments) if post.comments is not None else 0
-        comments_data = [
-            {
-                "id": c.id,
-                "content": c.content,
-                "post_id": c.post_id,
-                "owner_id": c.owner_id,
-                "created_at": c.created_at,
-            }
-            for c in (post.comments or [])
-        ]
 
-        result.append(
-            {
-                "id": post.id,
-                "content": post.content,
-                "owner_id": post.owner_id,
-                "owner_email": post.owner.email if post.owner is not None else None,
-                "created_at": post.created_at,
-                "likes_count": likes_count,
-                "comments_count": comments_count,
-                "comments": comments_data,
-            }
+def _single_post(db: Session, post_id: int, comments_limit: Optional[int]) -> dict:
+    post = db.query(model.Post).filter(model.Post.id == post_id).first()
+    if not post:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found",
         )
+    return _build_posts_with_stats(db, [post], comments_limit)[0]
+
+
+# The read endpoints below are async: the sync query helpers above run on the
+# async connection through AsyncSession.run_sync, so they never occupy a
+# threadpool worker while waiting on the database. They read from a replica
+# when one is configured.
 
+
+@router.get("/", response_model=List[PostWithStats])
+async def get_posts(
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    comments_limit: Optional[int] = None,
+):
+    result, next_cursor = await db.run_sync(
+        _post_page, None, limit, offset, cursor, comments_limit
+    )
+    set_next_cursor(response, next_cursor)
     return result
 
 
-@router.get("/me", response_model=List[PostWithStats])
-def get_my_posts(
-    db: Session = Depends(get_db),
+@router.get("/feed", response_model=List[PostWithStats])
+async def get_feed(
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user=Depends(security.get_current_user),
-    limit: int = 20,
-    offset: int = 0,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    comments_limit: Optional[int] = None,
 ):
-    posts = (
-        db.query(model.Post)
-        .filter(model.Post.owner_id == int(current_user.id))
-        .order_by(model.Post.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+    result, next_cursor = await db.run_sync(
+        _feed_page, int(current_user.id), limit, offset, cursor, comments_limit
     )
+    set_next_cursor(response, next_cursor)
+    return result
 
-    result = []
-    for post in posts:
-        likes_count = len(post.likes) if post.likes is not None else 0
-        comments_count = len(post.comments) if post.comments is not None else 0
-        comments_data = [
-            {
-                "id": c.id,
-                "content": c.content,
-                "post_id": c.post_id,
-                "owner_id": c.owner_id,
-                "created_at": c.created_at,
-            }
-            for c in (post.comments or [])
-        ]
-
-        result.append(
-            {
-                "id": post.id,
-                "content": post.content,
-                "owner_id": post.owner_id,
-                "owner_email": post.owner.email if post.owner is not None else None,
-                "created_at": post.created_at,
-                "likes_count": likes_count,
-                "comments_count": comments_count,
-                "comments": comments_data,
-            }
-        )
 
+@router.get("/me", response_model=List[PostWithStats])
+async def get_my_posts(
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user=Depends(security.get_current_user),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    comments_limit: Optional[int] = None,
+):
+    result, next_cursor = await db.run_sync(
+        _post_page, int(current_user.id), limit, offset, cursor, comments_limit
+    )
+    set_next_cursor(response, next_cursor)
     return result
 
 
 @router.get("/user/{user_id}", response_model=List[PostWithStats])
-def get_user_posts(
+async def get_user_posts(
     user_id: int,
-    db: Session = Depends(get_db),
-    limit: int = 20,
-    offset: int = 0,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    comments_limit: Optional[int] = None,
 ):
-    posts = (
-        db.query(model.Post)
-        .filter(model.Post.owner_id == user_id)
-        .order_by(model.Post.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+    result, next_cursor = await db.run_sync(
+        _post_page, user_id, limit, offset, cursor, comments_limit
     )
-
-    result = []
-    for post in posts:
-        likes_count = len(post.likes) if post.likes is not None else 0
-        comments_count = len(post.comments) if post.comments is not None else 0
-        comments_data = [
-            {
-                "id": c.id,
-                "content": c.content,
-                "post_id": c.post_id,
-                "owner_id": c.owner_id,
-                "created_at": c.created_at,
-            }
-            for c in (post.comments or [])
-        ]
-
-        result.append(
-            {
-                "id": post.id,
-                "content": post.content,
-                "owner_id": post.owner_id,
-                "owner_email": post.owner.email if post.owner is not None else None,
-                "created_at": post.created_at,
-                "likes_count": likes_count,
-                "comments_count": comments_count,
-                "comments": comments_data,
-            }
-        )
-
+    set_next_cursor(response, next_cursor)
     return result
 
 
 @router.get("/{id}", response_model=PostWithStats)
-def get_post(id: int, db: Session = Depends(get_db)):
-    post = db.query(model.Post).filter(model.Post.id == id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found",
-        )
-
-    likes_count = len(post.likes) if post.likes is not None else 0
-    comments_count = len(post.comments) if post.comments is not None else 0
-    comments_data = [
-        {
-            "id": c.id,
-            "content": c.content,
-            "post_id": c.post_id,
-            "owner_id": c.owner_id,
-            "created_at": c.created_at,
-        }
-        for c in (post.comments or [])
-    ]
-
-    return {
-        "id": post.id,
-        "content": post.content,
-        "owner_id": post.owner_id,
-        "owner_email": post.owner.email if post.owner is not None else None,
-        "created_at": post.created_at,
-        "likes_count": likes_count,
-        "comments_count": comments_count,
-        "comments": comments_data,
-    }
+async def get_post(
+    id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    comments_limit: Optional[int] = None,
+):
+    return await db.run_sync(_single_post, id, comments_limit)
 
 
 @router.put("/{id}", response_model=PostResponse)
@@ -297,9 +294,8 @@ def update_post(
             detail="Not authorized to modify this post",
         )
 
-    post_query.update({"content": updated_post.content}, synchronize_session=False)
+    post_query.update({"content": updated_post.content}, synchronize_session="evaluate")
     db.commit()
-    db.refresh(post)
     return post
 
 
@@ -341,17 +337,9 @@ def create_comment(
     current_user=Depends(security.get_current_user),
 ):
     user_id = int(current_user.id)
-    from app.core.rate_limiter import rate_limiter
-
-    rate_limiter.check_rate_limit(
-        identifier=str(user_id),
-        endpoint="create_comment",
-        limit=60,
-        window_seconds=60,
-    )
-
-    post = db.query(model.Post).filter(model.Post.id == post_id).first()
-    if not post:
+    owner_id = _bump_counter(db, post_id, model.Post.comments_count, 1)
+    if owner_id is None:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Post not found",
@@ -360,38 +348,87 @@ def create_comment(
     new_comment = model.Comment(
         content=comment.content,
         post_id=post_id,
-        owner_id=int(current_user.id),
+        owner_id=user_id,
     )
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
-    # notify post owner if different from commenter
-    if post.owner_id != int(current_user.id):
-        notif = model.Notification(
-            user_id=post.owner_id,
+    # notify post owner if different from commenter, once the comment commits
+    if owner_id != user_id:
+        notifier.notify(
+            db,
+            user_id=owner_id,
             type="comment",
-            message=f"New comment on your post (id={post.id})",
+            message=f"New comment on your post (id={post_id})",
+            actor_id=user_id,
+            post_id=post_id,
         )
-        db.add(notif)
-        db.commit()
+    db.commit()
     return new_comment
 
 
-@router.get("/{post_id}/comments", response_model=List[CommentResponse])
-def get_comments_for_post(
+@router.delete("/{post_id}/comments/{comment_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_comment(
     post_id: int,
+    comment_id: int,
     db: Session = Depends(get_db),
-    limit: int = 20,
-    offset: int = 0,
+    current_user=Depends(security.get_current_user),
 ):
-    comments = (
+    comment = (
         db.query(model.Comment)
-        .filter(model.Comment.post_id == post_id)
-        .order_by(model.Comment.created_at.asc())
-        .limit(limit)
-        .offset(offset)
-        .all()
+        .filter(model.Comment.id == comment_id, model.Comment.post_id == post_id)
+        .first()
+    )
+    if not comment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Comment not found",
+        )
+
+    # comment authors and the post owner may delete a comment
+    if int(current_user.id) not in (comment.owner_id, comment.post.owner_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete this comment",
+        )
+
+    # a concurrent delete of the same comment may have won; only one of them decrements
+    deleted = db.execute(
+        delete(model.Comment).where(model.Comment.id == comment_id).returning(model.Comment.id)
+    ).first()
+    if deleted:
+        _bump_counter(db, post_id, model.Post.comments_count, -1)
+    db.commit()
+    return None
+
+
+def _comment_page(
+    db: Session,
+    post_id: int,
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+) -> Tuple[List[model.Comment], Optional[str]]:
+    return paginate(
+        db.query(model.Comment).filter(model.Comment.post_id == post_id),
+        model.Comment.created_at,
+        model.Comment.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        descending=False,
     )
+
+
+@router.get("/{post_id}/comments", response_model=List[CommentResponse])
+async def get_comments_for_post(
+    post_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    comments, next_cursor = await db.run_sync(_comment_page, post_id, limit, offset, cursor)
+    set_next_cursor(response, next_cursor)
     return comments
 
 
@@ -404,36 +441,50 @@ def toggle_like(
     db: Session = Depends(get_db),
     current_user=Depends(security.get_current_user),
 ):
-    post = db.query(model.Post).filter(model.Post.id == post_id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found",
-        )
-
-    like_query = db.query(model.Like).filter(
-        model.Like.post_id == post_id,
-        model.Like.user_id == int(current_user.id),
-    )
-    existing_like = like_query.first()
+    user_id = int(current_user.id)
 
-    if existing_like:
-        # user already liked -> unlike (dislike)
-        like_query.delete(synchronize_session=False)
+    # user already liked -> unlike (dislike); the DELETE tells us whether a like existed
+    unliked = db.execute(
+        delete(model.Like)
+        .where(model.Like.post_id == post_id, model.Like.user_id == user_id)
+        .returning(model.Like.id)
+    ).first()
+    if unliked:
+        _bump_counter(db, post_id, model.Post.likes_count, -1)
         db.commit()
         return {"status": "unliked"}
 
-    # not liked yet -> like
-    new_like = model.Like(post_id=post_id, user_id=int(current_user.id))
-    db.add(new_like)
-    db.commit()
-    # notify post owner if different from liker
-    if post.owner_id != int(current_user.id):
-        notif = model.Notification(
-            user_id=post.owner_id,
+    # not liked yet -> like; a concurrent like of the same post hits the unique constraint
+    liked = db.execute(
+        upsert_insert(db, model.Like)
+        .from_select(
+            ["post_id", "user_id"],
+            select(literal(post_id, Integer), literal(user_id, Integer)).where(
+                exists().where(model.Post.id == post_id)
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+        .returning(model.Like.id)
+    ).first()
+    if not liked:
+        db.rollback()
+        if db.get(model.Post, post_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Post not found",
+            )
+        return {"status": "liked"}
+
+    owner_id = _bump_counter(db, post_id, model.Post.likes_count, 1)
+    # notify post owner if different from liker, once the like commits
+    if owner_id != user_id:
+        notifier.notify(
+            db,
+            user_id=owner_id,
             type="like",
-            message=f"Your post (id={post.id}) got a new like",
+            message=f"Your post (id={post_id}) got a new like",
+            actor_id=user_id,
+            post_id=post_id,
         )
-        db.add(notif)
-        db.commit()
+    db.commit()
     return {"status": "liked"}
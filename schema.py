@@ -103,16 +103,20 @@ class UserBasic(BaseModel):
 
 
 class ProfileResponse(BaseModel):
+    # follower/followee lists are paged via /profile/{user_id}/followers and /following
     user: UserBasic
     followers_count: int
     following_count: int
-    followers: List[UserBasic]
-    following: List[UserBasic]
 
     class Config:
         from_attributes = True
 
 
+class SuggestionResponse(BaseModel):
+    user: UserBasic
+    mutual_count: int
+
+
 class ConversationResponse(BaseModel):
     id: int
     user1_id: int
@@ -149,6 +153,14 @@ class NotificationResponse(BaseModel):
     message: str
     created_at: datetime
     is_read: bool
+    group_key: str | None = None
+    actor_count: int = 1
+    recent_actor_ids: List[int] = []
+    updated_at: datetime | None = None
+    actor_id: int | None = None
+    post_id: int | None = None
+    conversation_id: int | None = None
+    actor: UserBasic | None = None
 
     class Config:
         from_attributes = True
\ No newline at end of file
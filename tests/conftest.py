@@ -1,11 +1,20 @@
 import os
 
+# write notifications in the request transaction so tests can read them right away
+os.environ.setdefault("NOTIFICATIONS_SYNC", "true")
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 
 from app.main import app
-from app.core.db import get_db
-from database import SessionLocal
+from app.core.db import get_async_db, get_async_sessionmaker, get_db
+from app.core.replicas import get_async_read_db
+from app.core.social_graph import social_graph
+from app.core.unread import unread_counter
+from app.core.user_cache import user_cache
+from database import SQLALCHEMY_ASYNC_DATABASE_URL, SessionLocal
 
 
 # Ensure encryption key is set for tests (used by app.core.crypto_util)
@@ -23,7 +32,23 @@ def override_get_db():
         db.close()
 
 
+# TestClient runs every request on a fresh event loop, so async connections
+# must not be pooled across requests
+test_async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=test_async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_async_read_db] = override_get_async_db
+app.dependency_overrides[get_async_sessionmaker] = lambda: TestingAsyncSessionLocal
 
 
 @pytest.fixture(scope="session")
@@ -38,3 +63,16 @@ def db_session():
         yield db
     finally:
         db.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_in_memory_caches():
+    # tests write follows and notifications straight through db_session, bypassing
+    # the handlers that keep these caches in sync
+    social_graph.clear()
+    unread_counter.clear()
+    user_cache.clear()
+    yield
+    social_graph.clear()
+    unread_counter.clear()
+    user_cache.clear()
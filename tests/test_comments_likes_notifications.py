@@ -68,3 +68,18 @@ def test_comments_likes_and_notifications(client, db_session):
     types = {n["type"] for n in notifications}
     assert "comment" in types
     assert "like" in types
+
+
+def test_writes_on_missing_rows_and_duplicate_registration(client, db_session):
+    actor = create_user(db_session, "upsert_actor@example.com", "actor-pass")
+    headers = {"Authorization": f"Bearer {get_token(client, actor.email, 'actor-pass')}"}
+
+    assert client.post("/posts/999999999/like", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert (
+        client.post("/posts/999999999/comments", json={"content": "x"}, headers=headers).status_code
+        == status.HTTP_404_NOT_FOUND
+    )
+    assert client.post("/follow/999999999", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+
+    resp = client.post("/create_user", json={"email": actor.email, "password": "another"})
+    assert resp.status_code == status.HTTP_409_CONFLICT
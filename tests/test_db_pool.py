@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+import main as root_main
+from app.api import metrics
+from app.core import db_metrics
+from app.core.db_metrics import InstrumentedQueuePool, instrument_pool
+
+
+def test_pool_metrics_track_usage_wait_and_saturation(tmp_path, caplog, monkeypatch):
+    monkeypatch.setattr(db_metrics, "SLOW_CHECKOUT_SECONDS", 0.05)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+    metrics = instrument_pool(engine.pool, "test_pool")
+
+    with caplog.at_level(logging.WARNING, logger=db_metrics.__name__):
+        first = engine.connect()
+        assert metrics.snapshot()["in_use"] == 1
+
+        # a second checkout has to wait until the first connection is returned
+        releaser = threading.Timer(0.1, first.close)
+        releaser.start()
+        with engine.connect():
+            snapshot = metrics.snapshot()
+        releaser.join()
+
+    assert snapshot["checkouts"] == 2
+    assert snapshot["in_use"] == 1
+    assert snapshot["in_use_max"] == 1
+    assert snapshot["checkout_wait_max_ms"] >= 50
+    assert snapshot["slow_checkouts"] == 1
+    assert metrics.snapshot()["in_use"] == 0
+    assert any("saturated" in record.getMessage() for record in caplog.records)
+
+    # waiting longer than pool_timeout is counted as a timeout
+    with engine.connect():
+        started = time.perf_counter()
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        assert time.perf_counter() - started >= 0.2
+    assert metrics.snapshot()["checkout_timeouts"] == 1
+    engine.dispose()
+    db_metrics._registry.pop("test_pool", None)
+
+
+def test_connection_errors_are_not_counted_as_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'missing' / 'pool.db'}", poolclass=InstrumentedQueuePool, pool_size=1
+    )
+    metrics = instrument_pool(engine.pool, "test_pool_errors")
+    with pytest.raises(OperationalError):
+        engine.connect()
+    assert metrics.snapshot()["checkout_timeouts"] == 0
+    engine.dispose()
+    db_metrics._registry.pop("test_pool_errors", None)
+
+
+def test_db_pool_metrics_endpoint(client, monkeypatch):
+    assert client.get("/metrics/db_pool").status_code == status.HTTP_403_FORBIDDEN
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics/db_pool", headers={"X-Metrics-Token": "wrong"}).status_code == 403
+
+    resp = client.get("/metrics/db_pool", headers={"X-Metrics-Token": "s3cret"})
+    assert resp.status_code == status.HTTP_200_OK
+    body = resp.json()
+    assert {"primary", "primary_async"} <= set(body)
+    assert {"in_use", "overflow", "checkout_wait_avg_ms"} <= set(body["primary"])
+
+    # the root app serves the same protected endpoint
+    root_client = TestClient(root_main.app)
+    assert root_client.get("/metrics/db_pool").status_code == 403
+    assert root_client.get("/metrics/db_pool", headers={"X-Metrics-Token": "s3cret"}).status_code == 200
@@ -56,3 +56,40 @@ def test_follow_and_profiles(client, db_session):
     assert other_resp.status_code == status.HTTP_200_OK
     other_data = other_resp.json()
     assert other_data["user"]["id"] == u2.id
+
+
+def test_profile_counts_and_paginated_follow_lists(client, db_session):
+    star = create_user(db_session, "follow_pages_star@example.com", "pass0")
+    fans = [
+        create_user(db_session, f"follow_pages_fan{i}@example.com", "pass")
+        for i in range(5)
+    ]
+    star_id = star.id
+    fan_ids = [f.id for f in fans]
+    for fan_id in fan_ids:
+        db_session.add(model.Follow(follower_id=fan_id, following_id=star_id))
+    db_session.add(model.Follow(follower_id=star_id, following_id=fan_ids[0]))
+    db_session.commit()
+
+    profile = client.get(f"/profile/{star_id}").json()
+    assert profile["followers_count"] == 5
+    assert profile["following_count"] == 1
+    assert "followers" not in profile
+
+    seen = []
+    resp = client.get(f"/profile/{star_id}/followers", params={"limit": 2})
+    while True:
+        assert resp.status_code == status.HTTP_200_OK
+        seen.extend(u["id"] for u in resp.json())
+        if "X-Next-Cursor" not in resp.headers:
+            break
+        resp = client.get(
+            f"/profile/{star_id}/followers",
+            params={"limit": 2, "cursor": resp.headers["X-Next-Cursor"]},
+        )
+    assert seen == list(reversed(fan_ids))
+
+    following = client.get(f"/profile/{star_id}/following").json()
+    assert [u["id"] for u in following] == [fan_ids[0]]
+
+    assert client.get("/profile/999999999/followers").status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,140 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, status
+
+import model
+import notifications
+from app.core import notifier, security
+from app.core.broker import NotificationBroker, notification_broker
+from app.core.pagination import encode_cursor
+from database import SessionLocal
+from tests.conftest import TestingAsyncSessionLocal
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+class _ConnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+def _parse(chunk: str):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["id"], json.loads(fields["data"])
+
+
+def _write(user_id: int, message: str) -> None:
+    db = SessionLocal()
+    notifier.write_notifications(
+        db,
+        [{"user_id": user_id, "type": "follow", "message": message, "created_at": datetime.now(timezone.utc)}],
+    )
+    db.commit()
+    db.close()
+
+
+def test_stream_resumes_after_last_event_and_wakes_on_new_rows(db_session, monkeypatch):
+    monkeypatch.setattr(notifications, "STREAM_GRACE_SECONDS", 0)
+    user = create_user(db_session, "stream_user@example.com", "pass")
+    user_id = user.id
+    old = datetime.now(timezone.utc) - timedelta(minutes=5)
+    seen = model.Notification(user_id=user_id, type="follow", message="seen", created_at=old, updated_at=old)
+    missed = model.Notification(
+        user_id=user_id,
+        type="follow",
+        message="missed",
+        created_at=old + timedelta(seconds=1),
+        updated_at=old + timedelta(seconds=1),
+    )
+    db_session.add_all([seen, missed])
+    db_session.commit()
+
+    token = security.create_access_token({"user_id": user_id})
+
+    async def consume():
+        stream = notifications._event_stream(
+            _ConnectedRequest(), TestingAsyncSessionLocal, user_id, token, old + timedelta(microseconds=1)
+        )
+        # a stream whose body was never sent holds no slot
+        assert notification_broker.connections(user_id) == 0
+        try:
+            first = _parse(await stream.__anext__())
+            assert notification_broker.connections(user_id) == 1
+            # written from another thread while the stream is waiting on the broker
+            writer = asyncio.get_running_loop().run_in_executor(None, _write, user_id, "live")
+            second = _parse(await asyncio.wait_for(stream.__anext__(), timeout=5))
+            await writer
+            return first, second
+        finally:
+            await stream.aclose()
+
+    (first_id, first), (_, second) = asyncio.run(consume())
+    assert first["message"] == "missed"
+    assert first_id == encode_cursor(old + timedelta(seconds=1), first["id"])
+    assert second["message"] == "live"
+    assert notification_broker.connections(user_id) == 0
+
+
+def test_stream_connection_limit_and_bad_last_event_id(client, db_session):
+    broker = NotificationBroker(max_connections=2)
+
+    async def subscribe_three():
+        broker.subscribe(1)
+        broker.subscribe(1)
+        broker.subscribe(1)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(subscribe_three())
+    assert exc.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    user = create_user(db_session, "stream_bad_id@example.com", "pass")
+    token = get_token(client, user.email, "pass")
+    resp = client.get(
+        "/notifications/stream",
+        headers={"Authorization": f"Bearer {token}", "Last-Event-ID": "not-a-cursor"},
+    )
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_stream_ends_once_the_token_expires(db_session, monkeypatch):
+    user = create_user(db_session, "stream_expiry@example.com", "pass")
+    user_id = user.id
+    token = security.create_access_token({"user_id": user_id})
+    valid = [True]
+    monkeypatch.setattr(security, "token_user_id", lambda t: user_id if t == token and valid[0] else None)
+    monkeypatch.setattr(notifications, "STREAM_KEEPALIVE_SECONDS", 0.01)
+
+    async def consume():
+        stream = notifications._event_stream(
+            _ConnectedRequest(), TestingAsyncSessionLocal, user_id, token, datetime.now(timezone.utc)
+        )
+        assert await stream.__anext__() == ": keepalive\n\n"
+        valid[0] = False
+        return [chunk async for chunk in stream]
+
+    assert asyncio.run(consume()) == []
+    assert notification_broker.connections(user_id) == 0
@@ -0,0 +1,294 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import status
+from sqlalchemy import text
+
+import model
+from app.core import notifier
+from database import SessionLocal
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def _notification_types(db, user_id):
+    return sorted(
+        t for (t,) in db.query(model.Notification.type).filter(model.Notification.user_id == user_id)
+    )
+
+
+def test_queued_notifications_are_written_after_commit_only(client, db_session, monkeypatch):
+    monkeypatch.setattr(notifier, "NOTIFICATIONS_SYNC", False)
+    owner = create_user(db_session, "writer_owner@example.com", "pass1")
+    actor = create_user(db_session, "writer_actor@example.com", "pass2")
+    owner_id = owner.id
+    headers = {"Authorization": f"Bearer {get_token(client, actor.email, 'pass2')}"}
+    post = model.Post(content="queued", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+
+    assert client.post(f"/posts/{post.id}/like", headers=headers).json()["status"] == "liked"
+    client.post(f"/posts/{post.id}/comments", json={"content": "hi"}, headers=headers)
+
+    # a rolled back transaction never reaches the queue
+    rolled_back = SessionLocal()
+    notifier.notify(rolled_back, owner_id, "follow", "never sent")
+    rolled_back.rollback()
+    rolled_back.close()
+
+    notifier.notification_writer.stop()
+    assert _notification_types(db_session, owner_id) == ["comment", "like"]
+
+
+def test_writer_flushes_full_batches_and_drains_on_stop(db_session):
+    user = create_user(db_session, "writer_batch@example.com", "pass")
+    user_id = user.id
+    writer = notifier.NotificationWriter(batch_size=3, flush_interval=60)
+    now = datetime.now(timezone.utc)
+    writer.enqueue(
+        [{"user_id": user_id, "type": "follow", "message": str(i), "created_at": now} for i in range(7)]
+    )
+    writer.stop()
+    assert writer.written == 7 and writer.failed == 0
+    assert len(_notification_types(db_session, user_id)) == 7
+
+
+def test_writer_drops_only_the_rows_that_fail(db_session, monkeypatch):
+    user = create_user(db_session, "writer_bad_row@example.com", "pass")
+    user_id = user.id
+    attempts = []
+    write = notifier.write_notifications
+    monkeypatch.setattr(
+        notifier, "write_notifications", lambda db, rows: attempts.append(len(rows)) or write(db, rows)
+    )
+    writer = notifier.NotificationWriter(batch_size=10, flush_interval=60)
+    now = datetime.now(timezone.utc)
+    rows = [{"user_id": user_id, "type": "follow", "message": str(i), "created_at": now} for i in range(3)]
+    # NOT NULL message: fails every time it is written
+    rows.insert(1, {"user_id": user_id, "type": "follow", "message": None, "created_at": now})
+    # written from this thread, so the batch is not split by the worker's timing
+    writer._write(rows)
+
+    assert attempts == [4, 4, 1, 1, 1, 1]
+    assert writer.written == 3 and writer.failed == 1
+    assert len(_notification_types(db_session, user_id)) == 3
+
+
+def test_likes_on_one_post_coalesce_until_read(client, db_session):
+    owner = create_user(db_session, "coalesce_owner@example.com", "pass0")
+    fans = [create_user(db_session, f"coalesce_fan{i}@example.com", "pass") for i in range(4)]
+    owner_id, fan_ids = owner.id, [f.id for f in fans]
+    post = model.Post(content="viral", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+
+    for fan in fans:
+        headers = {"Authorization": f"Bearer {get_token(client, fan.email, 'pass')}"}
+        client.post(f"/posts/{post_id}/like", headers=headers)
+
+    owner_headers = {"Authorization": f"Bearer {get_token(client, owner.email, 'pass0')}"}
+    listed = client.get("/notifications/", headers=owner_headers).json()
+    assert len(listed) == 1
+    group = listed[0]
+    assert group["actor_count"] == 4
+    assert group["recent_actor_ids"] == [fan_ids[3], fan_ids[2], fan_ids[1]]
+    assert group["message"] == f"{fan_ids[3]} and 3 others liked your post (id={post_id})"
+
+    # once read, the next like starts a new notification
+    client.post(f"/notifications/{group['id']}/mark_read", headers=owner_headers)
+    headers = {"Authorization": f"Bearer {get_token(client, fans[0].email, 'pass')}"}
+    client.post(f"/posts/{post_id}/like", headers=headers)
+    client.post(f"/posts/{post_id}/like", headers=headers)
+    listed = client.get("/notifications/", headers=owner_headers).json()
+    assert [n["actor_count"] for n in listed] == [1, 4]
+
+
+def test_notifications_carry_actor_and_target_and_go_with_the_post(client, db_session):
+    owner = create_user(db_session, "typed_owner@example.com", "pass0")
+    fan = create_user(db_session, "typed_fan@example.com", "pass1")
+    owner_id, fan_id, fan_email = owner.id, fan.id, fan.email
+    post = model.Post(content="typed", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+
+    fan_headers = {"Authorization": f"Bearer {get_token(client, fan_email, 'pass1')}"}
+    client.post(f"/posts/{post_id}/comments", json={"content": "hi"}, headers=fan_headers)
+
+    owner_headers = {"Authorization": f"Bearer {get_token(client, owner.email, 'pass0')}"}
+    (listed,) = client.get("/notifications/", headers=owner_headers).json()
+    assert (listed["actor_id"], listed["post_id"], listed["conversation_id"]) == (fan_id, post_id, None)
+    assert listed["actor"] == {"id": fan_id, "email": fan_email}
+
+    # ON DELETE CASCADE removes the post's notifications (SQLite needs it switched on)
+    sqlite = db_session.get_bind().dialect.name == "sqlite"
+    if sqlite:
+        db_session.execute(text("PRAGMA foreign_keys=ON"))
+    db_session.query(model.Post).filter(model.Post.id == post_id).delete(synchronize_session=False)
+    db_session.commit()
+    if sqlite:
+        db_session.execute(text("PRAGMA foreign_keys=OFF"))
+    assert db_session.query(model.Notification).filter(model.Notification.post_id == post_id).count() == 0
+
+
+def test_queued_batch_survives_a_deleted_target(db_session):
+    owner = create_user(db_session, "orphan_owner@example.com", "pass0")
+    fan = create_user(db_session, "orphan_fan@example.com", "pass1")
+    owner_id, fan_id = owner.id, fan.id
+    post = model.Post(content="deleted before the flush", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"user_id": owner_id, "type": "like", "message": "liked", "actor_id": fan_id,
+         "post_id": post_id, "group_key": f"like:{post_id}", "created_at": now},
+        {"user_id": owner_id, "type": "follow", "message": "followed", "actor_id": fan_id,
+         "created_at": now},
+    ]
+    # the post goes away while its like notification waits in the queue
+    db_session.query(model.Post).filter(model.Post.id == post_id).delete(synchronize_session=False)
+    db_session.commit()
+
+    writer = notifier.NotificationWriter(batch_size=10, flush_interval=60)
+    writer._write(rows)
+    assert writer.failed == 0
+    assert _notification_types(db_session, owner_id) == ["follow"]
+
+
+def _like(owner_id, fan_id, post_id, at):
+    return {
+        "user_id": owner_id,
+        "type": "like",
+        "message": f"{fan_id} liked your post (id={post_id})",
+        "actor_id": fan_id,
+        "post_id": post_id,
+        "group_key": f"like:{post_id}",
+        "created_at": at,
+    }
+
+
+def test_group_opened_concurrently_is_merged_not_duplicated(db_session, monkeypatch):
+    owner = create_user(db_session, "group_race_owner@example.com", "pass0")
+    fans = [create_user(db_session, f"group_race_fan{i}@example.com", "pass") for i in range(2)]
+    owner_id, fan_ids = owner.id, [f.id for f in fans]
+    post = model.Post(content="raced group", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    now = datetime.now(timezone.utc)
+
+    notifier.write_notifications(db_session, [_like(owner_id, fan_ids[0], post_id, now)])
+    db_session.commit()
+
+    # the second writer looked for the open group before the first one committed it
+    open_groups = notifier._open_groups
+    lookups = []
+
+    def missing_on_first_lookup(db, keys):
+        lookups.append(keys)
+        return {} if len(lookups) == 1 else open_groups(db, keys)
+
+    monkeypatch.setattr(notifier, "_open_groups", missing_on_first_lookup)
+    db = SessionLocal()
+    notifier.write_notifications(db, [_like(owner_id, fan_ids[1], post_id, now)])
+    db.commit()
+    db.close()
+    assert len(lookups) == 2
+
+    (row,) = db_session.query(model.Notification).filter(model.Notification.user_id == owner_id).all()
+    assert row.actor_count == 2 and row.recent_actor_ids == [fan_ids[1], fan_ids[0]]
+
+
+def test_repeat_actor_outside_the_recent_ones_counts_once(db_session):
+    owner = create_user(db_session, "group_repeat_owner@example.com", "pass0")
+    fans = [create_user(db_session, f"group_repeat_fan{i}@example.com", "pass") for i in range(4)]
+    owner_id, fan_ids = owner.id, [f.id for f in fans]
+    post = model.Post(content="liked again", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    now = datetime.now(timezone.utc)
+
+    for fan_id in fan_ids:
+        notifier.write_notifications(db_session, [_like(owner_id, fan_id, post_id, now)])
+        db_session.commit()
+    # fan 0 is no longer among the 3 recent actors when they like again
+    notifier.write_notifications(db_session, [_like(owner_id, fan_ids[0], post_id, now)])
+    db_session.commit()
+
+    (row,) = db_session.query(model.Notification).filter(model.Notification.user_id == owner_id).all()
+    assert row.actor_count == 4
+    assert row.recent_actor_ids == [fan_ids[0], fan_ids[3], fan_ids[2]]
+
+
+def test_stale_open_group_is_closed_and_a_new_one_starts(db_session, monkeypatch):
+    monkeypatch.setattr(notifier, "NOTIFICATION_COALESCE_WINDOW_SECONDS", 60)
+    owner = create_user(db_session, "group_stale_owner@example.com", "pass0")
+    fan = create_user(db_session, "group_stale_fan@example.com", "pass1")
+    owner_id, fan_id = owner.id, fan.id
+    post = model.Post(content="stale group", owner_id=owner_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    now = datetime.now(timezone.utc)
+
+    notifier.write_notifications(db_session, [_like(owner_id, fan_id, post_id, now - timedelta(hours=1))])
+    notifier.write_notifications(db_session, [_like(owner_id, fan_id, post_id, now)])
+    db_session.commit()
+
+    group_keys = [
+        key
+        for (key,) in db_session.query(model.Notification.group_key)
+        .filter(model.Notification.user_id == owner_id)
+        .order_by(model.Notification.created_at)
+    ]
+    assert group_keys == [None, f"like:{post_id}"]
+
+
+def test_notification_pages_stay_stable_while_groups_merge(client, db_session):
+    owner = create_user(db_session, "group_pages_owner@example.com", "pass0")
+    fan = create_user(db_session, "group_pages_fan@example.com", "pass1")
+    owner_id, fan_id = owner.id, fan.id
+    posts = [model.Post(content=f"paged {i}", owner_id=owner_id) for i in range(3)]
+    db_session.add_all(posts)
+    db_session.commit()
+    post_ids = [p.id for p in posts]
+    start = datetime.now(timezone.utc) - timedelta(minutes=10)
+    for i, post_id in enumerate(post_ids):
+        notifier.write_notifications(db_session, [_like(owner_id, fan_id, post_id, start + timedelta(minutes=i))])
+    db_session.commit()
+
+    headers = {"Authorization": f"Bearer {get_token(client, owner.email, 'pass0')}"}
+    first = client.get("/notifications/", params={"limit": 2}, headers=headers)
+    # the oldest group, on the next page, gets new activity in between
+    notifier.write_notifications(db_session, [_like(owner_id, owner_id, post_ids[0], datetime.now(timezone.utc))])
+    db_session.commit()
+    second = client.get(
+        "/notifications/", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]}, headers=headers
+    )
+
+    listed = [n["post_id"] for n in first.json() + second.json()]
+    assert listed == list(reversed(post_ids))
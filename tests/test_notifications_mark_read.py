@@ -65,3 +65,34 @@ def test_notifications_mark_read_and_mark_all(client, db_session):
         headers={"Authorization": f"Bearer {token_user}"},
     )
     assert mark_all_resp.status_code == status.HTTP_200_OK
+
+
+def test_unread_count_tracks_writers_and_mark_read(client, db_session):
+    user = create_user(db_session, "unread_owner@example.com", "pass1")
+    fans = [create_user(db_session, f"unread_fan{i}@example.com", "pass") for i in range(3)]
+    user_id = user.id
+    headers = {"Authorization": f"Bearer {get_token(client, user.email, 'pass1')}"}
+    post = model.Post(content="badge", owner_id=user_id)
+    db_session.add(post)
+    db_session.commit()
+
+    def unread():
+        resp = client.get("/notifications/unread_count", headers=headers)
+        assert resp.status_code == status.HTTP_200_OK
+        return resp.json()["unread_count"]
+
+    assert unread() == 0
+    for fan in fans:
+        fan_headers = {"Authorization": f"Bearer {get_token(client, fan.email, 'pass')}"}
+        client.post(f"/follow/{user_id}", headers=fan_headers)
+        client.post(f"/posts/{post.id}/like", headers=fan_headers)
+    # three follows plus one coalesced like notification
+    assert unread() == 4
+
+    first_id = client.get("/notifications/", headers=headers).json()[0]["id"]
+    client.post(f"/notifications/{first_id}/mark_read", headers=headers)
+    client.post(f"/notifications/{first_id}/mark_read", headers=headers)
+    assert unread() == 3
+
+    client.post("/notifications/mark_all_read", headers=headers)
+    assert unread() == 0
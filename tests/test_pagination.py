@@ -0,0 +1,108 @@
+from fastapi import status
+
+import model
+from app.core.pagination import paginate
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def collect_pages(client, url: str, limit: int):
+    pages = []
+    resp = client.get(url, params={"limit": limit})
+    assert resp.status_code == status.HTTP_200_OK
+    pages.append(resp.json())
+    while "X-Next-Cursor" in resp.headers:
+        resp = client.get(url, params={"limit": limit, "cursor": resp.headers["X-Next-Cursor"]})
+        assert resp.status_code == status.HTTP_200_OK
+        pages.append(resp.json())
+    return pages
+
+
+def test_cursor_pagination_for_posts_and_comments(client, db_session):
+    author = create_user(db_session, "cursor_author@example.com", "pass1")
+
+    posts = [model.Post(content=f"cursor post {i}", owner_id=author.id) for i in range(5)]
+    db_session.add_all(posts)
+    db_session.flush()
+    comments = [
+        model.Comment(content=f"cursor comment {i}", post_id=posts[0].id, owner_id=author.id)
+        for i in range(5)
+    ]
+    db_session.add_all(comments)
+    db_session.commit()
+    author_id, first_post_id = author.id, posts[0].id
+
+    pages = collect_pages(client, f"/posts/user/{author_id}", limit=2)
+    assert [len(p) for p in pages] == [2, 2, 1]
+    post_ids = [p["id"] for page in pages for p in page]
+    assert len(set(post_ids)) == 5
+    assert post_ids == sorted(post_ids, reverse=True)
+
+    # offset pagination keeps working alongside cursors
+    offset_resp = client.get(f"/posts/user/{author_id}", params={"limit": 2, "offset": 2})
+    assert [p["id"] for p in offset_resp.json()] == post_ids[2:4]
+
+    pages = collect_pages(client, f"/posts/{first_post_id}/comments", limit=2)
+    comment_ids = [c["id"] for page in pages for c in page]
+    assert len(comment_ids) == 5
+    assert comment_ids == sorted(comment_ids)
+
+
+def test_invalid_cursor_is_rejected(client):
+    resp = client.get("/posts/", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_listings_embed_only_latest_comments(client, db_session):
+    author = create_user(db_session, "preview_author@example.com", "pass1")
+    post = model.Post(content="busy post", owner_id=author.id, comments_count=5)
+    db_session.add(post)
+    db_session.flush()
+    comments = [
+        model.Comment(content=f"preview comment {i}", post_id=post.id, owner_id=author.id)
+        for i in range(5)
+    ]
+    db_session.add_all(comments)
+    db_session.commit()
+    post_id, comment_ids = post.id, [c.id for c in comments]
+
+    body = client.get(f"/posts/{post_id}").json()
+    assert body["comments_count"] == 5
+    assert [c["id"] for c in body["comments"]] == comment_ids[-3:]
+
+    body = client.get(f"/posts/{post_id}", params={"comments_limit": 1}).json()
+    assert [c["id"] for c in body["comments"]] == comment_ids[-1:]
+
+    body = client.get(f"/posts/{post_id}", params={"comments_limit": 0}).json()
+    assert body["comments"] == []
+
+
+def test_list_endpoints_reject_out_of_range_limits(client, db_session):
+    author = create_user(db_session, "limit_author@example.com", "pass1")
+    db_session.add(model.Post(content="limit post", owner_id=author.id))
+    db_session.commit()
+    url = f"/posts/user/{author.id}"
+
+    for params in ({"limit": 0}, {"limit": -1}, {"limit": 1_000_000}, {"offset": -1}):
+        assert client.get(url, params=params).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    resp = client.get(url, params={"limit": 1})
+    assert resp.status_code == status.HTTP_200_OK
+    assert len(resp.json()) == 1
+
+
+def test_paginate_returns_empty_page_for_non_positive_limit(db_session):
+    query = db_session.query(model.Post)
+    for limit in (0, -5):
+        assert paginate(query, model.Post.created_at, model.Post.id, limit) == ([], None)
@@ -0,0 +1,104 @@
+from fastapi import status
+from sqlalchemy import event
+
+import model
+from app.core.counters import reconcile_post_counters
+from database import SessionLocal
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def test_counters_follow_likes_and_comments(client, db_session):
+    owner = create_user(db_session, "counter_owner@example.com", "pass1")
+    fan = create_user(db_session, "counter_fan@example.com", "pass2")
+    owner_headers = {"Authorization": f"Bearer {get_token(client, owner.email, 'pass1')}"}
+    fan_headers = {"Authorization": f"Bearer {get_token(client, fan.email, 'pass2')}"}
+
+    post = client.post("/posts/", json={"content": "count me"}, headers=owner_headers).json()
+
+    client.post(f"/posts/{post['id']}/like", headers=fan_headers)
+    comment = client.post(
+        f"/posts/{post['id']}/comments",
+        json={"content": "first"},
+        headers=fan_headers,
+    ).json()
+    client.post(f"/posts/{post['id']}/comments", json={"content": "second"}, headers=owner_headers)
+
+    body = client.get(f"/posts/{post['id']}").json()
+    assert (body["likes_count"], body["comments_count"]) == (1, 2)
+
+    # unlike and delete a comment bring the counters back down
+    assert client.post(f"/posts/{post['id']}/like", headers=fan_headers).json() == {"status": "unliked"}
+    resp = client.delete(f"/posts/{post['id']}/comments/{comment['id']}", headers=fan_headers)
+    assert resp.status_code == status.HTTP_204_NO_CONTENT
+
+    body = client.get(f"/posts/{post['id']}").json()
+    assert (body["likes_count"], body["comments_count"]) == (0, 1)
+
+
+def test_reconcile_fixes_drifted_counters(db_session):
+    owner = create_user(db_session, "counter_drift@example.com", "pass1")
+    post = model.Post(content="drifted", owner_id=owner.id, likes_count=7, comments_count=0)
+    db_session.add(post)
+    db_session.flush()
+    db_session.add(model.Comment(content="uncounted", post_id=post.id, owner_id=owner.id))
+    db_session.commit()
+
+    assert reconcile_post_counters(db_session, batch_size=2) >= 1
+
+    db_session.refresh(post)
+    assert (post.likes_count, post.comments_count) == (0, 1)
+
+
+def test_concurrent_comment_deletes_decrement_once(client, db_session):
+    owner = create_user(db_session, "counter_race_owner@example.com", "pass1")
+    headers = {"Authorization": f"Bearer {get_token(client, owner.email, 'pass1')}"}
+    post = client.post("/posts/", json={"content": "race"}, headers=headers).json()
+    client.post(f"/posts/{post['id']}/comments", json={"content": "kept"}, headers=headers)
+    comment = client.post(
+        f"/posts/{post['id']}/comments", json={"content": "deleted twice"}, headers=headers
+    ).json()
+
+    # another request deletes the comment after this one has loaded it
+    raced = []
+
+    def delete_first(state):
+        if state.is_delete and not raced:
+            raced.append(True)
+            with SessionLocal() as other:
+                other.query(model.Comment).filter(model.Comment.id == comment["id"]).delete()
+                other.query(model.Post).filter(model.Post.id == post["id"]).update(
+                    {model.Post.comments_count: model.Post.comments_count - 1}
+                )
+                other.commit()
+
+    event.listen(SessionLocal, "do_orm_execute", delete_first)
+    try:
+        resp = client.delete(f"/posts/{post['id']}/comments/{comment['id']}", headers=headers)
+    finally:
+        event.remove(SessionLocal, "do_orm_execute", delete_first)
+    assert resp.status_code == status.HTTP_204_NO_CONTENT
+    assert raced
+    db_session.expire_all()
+    assert db_session.get(model.Post, post["id"]).comments_count == 1
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import model
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # listen on every engine: the listing endpoints use the async engine
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_post_listing_query_count_is_flat(client, db_session):
+    author = create_user(db_session, "querycount_author@example.com", "pass1")
+    fan = create_user(db_session, "querycount_fan@example.com", "pass2")
+
+    for i in range(10):
+        post = model.Post(content=f"post {i}", owner_id=author.id, likes_count=1, comments_count=1)
+        db_session.add(post)
+        db_session.flush()
+        db_session.add(model.Like(post_id=post.id, user_id=fan.id))
+        db_session.add(model.Comment(content=f"comment {i}", post_id=post.id, owner_id=fan.id))
+    db_session.commit()
+    author_id, author_email = author.id, author.email
+
+    with count_queries() as small_page:
+        resp = client.get(f"/posts/user/{author_id}?limit=2")
+    assert resp.status_code == status.HTTP_200_OK
+    assert len(resp.json()) == 2
+
+    with count_queries() as large_page:
+        resp = client.get(f"/posts/user/{author_id}?limit=10")
+    assert resp.status_code == status.HTTP_200_OK
+    posts = resp.json()
+    assert len(posts) == 10
+    assert all(p["likes_count"] == 1 and p["comments_count"] == 1 for p in posts)
+    assert all(p["owner_email"] == author_email for p in posts)
+
+    assert small_page
+    assert len(large_page) == len(small_page)
@@ -0,0 +1,135 @@
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event
+
+import follow_profile
+import messaging
+import model
+import notifications
+import post
+from app.core import retention
+from database import Base, engine
+from util import hash_password
+
+
+TABLES = set(Base.metadata.tables)
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@contextmanager
+def capture_statements():
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def sequential_scans(db, statement, parameters):
+    """Tables read with a full scan when statement runs with parameters."""
+    conn = db.connection()
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        # with seq scans disabled the planner only picks one when no index applies
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = "\n".join(row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters))
+        return {t for t in re.findall(r"Seq Scan on (\w+)", plan) if t in TABLES}
+    if dialect == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        details = [row[-1] for row in rows]
+        return {m.group(1) for d in details if (m := re.fullmatch(r"SCAN (\w+)", d)) and m.group(1) in TABLES}
+    pytest.skip(f"no plan check for dialect {dialect}")
+
+
+@pytest.fixture()
+def seeded(db_session):
+    author = create_user(db_session, "plans_author@example.com", "pass1")
+    reader = create_user(db_session, "plans_reader@example.com", "pass2")
+    db_session.add(model.Follow(follower_id=reader.id, following_id=author.id))
+    posts = [model.Post(content=f"plan post {i}", owner_id=author.id) for i in range(5)]
+    db_session.add_all(posts)
+    db_session.flush()
+    for p in posts:
+        db_session.add(model.TimelineEntry(user_id=reader.id, post_id=p.id, post_created_at=p.created_at))
+        db_session.add(model.Comment(content="plan comment", post_id=p.id, owner_id=reader.id))
+    conv = model.Conversation(user1_id=min(author.id, reader.id), user2_id=max(author.id, reader.id))
+    db_session.add(conv)
+    db_session.flush()
+    db_session.add(model.Message(conversation_id=conv.id, sender_id=author.id, content="x"))
+    db_session.add(model.Notification(user_id=reader.id, type="follow", message="plan"))
+    db_session.commit()
+    return {"author": author.id, "reader": reader.id, "post": posts[0].id, "conversation": conv.id}
+
+
+ROUTER_QUERIES = {
+    "posts": lambda db, ids: post._post_page(db, None, 20, 0, None, None),
+    "user_posts": lambda db, ids: post._post_page(db, ids["author"], 20, 0, None, None),
+    "feed": lambda db, ids: post._feed_page(db, ids["reader"], 20, 0, None, None),
+    "single_post": lambda db, ids: post._single_post(db, ids["post"], None),
+    "comments": lambda db, ids: post._comment_page(db, ids["post"], 20, 0, None),
+    "conversations": lambda db, ids: messaging._conversation_page(db, ids["reader"], 20, 0, None),
+    "messages": lambda db, ids: messaging._message_page(db, ids["conversation"], ids["reader"], 20, 0, None),
+    "notifications": lambda db, ids: notifications._notification_page(db, ids["reader"], 20, 0, None),
+    "profile": lambda db, ids: follow_profile._build_profile(db.get(model.user, ids["author"]), db),
+    "followers": lambda db, ids: follow_profile._follow_page(db, ids["author"], True, 20, 0, None),
+    "following": lambda db, ids: follow_profile._follow_page(db, ids["reader"], False, 20, 0, None),
+}
+
+
+@pytest.mark.parametrize("name", sorted(ROUTER_QUERIES))
+def test_router_queries_use_indexes(name, seeded, db_session):
+    with capture_statements() as captured:
+        ROUTER_QUERIES[name](db_session, seeded)
+    assert captured, f"{name} issued no queries"
+
+    for statement, parameters in captured:
+        scans = sequential_scans(db_session, statement, parameters)
+        assert not scans, f"{name}: sequential scan on {sorted(scans)} for\n{statement}"
+        db_session.rollback()
+
+
+def test_retention_finds_expired_rows_by_index(seeded, db_session):
+    cutoff = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    with capture_statements() as captured:
+        retention._delete_expired(
+            db_session,
+            model.Notification,
+            (model.Notification.is_read == True) & (model.Notification.updated_at < cutoff),
+            model.Notification.updated_at,
+            100,
+            0,
+        )
+        retention._delete_expired(
+            db_session,
+            model.Message,
+            (model.Message.is_read == True) & (model.Message.created_at < cutoff),
+            model.Message.created_at,
+            100,
+            0,
+        )
+    assert len(captured) == 2
+
+    for statement, parameters in captured:
+        scans = sequential_scans(db_session, statement, parameters)
+        assert not scans, f"retention: sequential scan on {sorted(scans)} for\n{statement}"
+        db_session.rollback()
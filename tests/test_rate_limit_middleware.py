@@ -0,0 +1,118 @@
+from fastapi import FastAPI, Request, status
+from fastapi.testclient import TestClient
+
+import model
+from app.core import rate_limiter
+from app.core.rate_limit_middleware import RateLimitMiddleware, RateLimitPolicy
+from app.core.rate_limiter import TokenBucketLimiter
+from app.core.security import create_access_token
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def make_client(policies):
+    bodies_read = []
+    app = FastAPI()
+    app.add_middleware(
+        RateLimitMiddleware, policies=policies, limiter=TokenBucketLimiter(sweep_interval=0)
+    )
+
+    @app.post("/items/{item_id}")
+    async def create_item(item_id: int, request: Request):
+        bodies_read.append(await request.body())
+        return {"id": item_id}
+
+    @app.get("/items")
+    def list_items():
+        return []
+
+    return TestClient(app), bodies_read
+
+
+def test_rejects_before_the_handler_reads_the_body():
+    client, bodies_read = make_client([RateLimitPolicy("items", "POST", "/items/{item_id}", 2, 60, ("ip",))])
+
+    first = client.post("/items/1", content=b"x")
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert client.post("/items/2", content=b"x").status_code == 200
+
+    rejected = client.post("/items/3", content=b"x" * 10000)
+    assert rejected.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert rejected.headers["Retry-After"] == "30"
+    assert rejected.headers["X-RateLimit-Remaining"] == "0"
+    assert bodies_read == [b"x", b"x"]
+
+    # routes without a policy are untouched
+    other = client.get("/items")
+    assert other.status_code == 200
+    assert "X-RateLimit-Limit" not in other.headers
+
+
+def test_user_policies_key_on_the_token_and_fall_back_to_the_ip():
+    client, _ = make_client([RateLimitPolicy("items", "POST", "/items/{item_id}", 1, 60, ("user",))])
+    alice = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+    bob = {"Authorization": f"Bearer {create_access_token({'user_id': 2})}"}
+
+    assert client.post("/items/1", headers=alice).status_code == 200
+    assert client.post("/items/1", headers=alice).status_code == 429
+    assert client.post("/items/1", headers=bob).status_code == 200
+    # a forged token is not trusted; the request is limited as anonymous, by IP
+    assert client.post("/items/1", headers={"Authorization": "Bearer forged"}).status_code == 200
+    assert client.post("/items/1").status_code == 429
+
+
+def test_rejection_by_one_policy_refunds_the_others():
+    client, bodies_read = make_client(
+        [
+            RateLimitPolicy("items_ip", "POST", "/items/{item_id}", 3, 60, ("ip",)),
+            RateLimitPolicy("items_user", "POST", "/items/{item_id}", 1, 60, ("user",)),
+        ]
+    )
+    alice = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+    bob = {"Authorization": f"Bearer {create_access_token({'user_id': 2})}"}
+
+    assert client.post("/items/1", headers=alice).status_code == 200
+    # alice's own bucket is empty; her rejected calls must not drain the shared IP bucket
+    for _ in range(5):
+        assert client.post("/items/1", headers=alice).status_code == 429
+    resp = client.post("/items/1", headers=bob)
+    assert resp.status_code == 200
+    assert resp.headers["X-RateLimit-Remaining"] == "0"
+    assert len(bodies_read) == 2
+
+
+def test_app_limits_likes_per_user(client, db_session, monkeypatch):
+    # a frozen clock, so no token is refilled during the loop
+    monkeypatch.setattr(rate_limiter, "limiter", TokenBucketLimiter(sweep_interval=0, clock=lambda: 1000.0))
+    user = create_user(db_session, "mw_liker@example.com", "pass1")
+    token = get_token(client, user.email, "pass1")
+    headers = {"Authorization": f"Bearer {token}"}
+    post = client.post("/posts/", json={"content": "limited"}, headers=headers).json()
+
+    statuses = [client.post(f"/posts/{post['id']}/like", headers=headers).status_code for _ in range(121)]
+
+    assert statuses[:120] == [status.HTTP_200_OK] * 120
+    assert statuses[120] == status.HTTP_429_TOO_MANY_REQUESTS
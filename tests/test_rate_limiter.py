@@ -0,0 +1,170 @@
+import multiprocessing
+import sys
+import threading
+from collections import Counter
+from functools import partial
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import model
+from app.core import rate_limiter
+from app.core.rate_limiter import MemoryBackend, SharedMemoryBackend, SqlBackend, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills_gradually():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(sweep_interval=0, clock=clock)
+
+    results = [limiter.hit("alice", "login", 5, 60) for _ in range(5)]
+    assert all(r.allowed for r in results)
+    assert [r.remaining for r in results] == [4, 3, 2, 1, 0]
+
+    denied = limiter.hit("alice", "login", 5, 60)
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(12)
+    # other identifiers and endpoints have their own buckets
+    assert limiter.hit("bob", "login", 5, 60).allowed
+    assert limiter.hit("alice", "create_post", 5, 60).allowed
+
+    clock.now += 12
+    assert limiter.hit("alice", "login", 5, 60).allowed
+    assert not limiter.hit("alice", "login", 5, 60).allowed
+
+
+def test_idle_keys_are_swept_and_key_count_is_capped():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(MemoryBackend(max_keys=100), sweep_interval=0, clock=clock)
+
+    for i in range(1000):
+        limiter.hit(f"user{i}", "login", 5, 60)
+    assert len(limiter) <= 100
+
+    clock.now += 60
+    assert limiter.sweep() > 0
+    assert len(limiter) == 0
+    # a swept key starts again with a full bucket
+    assert limiter.hit("user999", "login", 5, 60).remaining == 4
+
+
+def test_check_rate_limit_raises_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "limiter", TokenBucketLimiter(sweep_interval=0))
+
+    assert rate_limiter.check_rate_limit("carol", "comment", 2, 60).remaining == 1
+    rate_limiter.rate_limiter.check_rate_limit("carol", "comment", 2, 60)
+    with pytest.raises(HTTPException) as exc_info:
+        rate_limiter.check_rate_limit("carol", "comment", 2, 60)
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) == 30
+
+
+@pytest.mark.parametrize("backend", ["memory", "shm"])
+def test_concurrent_threads_are_admitted_exactly_up_to_the_limit(backend, tmp_path):
+    if backend == "memory":
+        store = MemoryBackend()
+    else:
+        store = SharedMemoryBackend(str(tmp_path / "rate-limits"), 4096)
+    # a frozen clock: no token is refilled while the threads race
+    limiter = TokenBucketLimiter(store, sweep_interval=0, clock=FakeClock())
+    keys = [f"user{i}" for i in range(32)]
+    start = threading.Barrier(64)
+    admitted = Counter()
+    admitted_lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        mine = Counter()
+        start.wait()
+        for i in range(2000):
+            # every thread hammers the shared hot key and a spread of keys over all stripes
+            key = "hot" if i % 2 else keys[(n + i) % len(keys)]
+            if limiter.hit(key, "create_post", 1000, 60).allowed:
+                mine[key] += 1
+        with admitted_lock:
+            admitted.update(mine)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(64)]
+    switch_interval = sys.getswitchinterval()
+    # switch threads as often as possible so unguarded read-modify-writes interleave
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert admitted["hot"] == 1000
+    assert all(admitted[key] == 1000 for key in keys)
+
+
+def sql_backend(url: str) -> SqlBackend:
+    engine = create_engine(url, connect_args={"timeout": 30})
+    model.RateLimit.__table__.create(bind=engine, checkfirst=True)
+    return SqlBackend(sessionmaker(bind=engine))
+
+
+def take_tokens(make_backend, calls: int, start, admitted) -> None:
+    limiter = TokenBucketLimiter(make_backend(), sweep_interval=0)
+    start.wait()
+    admitted.put(sum(limiter.hit("mallory", "login", 25, 3600).allowed for _ in range(calls)))
+
+
+def admitted_across_processes(make_backend, processes: int = 4, calls: int = 20) -> int:
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    admitted = ctx.Queue()
+    workers = [
+        ctx.Process(target=take_tokens, args=(make_backend, calls, start, admitted)) for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    start.set()
+    counts = [admitted.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join(10)
+    return sum(counts)
+
+
+@pytest.mark.parametrize("backend", ["shm", "sql"])
+def test_shared_backends_enforce_one_limit_across_processes(backend, tmp_path):
+    if backend == "shm":
+        make_backend = partial(SharedMemoryBackend, str(tmp_path / "rate-limits"), 1024)
+    else:
+        make_backend = partial(sql_backend, f"sqlite:///{tmp_path / 'rate-limits.db'}")
+        make_backend()  # create the table before the workers race for it
+
+    # 80 attempts from 4 workers against one bucket of 25
+    assert admitted_across_processes(make_backend) == 25
+
+    limiter = TokenBucketLimiter(make_backend(), sweep_interval=0)
+    assert not limiter.hit("mallory", "login", 25, 3600).allowed
+    assert limiter.hit("someone-else", "login", 25, 3600).remaining == 24
+
+
+@pytest.mark.parametrize("backend", ["memory", "shm", "sql"])
+def test_refund_gives_back_one_token(backend, tmp_path):
+    store = {
+        "memory": MemoryBackend,
+        "shm": partial(SharedMemoryBackend, str(tmp_path / "rate-limits"), 1024),
+        "sql": partial(sql_backend, f"sqlite:///{tmp_path / 'rate-limits.db'}"),
+    }[backend]()
+    limiter = TokenBucketLimiter(store, sweep_interval=0, clock=FakeClock())
+
+    assert [limiter.hit("alice", "login", 2, 60).allowed for _ in range(3)] == [True, True, False]
+    limiter.refund("alice", "login", 2, 60)
+    assert limiter.hit("alice", "login", 2, 60).allowed
+    assert not limiter.hit("alice", "login", 2, 60).allowed
+    # refunding a key that was never hit is a no-op
+    limiter.refund("bob", "login", 2, 60)
+    assert limiter.hit("bob", "login", 2, 60).remaining == 1
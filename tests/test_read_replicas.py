@@ -0,0 +1,76 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import model
+from app.core import replicas
+from app.core.replicas import ReplicaRouter, get_read_db
+from database import SessionLocal, get_db
+
+
+def make_database(path, marker: str) -> str:
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    model.TextData.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(model.TextData.__table__.insert(), {"text": marker})
+    engine.dispose()
+    return url
+
+
+def read_marker(db) -> str:
+    return db.query(model.TextData.text).scalar()
+
+
+def build_router(tmp_path) -> ReplicaRouter:
+    primary = create_engine(make_database(tmp_path / "primary.db", "primary"))
+    replica_urls = [
+        make_database(tmp_path / "replica1.db", "replica1"),
+        make_database(tmp_path / "replica2.db", "replica2"),
+    ]
+    return ReplicaRouter(primary, None, replica_urls)
+
+
+def test_reads_are_balanced_across_replicas(tmp_path):
+    router = build_router(tmp_path)
+
+    markers = []
+    for _ in range(4):
+        db = SessionLocal(bind=router.read_engine())
+        markers.append(read_marker(db))
+        db.close()
+
+    assert set(markers) == {"replica1", "replica2"}
+    assert markers[0] != markers[1] and markers[0] == markers[2]
+
+
+def test_a_write_sends_the_clients_reads_to_the_primary_on_every_worker(tmp_path, monkeypatch):
+    # the real dependencies; the app under test overrides them in conftest
+    api = FastAPI()
+
+    @api.post("/write")
+    def write(db: Session = Depends(get_db)):
+        db.add(model.TextData(text="written"))
+        db.commit()
+        return {}
+
+    @api.get("/read")
+    def read(db: Session = Depends(get_read_db)):
+        return {"marker": read_marker(db)}
+
+    monkeypatch.setattr(replicas, "replica_router", build_router(tmp_path))
+    writer, other_client = TestClient(api), TestClient(api)
+    assert writer.get("/read").json()["marker"].startswith("replica")
+
+    resp = writer.post("/write")
+    assert replicas.LAST_WRITE_COOKIE in resp.cookies
+    # another worker has its own router but sees the same cookie
+    (tmp_path / "worker2").mkdir()
+    monkeypatch.setattr(replicas, "replica_router", build_router(tmp_path / "worker2"))
+    assert writer.get("/read").json()["marker"] == "primary"
+    assert other_client.get("/read").json()["marker"].startswith("replica")
+
+    # once the window has passed the writer is load balanced again
+    monkeypatch.setattr(replicas, "READ_YOUR_WRITES_SECONDS", 0)
+    assert writer.get("/read").json()["marker"].startswith("replica")
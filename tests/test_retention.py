@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main as root_main
+import model
+from app import main as app_main
+from app.core import retention
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def test_retention_prunes_old_read_rows_and_caps_per_user(db_session, monkeypatch):
+    monkeypatch.setattr(retention, "NOTIFICATION_RETENTION_READ_DAYS", 30)
+    monkeypatch.setattr(retention, "NOTIFICATION_RETENTION_MAX_PER_USER", 3)
+    monkeypatch.setattr(retention, "MESSAGE_RETENTION_READ_DAYS", 30)
+    a = create_user(db_session, "retention_a@example.com", "pass1")
+    b = create_user(db_session, "retention_b@example.com", "pass2")
+    a_id, b_id = a.id, b.id
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=60)
+
+    def notification(user_id, at, is_read):
+        return model.Notification(
+            user_id=user_id, type="follow", message="x", created_at=at, updated_at=at, is_read=is_read
+        )
+
+    db_session.add_all(
+        [
+            notification(a_id, old, True),  # expired
+            notification(a_id, old, False),  # old but unread: kept
+            notification(a_id, now, True),  # recent: kept
+        ]
+        + [notification(b_id, now - timedelta(minutes=i), False) for i in range(5)]  # 2 over the cap
+    )
+    conv = model.Conversation(user1_id=min(a_id, b_id), user2_id=max(a_id, b_id))
+    db_session.add(conv)
+    db_session.flush()
+    db_session.add_all(
+        [
+            model.Message(conversation_id=conv.id, sender_id=a_id, content="old", created_at=old, is_read=True),
+            model.Message(conversation_id=conv.id, sender_id=a_id, content="unread", created_at=old, is_read=False),
+        ]
+    )
+    db_session.commit()
+    conv_id = conv.id
+
+    report = retention.run_retention(db_session, batch_size=2, pause=0)
+
+    assert report["notifications_read_expired"] >= 1
+    assert report["notifications_over_cap"] >= 2
+    assert report["messages_read_expired"] >= 1
+    assert report["seconds"] >= 0
+    assert db_session.query(model.Notification).filter(model.Notification.user_id == a_id).count() == 2
+    kept_b = [
+        at
+        for (at,) in db_session.query(model.Notification.updated_at)
+        .filter(model.Notification.user_id == b_id)
+        .order_by(model.Notification.updated_at.desc())
+    ]
+    assert len(kept_b) == 3
+    remaining = [m for (m,) in db_session.query(model.Message.content).filter(model.Message.conversation_id == conv_id)]
+    assert remaining == ["unread"]
+
+
+class RecordingJob:
+    def __init__(self, calls, name):
+        self.calls, self.name = calls, name
+
+    def start(self):
+        self.calls.append(f"{self.name}.start")
+
+    def stop(self):
+        self.calls.append(f"{self.name}.stop")
+
+
+@pytest.mark.parametrize("module", [app_main, root_main])
+def test_lifespan_starts_retention_and_drains_notifications_on_shutdown(module, monkeypatch):
+    calls = []
+    monkeypatch.setattr(module, "retention_job", RecordingJob(calls, "retention"))
+    monkeypatch.setattr(module, "notification_writer", RecordingJob(calls, "writer"))
+
+    with TestClient(module.app):
+        assert calls == ["retention.start"]
+    assert calls == ["retention.start", "retention.stop", "writer.stop"]
@@ -0,0 +1,85 @@
+from fastapi import status
+
+import model
+from app.core.social_graph import SocialGraph, social_graph
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def test_graph_loads_lazily_and_tracks_toggle_follow(client, db_session):
+    a = create_user(db_session, "graph_a@example.com", "pass1")
+    b = create_user(db_session, "graph_b@example.com", "pass2")
+    c = create_user(db_session, "graph_c@example.com", "pass3")
+    a_id, b_id, c_id = a.id, b.id, c.id
+    db_session.add(model.Follow(follower_id=a_id, following_id=c_id))
+    db_session.add(model.Follow(follower_id=b_id, following_id=a_id))
+    db_session.commit()
+
+    assert list(social_graph.following_ids(db_session, a_id)) == [c_id]
+    assert social_graph.follows(db_session, b_id, a_id)
+    assert not social_graph.is_mutual(db_session, a_id, b_id)
+
+    token_a = get_token(client, a.email, "pass1")
+    resp = client.post(f"/follow/{b_id}", headers={"Authorization": f"Bearer {token_a}"})
+    assert resp.json()["status"] == "followed"
+    # answered from the updated cache, the session is never touched
+    assert social_graph.is_mutual(None, a_id, b_id)
+    assert list(social_graph.following_ids(None, a_id)) == sorted([b_id, c_id])
+
+    resp = client.post(f"/follow/{b_id}", headers={"Authorization": f"Bearer {token_a}"})
+    assert resp.json()["status"] == "unfollowed"
+    assert not social_graph.follows(None, a_id, b_id)
+
+
+def test_graph_evicts_least_recently_used_users(db_session):
+    graph = SocialGraph(max_users=2, ttl=60)
+    for user_id in (1, 2, 3):
+        graph.following_ids(db_session, user_id)
+    graph.following_ids(db_session, 2)
+    assert len(graph) == 2
+    assert graph._cached(1) is None
+    assert graph._cached(2) is not None and graph._cached(3) is not None
+
+
+def test_conversations_check_follows_in_the_database(client, db_session):
+    a = create_user(db_session, "graph_mutual_a@example.com", "pass1")
+    b = create_user(db_session, "graph_mutual_b@example.com", "pass2")
+    a_id, b_id = a.id, b.id
+    db_session.add_all(
+        [
+            model.Follow(follower_id=a_id, following_id=b_id),
+            model.Follow(follower_id=b_id, following_id=a_id),
+        ]
+    )
+    db_session.commit()
+    assert social_graph.is_mutual(db_session, a_id, b_id)
+
+    # b unfollows through another worker; this worker's cached graph still says mutual
+    db_session.query(model.Follow).filter(model.Follow.follower_id == b_id).delete()
+    db_session.commit()
+    assert social_graph.is_mutual(None, a_id, b_id)
+
+    token_a = get_token(client, a.email, "pass1")
+    resp = client.post(f"/conversations/{b_id}", headers={"Authorization": f"Bearer {token_a}"})
+    assert resp.status_code == status.HTTP_403_FORBIDDEN
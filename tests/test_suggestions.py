@@ -0,0 +1,136 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+
+import main as root_main
+import model
+from app.core import suggestions
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def test_suggestions_rank_by_mutuals_and_follow_changes_apply(client, db_session):
+    names = ["me", "f1", "f2", "c1", "c2", "fan"]
+    users = {n: create_user(db_session, f"suggest_{n}@example.com", "pass") for n in names}
+    ids = {n: u.id for n, u in users.items()}
+    for follower, followee in [
+        ("me", "f1"), ("me", "f2"), ("f1", "c1"), ("f2", "c1"),
+        ("f1", "c2"), ("f1", "me"), ("fan", "me"),
+    ]:
+        db_session.add(model.Follow(follower_id=ids[follower], following_id=ids[followee]))
+    db_session.commit()
+
+    token_me = get_token(client, users["me"].email, "pass")
+    token_fan = get_token(client, users["fan"].email, "pass")
+    me_headers = {"Authorization": f"Bearer {token_me}"}
+    fan_headers = {"Authorization": f"Bearer {token_fan}"}
+
+    resp = client.get("/suggestions", headers=me_headers)
+    assert resp.status_code == status.HTTP_200_OK
+    assert [(s["user"]["id"], s["mutual_count"]) for s in resp.json()] == [
+        (ids["c1"], 2),
+        (ids["c2"], 1),
+    ]
+    fan_before = {s["user"]["id"]: s["mutual_count"] for s in client.get("/suggestions", headers=fan_headers).json()}
+    assert ids["c2"] not in fan_before
+
+    # following c2 drops it from my list and makes it a friend-of-friend for my followers
+    client.post(f"/follow/{ids['c2']}", headers=me_headers)
+    mine = [s["user"]["id"] for s in client.get("/suggestions", headers=me_headers).json()]
+    assert mine == [ids["c1"]]
+    fan_after = {s["user"]["id"]: s["mutual_count"] for s in client.get("/suggestions", headers=fan_headers).json()}
+    assert fan_after[ids["c2"]] == 1
+
+    client.post(f"/follow/{ids['c2']}", headers=me_headers)
+    fan_final = {s["user"]["id"]: s["mutual_count"] for s in client.get("/suggestions", headers=fan_headers).json()}
+    assert ids["c2"] not in fan_final
+
+    # the batch job agrees with the per-user SQL ranking
+    adjacency = suggestions.load_adjacency(db_session)
+    assert suggestions.rank_candidates(adjacency, ids["me"], 10) == [(ids["c1"], 2), (ids["c2"], 1)]
+
+
+def test_empty_suggestions_are_not_recomputed_on_every_read(client, db_session, monkeypatch):
+    loner = create_user(db_session, "suggest_loner@example.com", "pass")
+    headers = {"Authorization": f"Bearer {get_token(client, loner.email, 'pass')}"}
+    refreshed = []
+    refresh_user = suggestions.refresh_user
+    monkeypatch.setattr(
+        suggestions, "refresh_user", lambda db, user_id: refreshed.append(user_id) or refresh_user(db, user_id)
+    )
+
+    for _ in range(3):
+        resp = client.get("/suggestions", headers=headers)
+        assert resp.status_code == status.HTTP_200_OK
+        assert resp.json() == []
+    assert refreshed == [loner.id]
+
+
+def test_follow_change_counts_candidates_left_out_by_the_cutoff(client, db_session, monkeypatch):
+    monkeypatch.setattr(suggestions, "SUGGESTIONS_PER_USER", 1)
+    names = ["u", "a", "b", "top", "t"]
+    users = {n: create_user(db_session, f"cutoff_{n}@example.com", "pass") for n in names}
+    ids = {n: u.id for n, u in users.items()}
+    for follower, followee in [("u", "a"), ("u", "b"), ("a", "top"), ("b", "top"), ("a", "t")]:
+        db_session.add(model.Follow(follower_id=ids[follower], following_id=ids[followee]))
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {get_token(client, users['u'].email, 'pass')}"}
+    # t (1 mutual) is below u's cutoff of one stored suggestion
+    assert [s["user"]["id"] for s in client.get("/suggestions", headers=headers).json()] == [ids["top"]]
+
+    def follow(follower, followee):
+        db_session.add(model.Follow(follower_id=ids[follower], following_id=ids[followee]))
+        db_session.commit()
+        suggestions.apply_follow_change(ids[follower], ids[followee], True)
+
+    # u's list is full, so it cannot take t and is recomputed on the next read instead
+    follow("b", "t")
+    db_session.expire_all()
+    assert db_session.get(model.user, ids["u"]).suggestions_computed_at is None
+    resp = client.get("/suggestions?limit=5", headers=headers).json()
+    assert len(resp) == 1 and resp[0]["mutual_count"] == 2
+
+    # with room in the list, a missing candidate is stored with its full count, not 1
+    monkeypatch.setattr(suggestions, "SUGGESTIONS_PER_USER", 5)
+    ids["c"] = create_user(db_session, "cutoff_c@example.com", "pass").id
+    # a follows c without the delta being applied, so u's list does not have it yet
+    db_session.add(model.Follow(follower_id=ids["a"], following_id=ids["c"]))
+    db_session.commit()
+    follow("b", "c")
+    stored = dict(
+        db_session.query(model.Suggestion.suggested_id, model.Suggestion.mutual_count)
+        .filter(model.Suggestion.user_id == ids["u"])
+        .all()
+    )
+    assert stored[ids["c"]] == 2
+
+
+def test_suggestion_limit_is_bounded_and_served_by_both_apps(client, db_session):
+    user = create_user(db_session, "suggest_bounds@example.com", "pass")
+    headers = {"Authorization": f"Bearer {get_token(client, user.email, 'pass')}"}
+
+    for limit in (0, -1, 1_000_000):
+        resp = client.get("/suggestions", params={"limit": limit}, headers=headers)
+        assert resp.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.get("/suggestions", params={"limit": 5}, headers=headers).status_code == 200
+    assert TestClient(root_main.app).get("/suggestions", headers=headers).status_code == 200
@@ -0,0 +1,190 @@
+from fastapi import status
+
+import model
+from app.core import counters, timeline
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+def test_timeline_backfill_fan_out_and_unfollow(client, db_session, monkeypatch):
+    reader = create_user(db_session, "timeline_reader@example.com", "pass1")
+    author = create_user(db_session, "timeline_author@example.com", "pass2")
+    reader_id, author_id = reader.id, author.id
+
+    old_post = model.Post(content="posted before the follow", owner_id=author_id)
+    db_session.add(old_post)
+    db_session.commit()
+    old_post_id = old_post.id
+
+    token_reader = get_token(client, reader.email, "pass1")
+    token_author = get_token(client, author.email, "pass2")
+    reader_headers = {"Authorization": f"Bearer {token_reader}"}
+
+    # following backfills the author's existing posts
+    resp = client.post(f"/follow/{author_id}", headers=reader_headers)
+    assert resp.json()["status"] == "followed"
+    feed = client.get("/posts/feed", headers=reader_headers).json()
+    assert [p["id"] for p in feed] == [old_post_id]
+
+    # new posts are fanned out to followers, keeping only the newest entries
+    monkeypatch.setattr(timeline, "TIMELINE_MAX_LENGTH", 3)
+    new_ids = []
+    for i in range(3):
+        resp = client.post(
+            "/posts/",
+            json={"content": f"fan out {i}"},
+            headers={"Authorization": f"Bearer {token_author}"},
+        )
+        assert resp.status_code == status.HTTP_201_CREATED
+        new_ids.append(resp.json()["id"])
+
+    # fan-out only appends; the periodic trim cuts the timeline back to the cap
+    timeline_length = db_session.query(model.TimelineEntry).filter(model.TimelineEntry.user_id == reader_id).count
+    assert timeline_length() == 4
+    timeline.trim_timelines(db_session)
+    assert timeline_length() == 3
+    feed = client.get("/posts/feed", headers=reader_headers).json()
+    assert [p["id"] for p in feed] == list(reversed(new_ids))
+
+    # unfollowing removes the author's posts from the timeline
+    resp = client.post(f"/follow/{author_id}", headers=reader_headers)
+    assert resp.json()["status"] == "unfollowed"
+    assert client.get("/posts/feed", headers=reader_headers).json() == []
+
+
+def test_hybrid_feed_pulls_celebrity_posts(client, db_session, monkeypatch):
+    reader = create_user(db_session, "hybrid_reader@example.com", "pass1")
+    fan = create_user(db_session, "hybrid_fan@example.com", "pass2")
+    celebrity = create_user(db_session, "hybrid_celebrity@example.com", "pass3")
+    regular = create_user(db_session, "hybrid_regular@example.com", "pass4")
+    reader_id, celebrity_id, regular_id = reader.id, celebrity.id, regular.id
+
+    db_session.add_all(
+        [
+            model.Follow(follower_id=reader_id, following_id=celebrity_id),
+            model.Follow(follower_id=fan.id, following_id=celebrity_id),
+            model.Follow(follower_id=reader_id, following_id=regular_id),
+        ]
+    )
+    db_session.commit()
+
+    # two followers make an author a celebrity; the rows above bypassed toggle_follow
+    monkeypatch.setattr(timeline, "FEED_CELEBRITY_FOLLOWER_THRESHOLD", 2)
+    counters.reconcile_follower_counts(db_session)
+
+    token_reader = get_token(client, reader.email, "pass1")
+    token_celebrity = get_token(client, celebrity.email, "pass3")
+    token_regular = get_token(client, regular.email, "pass4")
+
+    created = []
+    for token in (token_regular, token_celebrity, token_regular, token_celebrity):
+        resp = client.post(
+            "/posts/",
+            json={"content": "hybrid"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert resp.status_code == status.HTTP_201_CREATED
+        created.append(resp.json())
+
+    # only the regular author's posts were pushed
+    pushed = {
+        post_id
+        for (post_id,) in db_session.query(model.TimelineEntry.post_id).filter(
+            model.TimelineEntry.user_id == reader_id
+        )
+    }
+    assert pushed == {p["id"] for p in created if p["owner_id"] == regular_id}
+
+    # the feed merges pushed and pulled posts newest first, across cursor pages
+    headers = {"Authorization": f"Bearer {token_reader}"}
+    first = client.get("/posts/feed", params={"limit": 3}, headers=headers)
+    second = client.get(
+        "/posts/feed",
+        params={"limit": 3, "cursor": first.headers["X-Next-Cursor"]},
+        headers=headers,
+    )
+    assert "X-Next-Cursor" not in second.headers
+    feed_ids = [p["id"] for p in first.json() + second.json()]
+    assert feed_ids == [p["id"] for p in reversed(created)]
+
+    # once the fan unfollows, the celebrity's posts are pushed to the reader instead
+    token_fan = get_token(client, fan.email, "pass2")
+    resp = client.post(f"/follow/{celebrity_id}", headers={"Authorization": f"Bearer {token_fan}"})
+    assert resp.json()["status"] == "unfollowed"
+    pushed = {
+        post_id
+        for (post_id,) in db_session.query(model.TimelineEntry.post_id).filter(
+            model.TimelineEntry.user_id == reader_id
+        )
+    }
+    assert pushed == {p["id"] for p in created}
+    feed = client.get("/posts/feed", headers=headers).json()
+    assert [p["id"] for p in feed] == [p["id"] for p in reversed(created)]
+
+
+def test_fan_out_skips_followers_backfilled_in_the_meantime(client, db_session):
+    author = create_user(db_session, "race_author@example.com", "pass1")
+    early = create_user(db_session, "race_early_follower@example.com", "pass2")
+    late = create_user(db_session, "race_late_follower@example.com", "pass3")
+    author_id, early_id, late_id = author.id, early.id, late.id
+    db_session.add(model.Follow(follower_id=early_id, following_id=author_id))
+    # committed, but its fan-out task has not run yet
+    post = model.Post(content="raced", owner_id=author_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+
+    # following now backfills the post into the late follower's timeline
+    token_late = get_token(client, late.email, "pass3")
+    resp = client.post(f"/follow/{author_id}", headers={"Authorization": f"Bearer {token_late}"})
+    assert resp.json()["status"] == "followed"
+
+    timeline.fan_out_post(post_id)
+
+    entries = sorted(
+        user_id
+        for (user_id,) in db_session.query(model.TimelineEntry.user_id).filter(
+            model.TimelineEntry.post_id == post_id
+        )
+    )
+    assert entries == sorted([early_id, late_id])
+
+
+def test_rebuild_fills_timelines_of_followers_from_before_the_migration(client, db_session):
+    author = create_user(db_session, "premigration_author@example.com", "pass1")
+    reader = create_user(db_session, "premigration_reader@example.com", "pass2")
+    author_id, reader_id = author.id, reader.id
+    # written directly, as rows that predate the timeline table would be
+    db_session.add(model.Follow(follower_id=reader_id, following_id=author_id))
+    post = model.Post(content="from before the migration", owner_id=author_id)
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+
+    headers = {"Authorization": f"Bearer {get_token(client, reader.email, 'pass2')}"}
+    assert client.get("/posts/feed", headers=headers).json() == []
+
+    assert timeline.rebuild_timelines(db_session) >= 1
+    assert [p["id"] for p in client.get("/posts/feed", headers=headers).json()] == [post_id]
+    assert timeline.read_feed(db_session, reader_id, limit=0) == ([], None)
@@ -0,0 +1,98 @@
+import time
+from contextlib import contextmanager
+
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import model
+from app.core import security
+from app.core.security import VerifiedTokenCache
+from util import hash_password
+
+
+def create_user(db, email: str, password: str):
+    existing = db.query(model.user).filter(model.user.email == email).first()
+    if existing:
+        db.delete(existing)
+        db.commit()
+    user = model.user(email=email, password=hash_password(password))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def get_token(client, email: str, password: str) -> str:
+    resp = client.post(
+        "/login",
+        data={"username": email, "password": password},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    assert resp.status_code == status.HTTP_200_OK
+    return resp.json()["access_token"]
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_token_signature_is_verified_once(client, db_session, monkeypatch):
+    user = create_user(db_session, "cache_token@example.com", "pass1")
+    token = get_token(client, user.email, "pass1")
+    security.verified_tokens.clear()
+    decoded = []
+    decode = security.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decoded.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", counting_decode)
+    for _ in range(3):
+        resp = client.get("/profile/me", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == status.HTTP_200_OK
+
+    assert decoded == [token]
+    # a tampered token is still rejected
+    resp = client.get("/profile/me", headers={"Authorization": f"Bearer {token}x"})
+    assert resp.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_verified_tokens_expire_at_exp():
+    cache = VerifiedTokenCache(max_tokens=2)
+    cache.put("expired", "1", time.time() - 1)
+    cache.put("a", "2", time.time() + 60)
+    cache.put("b", "3", time.time() + 60)
+    cache.put("c", "4", time.time() + 60)
+
+    assert cache.get("expired") is None
+    assert cache.get("a") is None  # evicted, least recently used
+    assert cache.get("c") == "4"
+
+
+def test_user_row_is_cached_until_the_user_changes(client, db_session):
+    user = create_user(db_session, "cache_profile@example.com", "pass1")
+    token = get_token(client, user.email, "pass1")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/profile/me", headers=headers).json()["user"]["email"] == "cache_profile@example.com"
+    with count_queries() as statements:
+        resp = client.get("/profile/me", headers=headers)
+    assert resp.json()["user"]["email"] == "cache_profile@example.com"
+    assert not any("FROM users" in statement for statement in statements)
+
+    user.email = "cache_profile_renamed@example.com"
+    db_session.commit()
+
+    assert client.get("/profile/me", headers=headers).json()["user"]["email"] == "cache_profile_renamed@example.com"